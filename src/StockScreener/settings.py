@@ -38,12 +38,15 @@ PREREQ_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'rest_framework',
 ]
 
 PROJECT_APPS = [
-    'common',
+    'api',
+    'common.apps.CommonConfig',
     'currency',
-    'stock',
+    'screener',
+    'stock.apps.StockConfig',
     'yahoo',
 ]
 
@@ -85,10 +88,66 @@ DB_FILE = os.path.join(BASE_DIR, 'tmp', 'db.sqlite3')
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': DB_FILE
+        'NAME': DB_FILE,
+        'OPTIONS': {
+            # Number of seconds to wait for a lock held by another connection, before failing with 'database is locked'
+            'timeout': 30,
+        },
     }
 }
 
+# Pragmas that are set on every new SQLite connection, see common.db.configure_sqlite. In WAL mode, readers like the
+# admin do not block writers and are not blocked by them, so the admin stays usable during imports. With
+# synchronous = NORMAL, commits do not wait for an fsync, a power loss may only lose the last commits. The page cache
+# (negative is in KiB) and memory-mapped I/O are larger than the defaults of 2 MB and none.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 ** 2,
+    'temp_store': 'MEMORY',
+}
+
+# URL of the Yahoo Finance API. To work offline or to benchmark the imports, run a local stand-in server with the
+# run_yahoo_standin command and set the environment variable YAHOO_BASE_URL to its URL.
+YAHOO_BASE_URL = os.environ.get('YAHOO_BASE_URL', 'https://query1.finance.yahoo.com')
+
+# Cache for latest prices, exchange rates and price histories, see common.cache. Cached values are invalidated by
+# every import of new data instead of a timeout. The local memory cache is per process and evicts the least recently
+# used values. To share the cache between processes, use e.g.
+# 'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': os.path.join(BASE_DIR, 'tmp', 'cache')
+# or any Redis/Memcached backend.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'stock-screener',
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
+# Directory of the columnar copy of all stock prices that is used for analytics, see stock.price_store. The copy is
+# updated by every import of stock prices. Optional, default = None (disabled). For instance:
+# PRICE_STORE_DIR = os.path.join(BASE_DIR, 'tmp', 'prices')
+PRICE_STORE_DIR = None
+
+# Directory of the on-disk cache of responses of external APIs, see common.http_cache. How long a response is fresh
+# is configured per service and endpoint, see BaseService.cache_max_age. Optional, default = None (disabled). With
+# HTTP_CACHE_MODE = 'replay' only cached responses are used, regardless of their age, and no calls are made at all.
+HTTP_CACHE_DIR = os.environ.get('HTTP_CACHE_DIR')
+HTTP_CACHE_MAX_SIZE = int(os.environ.get('HTTP_CACHE_MAX_SIZE', 1024 ** 3))
+HTTP_CACHE_MODE = os.environ.get('HTTP_CACHE_MODE', 'on')
+
+# The API is only available to logged in users, like the admin it replaces. Log in via the admin, or send the
+# credentials with HTTP Basic authentication.
+REST_FRAMEWORK = {
+    'DEFAULT_PERMISSION_CLASSES': [
+        'rest_framework.permissions.IsAuthenticated',
+    ],
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/2.0/ref/settings/#auth-password-validators
 AUTH_PASSWORD_VALIDATORS = []
@@ -0,0 +1,54 @@
+from rest_framework import serializers
+
+from common.fields import FixedPointField
+from stock.models import LatestStockPrice, Stock, StockPrice
+
+
+class FieldSelectionMixin:
+    """
+    Serializer that only returns the fields in the comma separated "fields" query parameter of the request, if given
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        fields = request.query_params.get('fields') if request else None
+        if not fields:
+            return
+
+        selected = {field.strip() for field in fields.split(',') if field.strip()}
+        unknown = selected - set(self.fields)
+        if unknown:
+            msg = f'Unknown fields {", ".join(sorted(unknown))}. Available fields: {", ".join(self.fields)}'
+            raise serializers.ValidationError({'fields': msg})
+        for name in set(self.fields) - selected:
+            self.fields.pop(name)
+
+
+class StockSerializer(FieldSelectionMixin, serializers.ModelSerializer):
+    currency = serializers.SlugRelatedField(slug_field='symbol', read_only=True)
+    price = serializers.DecimalField(max_digits=20, decimal_places=4, read_only=True)
+    price_in_euro = serializers.DecimalField(max_digits=20, decimal_places=4, read_only=True)
+    price_date = serializers.DateField(source='latest_price.date', read_only=True)
+
+    class Meta:
+        model = Stock
+        fields = ('symbol', 'ticker', 'name', 'currency', 'price', 'price_in_euro', 'price_date')
+
+
+class QuoteSerializer(FieldSelectionMixin, serializers.ModelSerializer):
+    symbol = serializers.CharField(source='stock.symbol')
+    currency = serializers.CharField(source='stock.currency.symbol')
+
+    class Meta:
+        model = LatestStockPrice
+        fields = ('symbol', 'currency', 'date', 'price', 'rate', 'price_in_euro')
+
+
+class StockPriceSerializer(FieldSelectionMixin, serializers.ModelSerializer):
+    serializer_field_mapping = {**serializers.ModelSerializer.serializer_field_mapping,
+                                FixedPointField: serializers.DecimalField}
+
+    class Meta:
+        model = StockPrice
+        fields = ('date', 'open', 'close', 'high', 'low')
@@ -0,0 +1,13 @@
+from django.urls import path
+from rest_framework.routers import DefaultRouter
+
+from api.views import QuoteViewSet, ScreenView, StockPriceViewSet, StockViewSet
+
+router = DefaultRouter()
+router.register('stocks', StockViewSet, basename='stock')
+router.register('quotes', QuoteViewSet, basename='quote')
+
+urlpatterns = [
+    path('stocks/<str:symbol>/prices/', StockPriceViewSet.as_view({'get': 'list'}), name='stock-prices'),
+    path('screen/', ScreenView.as_view(), name='screen'),
+] + router.urls
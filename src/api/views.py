@@ -0,0 +1,198 @@
+import hashlib
+import math
+from calendar import timegm
+from datetime import date, datetime
+from typing import Optional
+
+from django.shortcuts import get_object_or_404
+from django.http.response import HttpResponseBase
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from rest_framework import viewsets
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from api.serializers import QuoteSerializer, StockPriceSerializer, StockSerializer
+from common.models import Ingestion
+from screener.screener import METRICS, Condition, PriceMatrix
+from stock.models import LatestStockPrice, Stock
+
+
+def _compute_etag(request: Request, timestamp: datetime) -> str:
+    """
+    Version of the data, which changes whenever new market data is written
+
+    The Accept header is included because the browsable API and JSON are different representations of the same URL.
+    """
+
+    accept = request.META.get('HTTP_ACCEPT', '')
+    return hashlib.md5(f'{timestamp.isoformat()}:{accept}'.encode()).hexdigest()
+
+
+class _Precondition(Exception):
+    """
+    Response to a conditional request that is answered without running the view
+    """
+
+    def __init__(self, response: HttpResponseBase):
+        super().__init__()
+        self.response = response
+
+
+class ConditionalGetMixin:
+    """
+    Answer conditional GETs with 304 Not Modified without running the view if no data was written in the meantime, and
+    ask clients to revalidate every time instead of guessing how long a response stays fresh
+
+    The conditions are only checked once the request is authenticated and allowed, and only successful and Not
+    Modified responses get the ETag and Last-Modified headers, so the version of the data is not revealed to anyone
+    else.
+    """
+
+    _last_modified: Optional[datetime] = None
+    _etag: Optional[str] = None
+
+    def initial(self, request: Request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method not in ('GET', 'HEAD'):
+            return
+        self._last_modified = Ingestion.last()
+        if self._last_modified is None:
+            return
+        self._etag = quote_etag(_compute_etag(request, self._last_modified))
+        response = get_conditional_response(request, etag=self._etag,
+                                            last_modified=timegm(self._last_modified.utctimetuple()))
+        if response is not None:
+            raise _Precondition(response)
+
+    def handle_exception(self, exc: Exception) -> HttpResponseBase:
+        if isinstance(exc, _Precondition):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request: Request, response: HttpResponseBase, *args, **kwargs) -> HttpResponseBase:
+        response = super().finalize_response(request, response, *args, **kwargs)
+        patch_cache_control(response, no_cache=True)
+        if response.status_code in (200, 304) and self._etag:
+            response.setdefault('ETag', self._etag)
+            response.setdefault('Last-Modified', http_date(timegm(self._last_modified.utctimetuple())))
+        return response
+
+
+class Pagination(CursorPagination):
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+class StockPagination(Pagination):
+    ordering = 'symbol'
+
+
+class QuotePagination(Pagination):
+    ordering = 'pk'
+
+
+class StockPricePagination(Pagination):
+    # Oldest first, the ordering of the queryset is replaced by the ordering of the cursor
+    ordering = 'date'
+
+
+class StockViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Stocks with their latest price
+    """
+
+    queryset = Stock.objects.with_latest_price().select_related('currency')
+    serializer_class = StockSerializer
+    pagination_class = StockPagination
+    lookup_field = 'symbol'
+    lookup_value_regex = '[^/]+'
+
+
+class QuoteViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Latest price of every stock, in its own currency and in EUR
+    """
+
+    queryset = LatestStockPrice.objects.select_related('stock__currency')
+    serializer_class = QuoteSerializer
+    pagination_class = QuotePagination
+    lookup_field = 'stock__symbol'
+    lookup_url_kwarg = 'symbol'
+    lookup_value_regex = '[^/]+'
+
+
+class StockPriceViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Price history of a stock, optionally limited to the dates from "start" up to and including "end" (YYYY-MM-DD)
+    """
+
+    serializer_class = StockPriceSerializer
+    pagination_class = StockPricePagination
+
+    def get_queryset(self):
+        stock = get_object_or_404(Stock, symbol=self.kwargs['symbol'])
+        prices = stock.prices.all()
+        start = self._get_date_param('start')
+        if start:
+            prices = prices.filter(date__gte=start)
+        end = self._get_date_param('end')
+        if end:
+            prices = prices.filter(date__lte=end)
+        return prices
+
+    def _get_date_param(self, name: str) -> Optional[date]:
+        value = self.request.query_params.get(name)
+        if not value:
+            return None
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            raise ValidationError({name: f'Invalid date {value}, expected YYYY-MM-DD'})
+
+
+class ScreenView(ConditionalGetMixin, APIView):
+    """
+    Stocks that match all screen expressions in the "q" parameters, e.g. ?q=price_in_euro<20&q=drawdown_52w>30%
+
+    The response contains price_in_euro and all metrics that are used by the expressions, or the metrics in the comma
+    separated "fields" parameter.
+    """
+
+    def get(self, request: Request) -> Response:
+        try:
+            conditions = [Condition.parse(expression) for expression in request.query_params.getlist('q')]
+        except ValueError as e:
+            raise ValidationError({'q': str(e)})
+
+        fields = request.query_params.get('fields')
+        if fields:
+            metrics = [field.strip() for field in fields.split(',') if field.strip() and field.strip() != 'symbol']
+            unknown = set(metrics) - set(METRICS)
+            if unknown:
+                msg = f'Unknown fields {", ".join(sorted(unknown))}. Available fields: {", ".join(sorted(METRICS))}'
+                raise ValidationError({'fields': msg})
+        else:
+            metrics = sorted(set.union({'price_in_euro'}, *[condition.metrics for condition in conditions]))
+
+        matrix = PriceMatrix.load_cached()
+        mask = matrix.match(*conditions)
+        values = {metric: matrix.metric(metric)[mask] for metric in metrics}
+        symbols = [symbol for symbol, match in zip(matrix.symbols, mask) if match]
+        results = [
+            dict(symbol=symbol, **{metric: _to_json_number(values[metric][row]) for metric in metrics})
+            for row, symbol in enumerate(symbols)
+        ]
+        return Response({'count': len(results), 'results': results})
+
+
+def _to_json_number(value: float) -> Optional[float]:
+    """
+    Convert NaN, which is not valid JSON, to None
+    """
+
+    return None if math.isnan(value) else float(value)
@@ -0,0 +1,93 @@
+from typing import Dict, Optional
+
+from django.contrib import admin
+from django.db.models import Count, Max, Min
+from django.forms.models import BaseInlineFormSet
+from django.utils.functional import cached_property
+
+
+class PaginatedInlineFormSet(BaseInlineFormSet):
+    """
+    Inline formset that only contains a single page of the related objects
+
+    The page and the URL to other pages are set per request by PaginatedTabularInline.get_formset.
+    """
+
+    per_page = 50
+    page = 1
+    date_field = 'date'
+    page_urls: Dict[int, str] = {}
+
+    def get_queryset(self):
+        if not hasattr(self, '_queryset'):
+            offset = (self.page - 1) * self.per_page
+            self._queryset = super().get_queryset()[offset:offset + self.per_page]
+        return self._queryset
+
+    @cached_property
+    def summary(self) -> Dict:
+        """
+        Number of related objects and the range of their dates, computed in a single query
+        """
+
+        return self.queryset.order_by().aggregate(
+            count=Count('pk'), first=Min(self.date_field), last=Max(self.date_field))
+
+    @property
+    def first_index(self) -> int:
+        return min((self.page - 1) * self.per_page + 1, self.summary['count'])
+
+    @property
+    def last_index(self) -> int:
+        return min(self.page * self.per_page, self.summary['count'])
+
+    @property
+    def previous_page_url(self) -> Optional[str]:
+        if self.page > 1:
+            return self.page_urls.get(self.page - 1)
+        return None
+
+    @property
+    def next_page_url(self) -> Optional[str]:
+        if self.last_index < self.summary['count']:
+            return self.page_urls.get(self.page + 1)
+        return None
+
+
+class PaginatedTabularInline(admin.TabularInline):
+    """
+    Tabular inline that shows one page of the related objects at a time, with a summary of all of them
+
+    Rendering a detail page takes the same time regardless of the number of related objects.
+    """
+
+    formset = PaginatedInlineFormSet
+    template = 'admin/edit_inline/paginated_tabular.html'
+
+    # Number of related objects per page
+    per_page = 50
+
+    # Name of the query parameter holding the page number
+    page_param = 'page'
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        page = self._get_page(request)
+        formset.per_page = self.per_page
+        formset.page = page
+        formset.page_urls = {
+            page - 1: self._get_page_url(request, page - 1),
+            page + 1: self._get_page_url(request, page + 1),
+        }
+        return formset
+
+    def _get_page(self, request) -> int:
+        try:
+            return max(int(request.GET.get(self.page_param, 1)), 1)
+        except ValueError:
+            return 1
+
+    def _get_page_url(self, request, page: int) -> str:
+        params = request.GET.copy()
+        params[self.page_param] = page
+        return f'?{params.urlencode()}'
@@ -1,5 +1,11 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+from common.db import configure_sqlite
 
 
 class CommonConfig(AppConfig):
     name = 'common'
+
+    def ready(self):
+        connection_created.connect(configure_sqlite, dispatch_uid='common.configure_sqlite')
@@ -0,0 +1,224 @@
+import asyncio
+import queue
+import threading
+from typing import Awaitable, Callable, Dict, Iterable, Iterator, Optional, Tuple, Type, TypeVar
+
+import httpx
+from requests import RequestException
+from urllib3 import Retry
+from urllib3.exceptions import InvalidHeader, MaxRetryError
+
+from common.external_api import BaseService, OptionalJSON, Params
+from common.http_cache import ResponseCache
+from common.instrumentation import instrumentation
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+class HostRateLimiter:
+    """
+    Spread the requests to every host evenly, with at most the given number of requests per second per host
+    """
+
+    def __init__(self, requests_per_second: float):
+        self.interval = 1 / requests_per_second
+        self._next_start: Dict[str, float] = {}
+
+    async def wait(self, host: str):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        # Reserve the next free slot before sleeping, so concurrent requests get consecutive slots
+        start = max(now, self._next_start.get(host, now))
+        self._next_start[host] = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+class AsyncBaseService:
+    """
+    Asynchronous counterpart of a BaseService, for services that make many independent GET calls
+
+    The calls are made with httpx, and all calls of a service share its pool of keep-alive connections. Everything
+    else is taken from the synchronous service: the headers, the retry policy, the HTTP cache and how responses are
+    processed, so a call returns the same as the synchronous call would. Use run_in_background to make the calls from
+    synchronous code, e.g. a management command.
+    """
+
+    # Synchronous service whose headers, retry policy, cache policy and response processing are used
+    service: Type[BaseService] = BaseService
+
+    def __init__(self, max_concurrency: int = 100, requests_per_second: Optional[float] = None):
+        """
+        :param max_concurrency: Maximum number of calls in flight at the same time. Optional, default = 100
+        :param requests_per_second: Maximum number of calls per second per host. Optional, default = no limit
+        """
+
+        self.max_concurrency = max_concurrency
+        self.rate_limiter = HostRateLimiter(requests_per_second) if requests_per_second else None
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """
+        HTTP client of the service, which must only be used from the event loop it was first used in
+        """
+
+        if self._client is None:
+            limits = httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+            self._client = httpx.AsyncClient(headers=self.service.headers, timeout=self.service.timeout,
+                                             limits=limits, follow_redirects=True)
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _make_get_call(self, url: str, params: Params = None, error_msg: str = None) -> OptionalJSON:
+        """
+        Make a GET call, from the HTTP cache if the service caches the URL, and process the response
+
+        :param url: URL to make the GET call to
+        :param params: Query parameters of the GET call
+        :param error_msg: Error message to return if the call fails
+        :return: JSON object (list or dict) returned by the GET call, or the text if response_in_json is False
+        """
+
+        cache = ResponseCache.from_settings()
+        max_age = self.service._get_cache_max_age(url, params)
+        if cache and (max_age is not None or cache.replay):
+            key = cache.get_key(url, params)
+            response, entry = self.service._get_cached_response(cache, key, url, params, max_age or 0)
+            if response is None:
+                response = await self._get(url, params, entry.get_revalidation_headers() if entry else {}, error_msg)
+                response = self.service._cache_response(cache, key, entry, response)
+        else:
+            response = await self._get(url, params, {}, error_msg)
+        return self.service._process_response(response, error_msg)
+
+    async def _get(self, url: str, params: Params, headers: Dict[str, str], error_msg: Optional[str]) -> httpx.Response:
+        """
+        Make a GET call, retrying connection errors and the retry status codes like the synchronous service does
+
+        :return: Response, whatever its status code
+        :raise RequestException: if the call keeps failing without a response
+        """
+
+        retry = self.service._create_retry()
+        while True:
+            error = None
+            try:
+                if self.rate_limiter:
+                    await self.rate_limiter.wait(httpx.URL(url).host)
+                with instrumentation.phase('download'):
+                    response = await self.client.get(url, params=params, headers=headers)
+                instrumentation.count('requests')
+                instrumentation.count('bytes_downloaded', response.num_bytes_downloaded)
+                if not retry.is_retry('GET', response.status_code):
+                    return response
+            except httpx.TransportError as e:
+                error, response = e, None
+            try:
+                retry = retry.increment(method='GET', url=url, error=error)
+            except MaxRetryError:
+                if response is not None:
+                    return response
+                raise RequestException(f'{error_msg or f"Error from {url}"}: {error!r}') from error
+            await asyncio.sleep(self._get_retry_delay(retry, response))
+
+    @staticmethod
+    def _get_retry_delay(retry: Retry, response: Optional[httpx.Response]) -> float:
+        """
+        Return the number of seconds to wait before the next attempt, which is the Retry-After header of the response
+        if it has one, like urllib3 does for the synchronous calls, and the backoff time of the retry otherwise
+        """
+
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry.respect_retry_after_header:
+            try:
+                return retry.parse_retry_after(retry_after)
+            except InvalidHeader:
+                pass
+        return retry.get_backoff_time()
+
+    def run_in_background(self, function: Callable[[T], Awaitable[R]], items: Iterable[T],
+                          on_wait: Optional[Callable[[], None]] = None
+                          ) -> Iterator[Tuple[T, Optional[R], Optional[Exception]]]:
+        """
+        Call the coroutine function for every item in an event loop in a background thread
+
+        The results are yielded in the calling thread as soon as they are available, in order of completion, such
+        that the caller can for instance write them to the database while the other calls are still in flight. At
+        most max_concurrency items are in flight or waiting for the caller, which bounds the memory usage.
+
+        :param function: Coroutine function to call with each item
+        :param items: Items to call the function with
+        :param on_wait: Function to call before waiting for the next result, if none is available yet. Optional,
+                        default = None
+        :return: Iterator over tuples of the item, the result and None, or the item, None and the exception that the
+                 function raised
+        """
+
+        results: queue.Queue = queue.Queue()
+        done = object()
+        loop = asyncio.new_event_loop()
+        # Created in the event loop, before the first result is put on the queue
+        semaphore: Optional[asyncio.Semaphore] = None
+
+        async def call(item: T):
+            try:
+                results.put((item, await function(item), None))
+            except Exception as e:
+                results.put((item, None, e))
+
+        async def call_all():
+            nonlocal semaphore
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            tasks = set()
+            try:
+                for item in items:
+                    await semaphore.acquire()
+                    task = asyncio.ensure_future(call(item))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                if tasks:
+                    await asyncio.wait(tasks)
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await self.close()
+
+        def run():
+            try:
+                loop.run_until_complete(main_task)
+            except BaseException as e:
+                results.put((None, None, e))
+            finally:
+                results.put(done)
+
+        main_task = loop.create_task(call_all())
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        try:
+            while True:
+                try:
+                    result = results.get_nowait()
+                except queue.Empty:
+                    if on_wait:
+                        on_wait()
+                    result = results.get()
+                if result is done:
+                    break
+                item, value, error = result
+                if item is None and isinstance(error, BaseException) and not isinstance(error, asyncio.CancelledError):
+                    raise error
+                # Let the next call start now that this result is taken off the queue. The loop is only closed
+                # below, so this is a no-op once all calls are done.
+                loop.call_soon_threadsafe(semaphore.release)
+                yield item, value, error
+        finally:
+            if thread.is_alive():
+                loop.call_soon_threadsafe(main_task.cancel)
+                thread.join()
+            loop.close()
@@ -0,0 +1,131 @@
+import inspect
+import statistics
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Union
+
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.module_loading import autodiscover_modules
+
+# Benchmark functions by name, filled by the register decorator in the benchmarks module of every app
+BENCHMARKS: Dict[str, 'Benchmark'] = {}
+
+Setup = Callable[[int], Union[Callable[[], Any], Iterator[Callable[[], Any]]]]
+
+
+@dataclass
+class Benchmark:
+    name: str
+    setup: Setup
+    rounds: int
+
+
+@dataclass
+class BenchmarkResult:
+    """
+    Timings of all rounds of a benchmark in seconds
+    """
+
+    name: str
+    rounds: int
+    min: float
+    max: float
+    mean: float
+    median: float
+    stddev: float
+
+    @classmethod
+    def from_timings(cls, name: str, timings: List[float]) -> 'BenchmarkResult':
+        return cls(name=name, rounds=len(timings), min=min(timings), max=max(timings), mean=statistics.mean(timings),
+                   median=statistics.median(timings), stddev=statistics.stdev(timings) if len(timings) > 1 else 0.0)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def register(name: str, rounds: int = 5) -> Callable[[Setup], Setup]:
+    """
+    Register a benchmark
+
+    The decorated function receives the scale of the benchmark and prepares everything that should not be timed, like
+    test data. It returns the function to time, or yields it if it has to clean up afterwards. Every round runs in a
+    transaction that is rolled back afterwards, so rounds do not influence each other.
+
+    :param name: Unique name of the benchmark, by convention prefixed with the name of the app
+    :param rounds: Number of timed rounds. Optional, default = 5
+    """
+
+    def decorator(setup: Setup) -> Setup:
+        if name in BENCHMARKS:
+            msg = f'Benchmark {name} is registered twice'
+            raise ValueError(msg)
+        BENCHMARKS[name] = Benchmark(name=name, setup=setup, rounds=rounds)
+        return setup
+
+    return decorator
+
+
+def discover_benchmarks() -> Dict[str, Benchmark]:
+    """
+    Import the benchmarks module of every installed app and return all registered benchmarks
+    """
+
+    autodiscover_modules('benchmarks')
+    return BENCHMARKS
+
+
+def run_benchmark(benchmark: Benchmark, scale: int = 1, rounds: Optional[int] = None) -> BenchmarkResult:
+    """
+    Run one warm-up round and the timed rounds of the benchmark
+
+    :param benchmark: Benchmark to run
+    :param scale: Factor to multiply the amount of test data with. Optional, default = 1
+    :param rounds: Number of timed rounds. Optional, default = the number of rounds of the benchmark
+    """
+
+    timings = [_run_round(benchmark, scale) for _ in range(1 + (rounds or benchmark.rounds))]
+    return BenchmarkResult.from_timings(benchmark.name, timings[1:])
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+            threshold: float) -> List[str]:
+    """
+    Compare the median timings of benchmark results with a baseline
+
+    :param results: Results by benchmark name, as returned by BenchmarkResult.to_dict
+    :param baseline: Earlier results in the same format
+    :param threshold: Maximum allowed relative slowdown, e.g. 0.2 for 20%
+    :return: Description of every benchmark that is slower than the baseline by more than the threshold
+    """
+
+    regressions = []
+    for name, result in sorted(results.items()):
+        if name not in baseline or not baseline[name]['median']:
+            continue
+        change = result['median'] / baseline[name]['median'] - 1
+        if change > threshold:
+            regressions.append(f'{name}: {baseline[name]["median"]:.4f}s -> {result["median"]:.4f}s '
+                               f'({change:+.0%})')
+    return regressions
+
+
+def _run_round(benchmark: Benchmark, scale: int) -> float:
+    for cache in caches.all():
+        cache.clear()
+    with transaction.atomic():
+        prepared = benchmark.setup(scale)
+        if inspect.isgenerator(prepared):
+            function = next(prepared)
+        else:
+            function = prepared
+        try:
+            start = time.perf_counter()
+            function()
+            elapsed = time.perf_counter() - start
+        finally:
+            if inspect.isgenerator(prepared):
+                # Resume the setup after its yield to clean up, like a pytest fixture
+                next(prepared, None)
+            transaction.set_rollback(True)
+    return elapsed
@@ -0,0 +1,99 @@
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from django.core.cache import BaseCache, caches
+
+from common.models import Ingestion
+
+_MISSING = object()
+
+
+class MarketDataCache:
+    """
+    Cache for values that are derived from market data, like the latest prices and exchange rates
+
+    Cached values do not expire after a timeout. Instead, every value is stored under the version of the market data,
+    which is the time of the last ingestion (see Ingestion.record). Recording an ingestion therefore invalidates all
+    values at once, after which the cache backend evicts the old values when it needs the space. Other processes
+    notice a new ingestion within version_check_interval seconds. Nothing is cached as long as no ingestion has been
+    recorded, since there is no version to invalidate.
+    """
+
+    # Number of seconds that the version is reused before the database is checked for a new ingestion again
+    version_check_interval = 1.0
+    key_prefix = 'market_data'
+
+    def __init__(self, alias: str = 'default'):
+        """
+        :param alias: Name of the cache in the CACHES setting. Optional, default = 'default'
+        """
+
+        self.alias = alias
+        # Values that are kept in this process by get_or_set_local, with the version they were computed for
+        self._local: Dict[str, Tuple[int, Any]] = {}
+        self._local_lock = threading.Lock()
+
+    @property
+    def cache(self) -> BaseCache:
+        return caches[self.alias]
+
+    def get_version(self) -> Optional[int]:
+        """
+        Return the current version of the market data, or None if no ingestion has been recorded
+        """
+
+        timestamp = Ingestion.last(max_age=self.version_check_interval)
+        if timestamp is None:
+            return None
+        return int(timestamp.timestamp() * 1_000_000)
+
+    def get_or_set(self, key: str, compute: Callable[[], Any]) -> Any:
+        """
+        Return the cached value for the key, or compute, cache and return it if it is not cached for this version
+
+        :param key: Key of the value, unique among all market data values
+        :param compute: Function returning the value, must only depend on market data
+        """
+
+        version = self.get_version()
+        if version is None:
+            return compute()
+
+        key = f'{self.key_prefix}:{key}'
+        value = self.cache.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            value = compute()
+            self.cache.set(key, value, timeout=None, version=version)
+        return value
+
+    def get_or_set_local(self, key: str, compute: Callable[[], Any]) -> Any:
+        """
+        Like get_or_set, but keep the value in this process instead of in the cache backend
+
+        This is meant for large values like the price matrix, which the cache backend would pickle and unpickle on
+        every access, even the local memory cache. Only the values of the current version are kept, so the values of
+        an older version are released as soon as a new ingestion is noticed. The same object is returned to all
+        threads.
+
+        :param key: Key of the value, unique among all market data values
+        :param compute: Function returning the value, must only depend on market data
+        """
+
+        version = self.get_version()
+        if version is None:
+            return compute()
+
+        with self._local_lock:
+            cached_version, value = self._local.get(key, (None, _MISSING))
+        if cached_version == version:
+            return value
+        value = compute()
+        with self._local_lock:
+            # Another thread may already have noticed a newer version in the meantime
+            if all(cached_version <= version for cached_version, _ in self._local.values()):
+                self._local = {cached_key: entry for cached_key, entry in self._local.items() if entry[0] == version}
+                self._local[key] = (version, value)
+        return value
+
+
+market_data_cache = MarketDataCache()
@@ -0,0 +1,216 @@
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Type
+
+from django.conf import settings
+from django.db import NotSupportedError, connection, models, transaction
+from django.db.backends.base.base import BaseDatabaseWrapper
+
+from common.utils import chunked
+
+
+@dataclass
+class UpsertResult:
+    """
+    Number of rows that were inserted, updated or left unchanged by an upsert
+    """
+
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+
+    def __iadd__(self, other: 'UpsertResult') -> 'UpsertResult':
+        self.inserted += other.inserted
+        self.updated += other.updated
+        self.unchanged += other.unchanged
+        return self
+
+    @property
+    def written(self) -> int:
+        return self.inserted + self.updated
+
+    def __str__(self):
+        return f'{self.inserted} inserted, {self.updated} updated, {self.unchanged} unchanged'
+
+
+def bulk_upsert(model: Type[models.Model], objs: Iterable[models.Model], unique_fields: Sequence[str],
+                update_fields: Sequence[str], written: Optional[List[models.Model]] = None) -> UpsertResult:
+    """
+    Insert the given objects, or update the existing rows with the same values for the unique fields
+
+    Rows that already exist with exactly the same values are not written at all. All other rows are written with
+    INSERT ... ON CONFLICT DO UPDATE statements, in batches that fit in a single statement.
+
+    :param model: Model of the objects
+    :param objs: Unsaved model instances. Primary keys are ignored.
+    :param unique_fields: Names of the fields that together identify a row, must have a unique constraint
+    :param update_fields: Names of the fields to update if the row already exists
+    :param written: List to add the inserted and updated objects to. Optional, default = None
+    :return: Number of inserted, updated and unchanged rows
+    """
+
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        msg = f'Upserts are not supported on database {connection.vendor}'
+        raise NotSupportedError(msg)
+
+    unique = [model._meta.get_field(name) for name in unique_fields]
+    update = [model._meta.get_field(name) for name in update_fields]
+    fields = unique + update
+    objs = list(objs)
+    batch_size = connection.ops.bulk_batch_size(fields, objs)
+
+    result = UpsertResult()
+    for batch in chunked(objs, batch_size):
+        existing = _get_existing_values(model, batch, unique, update)
+        to_write = []
+        for obj in batch:
+            key = _normalize_all(unique, [getattr(obj, field.attname) for field in unique])
+            values = _normalize_all(update, [getattr(obj, field.attname) for field in update])
+            if key not in existing:
+                result.inserted += 1
+                to_write.append(obj)
+            elif existing[key] != values:
+                result.updated += 1
+                to_write.append(obj)
+            else:
+                result.unchanged += 1
+        if to_write:
+            _insert_on_conflict_update(model, to_write, unique, update)
+            if written is not None:
+                written.extend(to_write)
+    return result
+
+
+def _get_existing_values(model: Type[models.Model], objs: List[models.Model], unique: List[models.Field],
+                         update: List[models.Field]) -> Dict[Tuple, Tuple]:
+    """
+    Return the current values of the update fields of all rows that conflict with the given objects
+    """
+
+    lookup = {
+        f'{field.attname}__in': {getattr(obj, field.attname) for obj in objs}
+        for field in unique
+    }
+    rows = model._default_manager.filter(**lookup).order_by().values_list(
+        *[field.attname for field in unique + update])
+    nr_unique = len(unique)
+    return {
+        _normalize_all(unique, row[:nr_unique]): _normalize_all(update, row[nr_unique:])
+        for row in rows
+    }
+
+
+def _insert_on_conflict_update(model: Type[models.Model], objs: List[models.Model], unique: List[models.Field],
+                               update: List[models.Field]):
+    qn = connection.ops.quote_name
+    fields = unique + update
+    columns = ', '.join(qn(field.column) for field in fields)
+    placeholders = ', '.join(['%s'] * len(fields))
+    values = ', '.join([f'({placeholders})'] * len(objs))
+    conflict = ', '.join(qn(field.column) for field in unique)
+    assignments = ', '.join(f'{qn(field.column)} = excluded.{qn(field.column)}' for field in update)
+    sql = f'INSERT INTO {qn(model._meta.db_table)} ({columns}) VALUES {values} ' \
+          f'ON CONFLICT ({conflict}) DO UPDATE SET {assignments}'
+    params = [
+        field.get_db_prep_save(getattr(obj, field.attname), connection)
+        for obj in objs
+        for field in fields
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def _normalize(field: models.Field, value: Any) -> Any:
+    """
+    Convert the value to the representation it has after a round trip through the database
+    """
+
+    value = field.to_python(value)
+    if isinstance(value, Decimal) and isinstance(field, models.DecimalField):
+        value = value.quantize(Decimal(1).scaleb(-field.decimal_places))
+    return value
+
+
+def _normalize_all(fields: List[models.Field], values: Sequence[Any]) -> Tuple:
+    return tuple(_normalize(field, value) for field, value in zip(fields, values))
+
+
+def configure_sqlite(sender, connection: BaseDatabaseWrapper, **kwargs):
+    """
+    Set the SQLITE_PRAGMAS on every new SQLite connection, connected to the connection_created signal
+    """
+
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+class CommitBatcher:
+    """
+    Group the writes of many units of work, e.g. stocks, into a transaction per commit_size units
+
+    Every commit has a fixed cost, most of all an fsync of the database file, so ingesting thousands of stocks is
+    faster with fewer commits. The writes of a unit can still be rolled back on their own by wrapping them in an atomic
+    block, which becomes a savepoint within the batch. The transaction should not stay open while waiting for the
+    next unit, e.g. for a download, as it blocks all other writers: commit() the units that are done before waiting.
+
+    Usage:
+        with CommitBatcher(commit_size=50) as batcher:
+            for stock in stocks:
+                if not downloaded(stock):
+                    batcher.commit()
+                store(stock)
+                batcher.done()
+    """
+
+    def __init__(self, commit_size: int = 1, using: Optional[str] = None):
+        """
+        :param commit_size: Number of units of work per transaction, 1 to commit every unit on its own. Optional,
+                            default = 1
+        :param using: Alias of the database. Optional, default = the default database
+        """
+
+        if commit_size < 1:
+            raise ValueError('The commit size should be at least 1')
+        self.commit_size = commit_size
+        self.using = using
+        self._atomic: Optional[transaction.Atomic] = None
+        self._nr_pending = 0
+
+    def __enter__(self) -> 'CommitBatcher':
+        self._begin()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._end(exc_type, exc_value, traceback)
+
+    def done(self):
+        """
+        Record that a unit of work is done, committing the transaction once it contains commit_size units
+        """
+
+        self._nr_pending += 1
+        if self._nr_pending >= self.commit_size:
+            self.commit()
+
+    def commit(self):
+        """
+        Commit the units of work that are done so far, if any, and start a new transaction for the next units
+        """
+
+        if self._nr_pending > 0:
+            self._end(None, None, None)
+            self._begin()
+
+    def _begin(self):
+        self._nr_pending = 0
+        if self.commit_size > 1:
+            self._atomic = transaction.atomic(using=self.using)
+            self._atomic.__enter__()
+
+    def _end(self, exc_type, exc_value, traceback):
+        if self._atomic is not None:
+            atomic, self._atomic = self._atomic, None
+            atomic.__exit__(exc_type, exc_value, traceback)
@@ -1,10 +1,18 @@
+import random
+import re
+import threading
+import time
 from abc import ABC
-from typing import Any, Callable, Dict, List, Optional, Union
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
 from unittest.mock import patch
 
-import requests
-from requests import RequestException, Response
+from requests import RequestException, Response, Session
+from requests.adapters import HTTPAdapter
 from rest_framework import status
+from urllib3 import Retry
+
+from common.http_cache import CacheEntry, ResponseCache
+from common.instrumentation import instrumentation
 
 OptionalJSON = Union[list, dict, float, int, str, bool, None]
 Headers = Dict[str, Union[str, int]]
@@ -25,6 +33,13 @@ def mock_get_call(return_value: OptionalJSON = None, side_effect: Any = None):
         return patch.object(BaseService, '_make_get_call', return_value=return_value)
 
 
+def mock_streaming_get_call(return_value: Optional[List[str]] = None, side_effect: Any = None):
+    if side_effect:
+        return patch.object(BaseService, '_make_streaming_get_call', side_effect=side_effect)
+    else:
+        return patch.object(BaseService, '_make_streaming_get_call', return_value=return_value)
+
+
 def mock_post_call(return_value: OptionalJSON = None, side_effect: Any = None):
     if side_effect:
         return patch.object(BaseService, '_make_post_call', side_effect=side_effect)
@@ -39,6 +54,23 @@ def mock_put_call(return_value: OptionalJSON = None, side_effect: Any = None):
         return patch.object(BaseService, '_make_put_call', return_value=return_value)
 
 
+class JitteredRetry(Retry):
+    """
+    Retry policy with exponential backoff and full jitter
+
+    Without jitter, all threads that hit a rate limit at the same time retry at the same time as well.
+    """
+
+    def get_backoff_time(self) -> float:
+        backoff = super().get_backoff_time()
+        return random.uniform(0, backoff)
+
+    def increment(self, *args, **kwargs) -> Retry:
+        # Called by urllib3 in the thread of the request, so the retry is attributed to the right symbol
+        instrumentation.count('retries')
+        return super().increment(*args, **kwargs)
+
+
 class BaseService(ABC):
 
     # Default headers to add to any API call. Can be overwritten per Service, for instance to add authentication
@@ -47,13 +79,79 @@ class BaseService(ABC):
     # Flag indicating whether the response should be parsed as JSON
     response_in_json: bool = True
 
+    # Number of seconds to wait for the server to connect and to send data
+    timeout: float = 30
+
+    # Settings of the HTTP session of the service, which is shared by all threads. Connections are kept alive and
+    # responses are gzip-compressed by default. The pool size is the maximum number of connections kept alive per host.
+    pool_size: int = 10
+    max_retries: int = 5
+    backoff_factor: float = 0.5
+    retry_status_codes: Tuple[int, ...] = (429, 500, 502, 503, 504)
+
+    # Number of seconds that GET responses stay fresh in the HTTP cache, by regular expression of the URLs they apply
+    # to. The first matching expression is used. Responses of URLs without a match are not cached. See
+    # common.http_cache for how to enable the cache.
+    cache_max_age: Tuple[Tuple[str, float], ...] = ()
+
+    # HTTP session by service class, such that every service gets a session with its own settings
+    _sessions: Dict[type, Session] = {}
+    _session_lock = threading.Lock()
+
+    @classmethod
+    def _get_session(cls) -> Session:
+        """
+        Return the HTTP session of the service, creating it on first use
+        """
+
+        session = BaseService._sessions.get(cls)
+        if session is None:
+            with BaseService._session_lock:
+                session = BaseService._sessions.get(cls)
+                if session is None:
+                    session = BaseService._sessions[cls] = cls._create_session()
+        return session
+
+    @classmethod
+    def _create_retry(cls) -> JitteredRetry:
+        """
+        Return the retry policy of the calls, which is shared with the asynchronous services
+        """
+
+        return JitteredRetry(total=cls.max_retries, backoff_factor=cls.backoff_factor,
+                             status_forcelist=cls.retry_status_codes, raise_on_status=False)
+
+    @classmethod
+    def _create_session(cls) -> Session:
+        adapter = HTTPAdapter(pool_connections=cls.pool_size, pool_maxsize=cls.pool_size,
+                              max_retries=cls._create_retry())
+        session = Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    @classmethod
+    def set_pool_size(cls, pool_size: int):
+        """
+        Make sure the HTTP session of the service keeps at least the given number of connections alive per host
+
+        :param pool_size: Minimum number of connections, typically the number of threads making calls
+        """
+
+        with BaseService._session_lock:
+            if pool_size > cls.pool_size:
+                cls.pool_size = pool_size
+                # Subclasses that do not set their own pool size get the new one as well
+                for service in [service for service in BaseService._sessions if issubclass(service, cls)]:
+                    BaseService._sessions.pop(service).close()
+
     @classmethod
     def _make_head_call(cls, url: str, params: Params = None) -> Response:
         """
         Wrapper around a HEAD call returning the response
         """
 
-        return requests.head(url=url, headers=cls.headers, params=params)
+        return cls._get_session().head(url=url, headers=cls.headers, params=params, timeout=cls.timeout)
 
     @classmethod
     def _make_get_call(cls, url: str, params: Params = None, error_msg: str = None) -> OptionalJSON:
@@ -66,9 +164,125 @@ class BaseService(ABC):
         :return: JSON object (list or dict) returned by the GET call (if successful call)
         """
 
-        response = requests.get(url=url, headers=cls.headers, params=params)
+        cache = ResponseCache.from_settings()
+        max_age = cls._get_cache_max_age(url, params)
+        if cache and (max_age is not None or cache.replay):
+            response = cls._make_cached_get_call(cache, url, params, max_age or 0)
+        else:
+            with instrumentation.phase('download'):
+                response = cls._get_session().get(url=url, headers=cls.headers, params=params, timeout=cls.timeout)
+            instrumentation.count('requests')
+            instrumentation.count('bytes_downloaded', cls._get_downloaded_bytes(response))
         return cls._process_response(response, error_msg)
 
+    @classmethod
+    def _make_streaming_get_call(cls, url: str, params: Params = None, error_msg: str = None) -> Iterator[str]:
+        """
+        Wrapper around a GET call yielding the lines of the response body while it is being downloaded
+
+        The call is only made once the first line is requested.
+
+        :param url: URL to make the GET call to
+        :param params: Query parameters of the GET call in JSON format (list or dict)
+        :param error_msg: Error message to return if the call fails
+        :return: Iterator over the lines of the response body (if successful call)
+        """
+
+        cache = ResponseCache.from_settings()
+        max_age = cls._get_cache_max_age(url, params)
+        if cache and (max_age is not None or cache.replay):
+            # The whole response is needed to store it, so cached calls are not streamed
+            response = cls._make_cached_get_call(cache, url, params, max_age or 0)
+            if not status.is_success(response.status_code):
+                cls._process_response(response, error_msg)
+            if response.encoding is None:
+                response.encoding = 'utf-8'
+            yield from response.text.splitlines()
+            return
+
+        with instrumentation.phase('download'):
+            response = cls._get_session().get(url=url, headers=cls.headers, params=params, timeout=cls.timeout,
+                                              stream=True)
+        instrumentation.count('requests')
+        with response:
+            if not status.is_success(response.status_code):
+                cls._process_response(response, error_msg)
+            if response.encoding is None:
+                response.encoding = 'utf-8'
+            yield from instrumentation.timed_iter('download', response.iter_lines(decode_unicode=True))
+            instrumentation.count('bytes_downloaded', cls._get_downloaded_bytes(response))
+
+    @classmethod
+    def _get_cache_max_age(cls, url: str, params: Params = None) -> Optional[float]:
+        """
+        Return the number of seconds that a response to a GET call stays fresh, or None if it should not be cached
+        """
+
+        for pattern, max_age in cls.cache_max_age:
+            if re.search(pattern, url):
+                return max_age
+        return None
+
+    @classmethod
+    def _make_cached_get_call(cls, cache: ResponseCache, url: str, params: Params, max_age: float) -> Response:
+        """
+        Return the response to a GET call from the cache if it is fresh, and make the call otherwise
+
+        A stale response is revalidated with a conditional call if the server sent an ETag or Last-Modified header, so
+        an unchanged response is not downloaded again. Successful responses are stored in the cache.
+
+        :raise RequestException: if the cache is in replay mode and has no response for the call
+        """
+
+        key = cache.get_key(url, params)
+        response, entry = cls._get_cached_response(cache, key, url, params, max_age)
+        if response is not None:
+            return response
+
+        headers = {**cls.headers, **(entry.get_revalidation_headers() if entry else {})}
+        with instrumentation.phase('download'):
+            response = cls._get_session().get(url=url, headers=headers, params=params, timeout=cls.timeout)
+        instrumentation.count('requests')
+        instrumentation.count('bytes_downloaded', cls._get_downloaded_bytes(response))
+        return cls._cache_response(cache, key, entry, response)
+
+    @staticmethod
+    def _get_cached_response(cache: ResponseCache, key: str, url: str, params: Params,
+                             max_age: float) -> Tuple[Optional[Response], Optional[CacheEntry]]:
+        """
+        Return the cached response if it is fresh, otherwise the cached entry to revalidate if any
+
+        :return: Tuple of the fresh response or None, and the stale entry or None
+        :raise RequestException: if the cache is in replay mode and has no response for the call
+        """
+
+        entry = cache.get(key)
+        if entry and (cache.replay or entry.age <= max_age):
+            instrumentation.count('cache_hits')
+            return entry.to_response(), entry
+        if cache.replay:
+            msg = f'No cached response for {url} with parameters {params} in replay mode'
+            raise RequestException(msg)
+        return None, entry
+
+    @staticmethod
+    def _cache_response(cache: ResponseCache, key: str, entry: Optional[CacheEntry], response: Any) -> Any:
+        """
+        Store a successful response in the cache, or return the cached response if the server says it is unchanged
+
+        :param response: Response of requests or of httpx to the call, which was conditional if there is an entry
+        :return: Response to process
+        """
+
+        if entry and response.status_code == status.HTTP_304_NOT_MODIFIED:
+            instrumentation.count('cache_revalidations')
+            cache.store(key, entry._replace(stored=time.time()))
+            return entry.to_response()
+        instrumentation.count('cache_misses')
+        if response.status_code == status.HTTP_200_OK:
+            cache.put(key, response)
+        return response
+
     @classmethod
     def _make_post_call(cls, url: str, body: OptionalJSON, params: Params = None,
                         error_msg: str = None) -> OptionalJSON:
@@ -82,7 +296,8 @@ class BaseService(ABC):
         :return: JSON object (list or dict) returned by the POST call (if successful call)
         """
 
-        response = requests.post(url=url, json=body, headers=cls.headers, params=params)
+        response = cls._get_session().post(url=url, json=body, headers=cls.headers, params=params,
+                                            timeout=cls.timeout)
         return cls._process_response(response, error_msg)
 
     @classmethod
@@ -102,9 +317,11 @@ class BaseService(ABC):
         """
 
         if files:
-            response = requests.put(url=url, data=body, headers=cls.headers, params=params, files=files)
+            response = cls._get_session().put(url=url, data=body, headers=cls.headers, params=params, files=files,
+                                               timeout=cls.timeout)
         else:
-            response = requests.put(url=url, json=body, headers=cls.headers, params=params)
+            response = cls._get_session().put(url=url, json=body, headers=cls.headers, params=params,
+                                               timeout=cls.timeout)
         return cls._process_response(response, error_msg)
 
     @classmethod
@@ -120,7 +337,8 @@ class BaseService(ABC):
         :return: JSON object (list or dict) returned by the DELETE call (if successful call)
         """
 
-        response = requests.delete(url=url, headers=cls.headers, data=body, params=params)
+        response = cls._get_session().delete(url=url, headers=cls.headers, data=body, params=params,
+                                              timeout=cls.timeout)
         return cls._process_response(response, error_msg)
 
     @classmethod
@@ -135,6 +353,15 @@ class BaseService(ABC):
         msg = f'{error_msg}. Status code: {response.status_code}. Response: {response.text}'
         raise RequestException(msg)
 
+    @staticmethod
+    def _get_downloaded_bytes(response: Response) -> int:
+        """
+        Return the number of bytes of the response body that were received, before decompression
+        """
+
+        tell = getattr(response.raw, 'tell', None)
+        return tell() if tell else len(response.content)
+
     @classmethod
     def _process_paginated_results(cls, data: Dict, result_processor: Callable, error_msg: Optional[str]) -> List[Dict]:
         """
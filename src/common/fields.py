@@ -0,0 +1,174 @@
+from decimal import Decimal
+from typing import List, Sequence
+
+import numpy as np
+from django import forms
+from django.core import checks, validators
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.db import connections, migrations, models
+from django.db.migrations.operations.base import Operation
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+
+
+class FixedPointField(models.BigIntegerField):
+    """
+    Decimal number that is stored as a whole number of ticks of 10 ** -decimal_places, e.g. 12.3456 as 123456
+
+    Model instances, forms and lookups work with Decimals, like with a DecimalField. The database stores a 64 bit
+    integer, which takes less space than a decimal and can be read into NumPy arrays directly with values_arrays,
+    without creating a Decimal per value.
+    """
+
+    description = 'Fixed-point decimal number stored as an integer number of ticks'
+    default_error_messages = {
+        'invalid': '“%(value)s” value must be a decimal number.',
+    }
+
+    def __init__(self, verbose_name=None, name=None, max_digits: int = 18, decimal_places: int = 4, **kwargs):
+        """
+        :param max_digits: Maximum number of digits, at most 18 to fit in 64 bits. Optional, default = 18
+        :param decimal_places: Number of digits after the decimal point. Optional, default = 4
+        """
+
+        self.max_digits = max_digits
+        self.decimal_places = decimal_places
+        super().__init__(verbose_name, name, **kwargs)
+
+    def check(self, **kwargs):
+        errors = super().check(**kwargs)
+        if not 0 <= self.decimal_places <= self.max_digits <= 18:
+            errors.append(checks.Error('FixedPointField needs 0 <= decimal_places <= max_digits <= 18', obj=self,
+                                       id='common.E001'))
+        return errors
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['max_digits'] = self.max_digits
+        kwargs['decimal_places'] = self.decimal_places
+        return name, path, args, kwargs
+
+    @cached_property
+    def scale(self) -> int:
+        return 10 ** self.decimal_places
+
+    @cached_property
+    def validators(self):
+        return [validators.DecimalValidator(self.max_digits, self.decimal_places), *self._validators]
+
+    def to_python(self, value):
+        if value is None or (isinstance(value, Decimal) and value.as_tuple().exponent == -self.decimal_places):
+            return value
+        try:
+            return Decimal(str(value) if isinstance(value, float) else value).quantize(
+                Decimal(1).scaleb(-self.decimal_places))
+        except (ArithmeticError, TypeError, ValueError):
+            raise ValidationError(self.error_messages['invalid'], code='invalid', params={'value': value})
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return Decimal(int(value)).scaleb(-self.decimal_places)
+
+    def get_prep_value(self, value):
+        value = models.Field.get_prep_value(self, value)
+        if value is None:
+            return None
+        return int(self.to_python(value).scaleb(self.decimal_places))
+
+    def formfield(self, **kwargs):
+        return models.Field.formfield(self, **{
+            'max_digits': self.max_digits,
+            'decimal_places': self.decimal_places,
+            'form_class': forms.DecimalField,
+            **kwargs,
+        })
+
+
+def to_ticks(values: np.ndarray, decimal_places: int = 4) -> np.ndarray:
+    """
+    Convert an array of floats to the integer ticks of a FixedPointField with the given number of decimal places
+    """
+
+    return np.round(np.asarray(values, dtype=np.float64) * 10 ** decimal_places).astype(np.int64)
+
+
+def values_arrays(queryset: QuerySet, *field_names: str) -> List[np.ndarray]:
+    """
+    Read the given fields of all rows of the queryset into a NumPy array per field
+
+    The values are read from the database cursor directly instead of through model fields. FixedPointFields and
+    DecimalFields become float arrays with NaN for NULL, date fields datetime64[D] arrays, other fields plain arrays.
+
+    :param queryset: Rows to read, in the order of the queryset
+    :param field_names: Names of fields of the model of the queryset, e.g. 'stock_id', 'date' or 'close'
+    """
+
+    fields = [queryset.model._meta.get_field(name) for name in field_names]
+    try:
+        sql, params = queryset.values_list(*field_names).query.get_compiler(queryset.db).as_sql()
+    except EmptyResultSet:
+        rows = []
+    else:
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+
+    columns = list(zip(*rows)) if rows else [()] * len(fields)
+    return [_to_array(field, column) for field, column in zip(fields, columns)]
+
+
+def _to_array(field: models.Field, values: Sequence) -> np.ndarray:
+    if isinstance(field, FixedPointField):
+        return np.array(values, dtype=np.float64) / field.scale
+    if isinstance(field, models.DecimalField):
+        return np.array(values, dtype=np.float64)
+    if isinstance(field, models.DateField) and not isinstance(field, models.DateTimeField):
+        return np.array(values, dtype='datetime64[D]')
+    return np.array(values)
+
+
+def convert_to_fixed_point(table: str, columns: Sequence[str], max_digits: int, decimal_places: int,
+                           alter_fields: List[migrations.AlterField]) -> List[Operation]:
+    """
+    Return the migration operations that change DecimalFields into FixedPointFields without losing their values
+
+    :param table: Name of the database table
+    :param columns: Names of the columns to convert
+    :param max_digits: max_digits of the DecimalFields, to restore them when migrating backwards
+    :param decimal_places: decimal_places of both the DecimalFields and the FixedPointFields
+    :param alter_fields: AlterField operations that change the fields into FixedPointFields
+    """
+
+    scale = 10 ** decimal_places
+
+    def multiply(apps, schema_editor):
+        quote = schema_editor.quote_name
+        for column in columns:
+            if schema_editor.connection.vendor == 'postgresql':
+                schema_editor.execute(f'ALTER TABLE {quote(table)} ALTER COLUMN {quote(column)} TYPE bigint '
+                                      f'USING ROUND({quote(column)} * {scale})::bigint')
+            else:
+                # Until the table is rebuilt by AlterField, the decimal column stores the whole numbers as integers
+                schema_editor.execute(f'UPDATE {quote(table)} SET {quote(column)} = '
+                                      f'CAST(ROUND({quote(column)} * {scale}) AS INTEGER)')
+
+    def divide(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            quote = schema_editor.quote_name
+            for column in columns:
+                schema_editor.execute(f'UPDATE {quote(table)} SET {quote(column)} = {quote(column)} / {scale}.0')
+
+    def divide_postgresql(apps, schema_editor):
+        # Runs before the reverse AlterField, which would not fit the ticks in the original numeric type
+        if schema_editor.connection.vendor == 'postgresql':
+            quote = schema_editor.quote_name
+            for column in columns:
+                schema_editor.execute(f'ALTER TABLE {quote(table)} ALTER COLUMN {quote(column)} TYPE '
+                                      f'numeric({max_digits}, {decimal_places}) USING {quote(column)} / {scale}.0')
+
+    return [
+        migrations.RunPython(multiply, divide),
+        *alter_fields,
+        migrations.RunPython(migrations.RunPython.noop, divide_postgresql),
+    ]
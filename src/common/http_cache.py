@@ -0,0 +1,206 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+
+# Response headers that are kept with a cached response, the others are not needed to process or revalidate it
+CACHED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+
+ON = 'on'
+REPLAY = 'replay'
+MODES = (ON, REPLAY)
+
+
+class CacheEntry(NamedTuple):
+    url: str
+    headers: Dict[str, str]
+    encoding: Optional[str]
+    stored: float
+    body: bytes
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.stored
+
+    def to_response(self) -> Response:
+        """
+        Return the cached response as a requests Response, such that it can be processed like a downloaded one
+        """
+
+        response = Response()
+        response.status_code = 200
+        response.url = self.url
+        response.headers = CaseInsensitiveDict(self.headers)
+        response.encoding = self.encoding
+        response._content = self.body
+        return response
+
+    def get_revalidation_headers(self) -> Dict[str, str]:
+        """
+        Return the headers of a conditional request, to which the server responds with 304 if the response is unchanged
+        """
+
+        headers = {}
+        if self.headers.get('ETag'):
+            headers['If-None-Match'] = self.headers['ETag']
+        if self.headers.get('Last-Modified'):
+            headers['If-Modified-Since'] = self.headers['Last-Modified']
+        return headers
+
+
+class ResponseCache:
+    """
+    On-disk cache of the bodies of successful GET responses, keyed by URL and query parameters
+
+    Every response is a gzip-compressed file, so the cache can be shared by processes and survives restarts. When the
+    files together exceed the maximum size, the least recently used responses are removed. In replay mode, responses
+    are only served from the cache regardless of their age, and a missing response is an error, so development and
+    tests can run repeatedly against the same data without any calls.
+
+    Whether and how long a response is fresh is decided by the service that makes the call, see
+    BaseService.cache_max_age.
+    """
+
+    # Caches by directory, such that all services in a process share the size of the cache
+    _instances: Dict[str, 'ResponseCache'] = {}
+
+    def __init__(self, directory: str, max_size: int, mode: str = ON):
+        """
+        :param directory: Directory to store the responses in
+        :param max_size: Maximum total size of the stored responses in bytes
+        :param mode: 'on' to use fresh responses and store new ones, 'replay' to only use stored responses.
+                     Optional, default = on
+        """
+
+        if mode not in MODES:
+            msg = f'Unknown HTTP cache mode {mode}, expected one of {", ".join(MODES)}'
+            raise ValueError(msg)
+        self.directory = directory
+        self.max_size = max_size
+        self.mode = mode
+        self._lock = threading.Lock()
+        # Total size of the files, computed on the first write
+        self._size: Optional[int] = None
+
+    @classmethod
+    def from_settings(cls) -> Optional['ResponseCache']:
+        """
+        Return the cache as configured by the HTTP_CACHE_* settings, or None if it is disabled
+        """
+
+        directory = settings.HTTP_CACHE_DIR
+        if not directory:
+            return None
+        if settings.HTTP_CACHE_MODE not in MODES:
+            msg = f'HTTP_CACHE_MODE should be one of {", ".join(MODES)}'
+            raise ImproperlyConfigured(msg)
+        if directory not in cls._instances:
+            cls._instances[directory] = cls(directory, settings.HTTP_CACHE_MAX_SIZE)
+        cache = cls._instances[directory]
+        cache.max_size = settings.HTTP_CACHE_MAX_SIZE
+        cache.mode = settings.HTTP_CACHE_MODE
+        return cache
+
+    @property
+    def replay(self) -> bool:
+        return self.mode == REPLAY
+
+    @staticmethod
+    def get_key(url: str, params: Optional[Dict] = None) -> str:
+        query = urlencode(sorted((params or {}).items()))
+        return hashlib.sha256(f'{url}?{query}'.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """
+        Return the stored response with the given key, and mark it as recently used
+
+        :return: Stored response, or None if there is none
+        """
+
+        file_name = self._get_file_name(key)
+        try:
+            with gzip.open(file_name, 'rb') as f:
+                meta = json.loads(f.readline())
+                body = f.read()
+            os.utime(file_name)
+        except (OSError, EOFError, ValueError):
+            # Missing, removed in the meantime by another process, or corrupt
+            return None
+        return CacheEntry(meta['url'], meta['headers'], meta['encoding'], meta['stored'], body)
+
+    def put(self, key: str, response: Any):
+        """
+        Store the response with the given key, replacing the stored response with that key if any
+
+        :param response: Response of requests or of httpx
+        """
+
+        headers = {name: response.headers[name] for name in CACHED_HEADERS if name in response.headers}
+        self.store(key, CacheEntry(str(response.url), headers, response.encoding, time.time(), response.content))
+
+    def store(self, key: str, entry: CacheEntry):
+        meta = {'url': entry.url, 'headers': entry.headers, 'encoding': entry.encoding, 'stored': entry.stored}
+        data = gzip.compress(json.dumps(meta).encode() + b'\n' + entry.body)
+
+        file_name = self._get_file_name(key)
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        tmp_file_name = f'{file_name}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_file_name, 'wb') as f:
+            f.write(data)
+        old_size = os.path.getsize(file_name) if os.path.exists(file_name) else 0
+        os.replace(tmp_file_name, file_name)
+
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._list_files())
+            else:
+                self._size += len(data) - old_size
+            if self._size > self.max_size:
+                self._evict()
+
+    def _evict(self):
+        """
+        Remove the least recently used responses until the cache is well below its maximum size
+        """
+
+        files = sorted(self._list_files(), key=lambda file: file[2])
+        self._size = sum(size for _, size, _ in files)
+        target = self.max_size * 0.9
+        for file_name, size, _ in files:
+            if self._size <= target:
+                break
+            try:
+                os.remove(file_name)
+            except FileNotFoundError:
+                pass
+            self._size -= size
+
+    def _list_files(self) -> List[Tuple[str, int, float]]:
+        """
+        Return the file name, size and time of last use of every stored response
+        """
+
+        files = []
+        for root, _, file_names in os.walk(self.directory):
+            for file_name in file_names:
+                if file_name.endswith('.gz'):
+                    path = os.path.join(root, file_name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    files.append((path, stat.st_size, stat.st_mtime))
+        return files
+
+    def _get_file_name(self, key: str) -> str:
+        # Spread the files over subdirectories to keep directories small
+        return os.path.join(self.directory, key[:2], f'{key}.gz')
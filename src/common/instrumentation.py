@@ -0,0 +1,272 @@
+import json
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple, TypeVar
+
+from django.db import connections
+
+T = TypeVar('T')
+
+# Label of the measurements that are not made on behalf of a specific symbol, e.g. looking up the stocks to fetch
+NO_SYMBOL = ''
+METRIC_PREFIX = 'stockscreener_ingestion'
+
+
+@dataclass
+class PhaseStats:
+    seconds: float = 0.0
+    calls: int = 0
+    queries: int = 0
+
+    def add(self, other: 'PhaseStats'):
+        self.seconds += other.seconds
+        self.calls += other.calls
+        self.queries += other.queries
+
+
+class Instrumentation:
+    """
+    Durations of the phases of an ingestion run and counters like bytes downloaded and rows written, per symbol
+
+    Phases nest, and a phase only records the time that is not spent in the phases within it. The phases of a symbol
+    therefore add up to the time spent on that symbol, which shows directly where the time goes. The current phase and
+    symbol are tracked per thread and asyncio task, so concurrent downloads are attributed to the right symbol.
+    Durations of threads and tasks that run in parallel are added up.
+
+    Usage:
+        with instrumentation.symbol('MIK'), instrumentation.phase('download'):
+            ...
+        instrumentation.count('rows_parsed', 250)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Context variables are separate per thread and per asyncio task
+        self._symbol: ContextVar[str] = ContextVar('symbol', default=NO_SYMBOL)
+        self._stack: ContextVar[Tuple[list, ...]] = ContextVar('stack', default=())
+        self.reset()
+
+    def reset(self):
+        """
+        Forget all measurements, typically at the start of a command
+        """
+
+        with self._lock:
+            self.started = time.time()
+            self._phases: Dict[Tuple[str, str], PhaseStats] = {}
+            self._counters: Counter = Counter()
+
+    @property
+    def current_symbol(self) -> str:
+        return self._symbol.get()
+
+    @contextmanager
+    def symbol(self, symbol: str) -> Iterator[None]:
+        """
+        Attribute all measurements of the current thread or task within this context to the given symbol
+        """
+
+        token = self._symbol.set(symbol)
+        try:
+            yield
+        finally:
+            self._symbol.reset(token)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        frame = [name, 0.0, 0]
+        token = self._stack.set(self._stack.get() + (frame,))
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self._stack.reset(token)
+            self._add_child_time(elapsed)
+            self._add_phase(name, PhaseStats(seconds=elapsed - frame[1], calls=1, queries=frame[2]))
+
+    def timed_iter(self, name: str, iterable: Iterable[T], counter: Optional[str] = None) -> Iterator[T]:
+        """
+        Yield the items of the iterable, recording the time spent producing them as a phase
+
+        This is meant for lazy pipelines, e.g. parsing a response while it is being downloaded, where the work of a
+        phase happens in small steps in between the work of other phases. The time is recorded once the iterable is
+        exhausted or closed.
+
+        :param name: Name of the phase
+        :param iterable: Iterable that does the work when the next item is requested
+        :param counter: Name of a counter to add the number of items to. Optional, default = no counter
+        """
+
+        iterator = iter(iterable)
+        total = PhaseStats(calls=1)
+        nr_items = 0
+        try:
+            while True:
+                frame = [name, 0.0, 0]
+                token = self._stack.set(self._stack.get() + (frame,))
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed = time.perf_counter() - start
+                    self._stack.reset(token)
+                    self._add_child_time(elapsed)
+                    total.seconds += elapsed - frame[1]
+                    total.queries += frame[2]
+                nr_items += 1
+                yield item
+        finally:
+            self._add_phase(name, total)
+            if counter:
+                self.count(counter, nr_items)
+
+    def count(self, name: str, value: int = 1):
+        with self._lock:
+            self._counters[self.current_symbol, name] += value
+
+    @contextmanager
+    def count_queries(self, using: str = 'default') -> Iterator[None]:
+        """
+        Count the SQL queries of the current thread on the given database per phase within this context
+        """
+
+        def execute(execute_query, sql, params, many, context):
+            stack = self._stack.get()
+            if stack:
+                stack[-1][2] += 1
+            else:
+                self._add_phase('other', PhaseStats(queries=1))
+            return execute_query(sql, params, many, context)
+
+        with connections[using].execute_wrapper(execute):
+            yield
+
+    def _add_child_time(self, seconds: float):
+        """
+        Add the time of a finished phase to the phase it was nested in, if any
+        """
+
+        stack = self._stack.get()
+        if stack:
+            stack[-1][1] += seconds
+
+    def _add_phase(self, name: str, stats: PhaseStats):
+        with self._lock:
+            key = (self.current_symbol, name)
+            if key not in self._phases:
+                self._phases[key] = PhaseStats()
+            self._phases[key].add(stats)
+
+    def summary(self) -> Tuple[Dict[str, PhaseStats], Dict[str, int]]:
+        """
+        Return the totals over all symbols of every phase and every counter
+        """
+
+        phases: Dict[str, PhaseStats] = {}
+        counters: Counter = Counter()
+        with self._lock:
+            for (_, name), stats in self._phases.items():
+                phases.setdefault(name, PhaseStats()).add(stats)
+            for (_, name), value in self._counters.items():
+                counters[name] += value
+        return phases, dict(counters)
+
+    def records(self) -> List[Dict[str, Any]]:
+        """
+        Return the phases and counters of every symbol, sorted by symbol
+        """
+
+        records: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            for (symbol, name), stats in self._phases.items():
+                record = records.setdefault(symbol, {'symbol': symbol or None, 'phases': {}, 'counters': {}})
+                record['phases'][name] = asdict(stats)
+            for (symbol, name), value in self._counters.items():
+                record = records.setdefault(symbol, {'symbol': symbol or None, 'phases': {}, 'counters': {}})
+                record['counters'][name] = value
+        return [records[symbol] for symbol in sorted(records)]
+
+    def format_summary(self) -> str:
+        """
+        Return a table of the time spent per phase, followed by the counters
+        """
+
+        phases, counters = self.summary()
+        total = sum(stats.seconds for stats in phases.values()) or 1
+        lines = [f'{"Phase":<16}{"Seconds":>10}{"Share":>8}{"Calls":>8}{"Queries":>9}']
+        for name, stats in sorted(phases.items(), key=lambda item: -item[1].seconds):
+            lines.append(f'{name:<16}{stats.seconds:>10.3f}{stats.seconds / total:>8.0%}{stats.calls:>8}'
+                         f'{stats.queries:>9}')
+        lines.extend(f'{name}: {value}' for name, value in sorted(counters.items()))
+        return '\n'.join(lines)
+
+    def write_json_lines(self, file: TextIO, command: str):
+        """
+        Write a JSON object per symbol to the file, with the phases and counters of that symbol
+        """
+
+        timestamp = datetime.fromtimestamp(self.started, timezone.utc).isoformat()
+        for record in self.records():
+            file.write(json.dumps(dict(command=command, started=timestamp, **record)) + '\n')
+
+    def to_prometheus(self, command: str) -> str:
+        """
+        Return the totals in the Prometheus text exposition format, e.g. for the textfile collector of node_exporter
+
+        Symbols are not used as labels to keep the number of time series small.
+        """
+
+        phases, counters = self.summary()
+        lines = []
+        for metric, help_text, attribute in [
+            ('phase_seconds', 'Time spent in the phase, excluding nested phases', 'seconds'),
+            ('phase_calls', 'Number of times the phase was entered', 'calls'),
+            ('phase_queries', 'Number of SQL queries made in the phase', 'queries'),
+        ]:
+            lines.append(f'# HELP {METRIC_PREFIX}_{metric} {help_text}')
+            lines.append(f'# TYPE {METRIC_PREFIX}_{metric} gauge')
+            for name, stats in sorted(phases.items()):
+                lines.append(f'{METRIC_PREFIX}_{metric}{{command="{command}",phase="{name}"}} '
+                             f'{getattr(stats, attribute)}')
+        for name, value in sorted(counters.items()):
+            lines.append(f'# TYPE {METRIC_PREFIX}_{name} gauge')
+            lines.append(f'{METRIC_PREFIX}_{name}{{command="{command}"}} {value}')
+        lines.append(f'# TYPE {METRIC_PREFIX}_last_run_timestamp_seconds gauge')
+        lines.append(f'{METRIC_PREFIX}_last_run_timestamp_seconds{{command="{command}"}} {self.started}')
+        return '\n'.join(lines) + '\n'
+
+
+# Measurements of the ingestion in this process, reset by the fetch commands at the start of a run
+instrumentation = Instrumentation()
+
+
+def add_metrics_arguments(parser):
+    help_metrics = 'Write the phase timings and counters of the run to this file. Optional, default = only print a ' \
+                   'summary.'
+    parser.add_argument('--metrics', type=str, default=None, help=help_metrics)
+    help_metrics_format = 'Format of the metrics file: a JSON object per symbol (jsonl) or the totals in the ' \
+                          'Prometheus text format (prometheus). Optional, default = jsonl'
+    parser.add_argument('--metrics-format', choices=['jsonl', 'prometheus'], default='jsonl',
+                        help=help_metrics_format)
+
+
+def write_metrics(command: str, stdout: TextIO, options: Dict[str, Any]):
+    """
+    Print the summary of the instrumentation and write the metrics file, if requested by add_metrics_arguments
+    """
+
+    stdout.write(instrumentation.format_summary())
+    if options['metrics']:
+        with open(options['metrics'], 'w') as f:
+            if options['metrics_format'] == 'prometheus':
+                f.write(instrumentation.to_prometheus(command))
+            else:
+                instrumentation.write_json_lines(f, command)
@@ -6,11 +6,18 @@ from django.contrib.auth.models import User
 from django.core.management import BaseCommand, call_command
 from django.utils import timezone
 
-from currency.models import Currency
-from stock.models import Stock
+from common.models import Ingestion
+from common.synthetic import SyntheticUniverse
+from currency.models import Currency, LatestExchangeRate
+from screener.indicators import update_indicators
+from stock.models import LatestStockPrice, Stock
+from stock.price_store import PriceStore
 
 
 class Command(BaseCommand):
+    help = 'Recreate the local database with a few stocks and their recent prices from Yahoo Finance, or with a ' \
+           'large synthetic universe that is generated offline'
+
     def handle(self, *args, **options):
         if settings.ENVIRONMENT != 'local':
             msg = 'Cannot create local data on a non-local environment'
@@ -23,12 +30,38 @@ class Command(BaseCommand):
         if not User.objects.filter(is_staff=True).exists():
             User.objects.create_superuser(username='admin', email='admin@nyon.nl', password='admin')
 
+        if options['synthetic']:
+            self._create_synthetic_data(options)
+            return
+
         today = timezone.now()
         start_date = today - timedelta(days=90)
 
         cad, gbx, hkd, jpy, sek, usd = self._create_currencies(start_date)
         self._create_stocks(cad, gbx, hkd, jpy, sek, start_date, usd)
 
+    def _create_synthetic_data(self, options):
+        """
+        Generate the universe and all data derived from the prices, like the fetch commands would have
+        """
+
+        universe = SyntheticUniverse(nr_stocks=options['stocks'], nr_currencies=options['currencies'],
+                                     years=options['years'], seed=options['seed'])
+        nr_rates, nr_prices = universe.create(log=self.stdout.write)
+
+        self.stdout.write('Refreshing latest exchange rates and stock prices')
+        LatestExchangeRate.refresh(Currency.objects.all())
+        LatestStockPrice.refresh(Stock.objects.all())
+        if not options['skip_indicators']:
+            self.stdout.write('Computing indicators')
+            for stock in Stock.objects.iterator():
+                update_indicators(stock)
+        if PriceStore.from_settings():
+            call_command('build_price_store', stdout=self.stdout)
+        Ingestion.record()
+        self.stdout.write(self.style.SUCCESS(f'Created {options["stocks"]} stocks with {nr_prices} prices and '
+                                             f'{options["currencies"]} currencies with {nr_rates} exchange rates'))
+
     def _create_currencies(self, start_date):
         Currency.objects.create(symbol='EUR', name='Euro')
         cad = Currency.objects.create(symbol='CAD', name='Canadian dollar')
@@ -60,3 +93,18 @@ class Command(BaseCommand):
         stock_symbols = [stock.symbol for stock in stocks]
         call_command('fetch_historical_stock_data', *stock_symbols, '--force-update', '--start',
                      start_date.strftime('%Y-%m-%d'))
+
+    def add_arguments(self, parser):
+        help_synthetic = 'Generate a universe of stocks and currencies with a daily price history offline, instead of ' \
+                         'fetching a few stocks from Yahoo. The same seed generates the same data.'
+        parser.add_argument('--synthetic', action='store_true', help=help_synthetic)
+        parser.add_argument('--stocks', type=int, default=10000,
+                            help='Number of synthetic stocks. Optional, default = 10000')
+        parser.add_argument('--currencies', type=int, default=30,
+                            help='Number of synthetic currencies, including EUR. Optional, default = 30')
+        parser.add_argument('--years', type=int, default=30,
+                            help='Number of years of synthetic history. Optional, default = 30')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Seed of the synthetic data. Optional, default = 0')
+        parser.add_argument('--skip-indicators', action='store_true',
+                            help='Do not compute the indicators of the synthetic stocks, which takes a while')
@@ -0,0 +1,75 @@
+import re
+from datetime import date, timedelta
+from typing import Dict
+
+from django.core.management import BaseCommand, CommandError
+from django.db.models import Max, OuterRef, QuerySet, Subquery
+
+from currency.models import Currency, CurrencyExchangeRate
+from stock.models import Stock, StockPrice
+
+# A line of a query plan that reads all rows of a price or exchange rate table, or all entries of one of its indexes
+FULL_SCAN = re.compile(r'\bSCAN (TABLE )?(stock_stockprice|currency_currencyexchangerate)\b')
+
+
+class Command(BaseCommand):
+    help = 'Print the query plans of the core queries on stock prices and exchange rates, to spot missing indexes'
+
+    def handle(self, *args, **options):
+        full_scans = []
+        for name, queryset in self.get_queries().items():
+            plan = queryset.explain()
+            self.stdout.write(f'== {name}')
+            if options['verbosity'] > 1:
+                self.stdout.write(str(queryset.query))
+            self.stdout.write(plan)
+            self.stdout.write('')
+            if FULL_SCAN.search(plan):
+                full_scans.append(name)
+
+        if options['check'] and full_scans:
+            msg = f'Queries that scan all prices or exchange rates: {", ".join(full_scans)}'
+            raise CommandError(msg)
+
+    @staticmethod
+    def get_queries() -> Dict[str, QuerySet]:
+        """
+        Return the core queries by name, like they are made by the API, the screener and the imports
+
+        The queries are for an existing stock, currency and date if there are any, the plans do not depend on them.
+        """
+
+        stock_id = Stock.objects.order_by('pk').values_list('pk', flat=True).first() or 1
+        currency_id = Currency.objects.order_by('pk').values_list('pk', flat=True).first() or 1
+        day = StockPrice.objects.filter(stock_id=stock_id).aggregate(day=Max('date'))['day'] or date.today()
+        start = day - timedelta(days=365)
+        stocks = Stock.objects.all()
+        currencies = Currency.objects.all()
+
+        latest_prices = StockPrice.objects.filter(stock=OuterRef('pk')).order_by('-date')
+        latest_rates = CurrencyExchangeRate.objects.filter(currency=OuterRef('pk')).order_by('-date')
+        return {
+            'Latest price of a stock': StockPrice.objects.filter(stock_id=stock_id).order_by('-date')[:1],
+            'Latest prices of all stocks': stocks.order_by().annotate(
+                latest_date=Subquery(latest_prices.values('date')[:1])),
+            'Latest date of the final prices of all stocks (imports)': stocks.order_by().annotate(
+                latest_date=Subquery(latest_prices.filter(provisional=False).values('date')[:1])),
+            'Prices of a stock in a date range (API)': StockPrice.objects.filter(
+                stock_id=stock_id, date__gte=start, date__lte=day).order_by('-date'),
+            'Prices of a stock since a date (indicators)': StockPrice.objects.filter(
+                stock_id=stock_id, date__gt=start).order_by('date'),
+            'Prices of all stocks on a date': StockPrice.objects.filter(date=day).order_by(),
+            'Prices of all stocks since a date': StockPrice.objects.filter(date__gte=day - timedelta(days=7)).order_by(),
+            'Prices of stocks since a date (screener)': StockPrice.objects.filter(
+                stock__in=stocks.values('id'), date__gte=start).order_by().values_list('stock_id', 'date', 'close'),
+            'Exchange rates of a currency in a date range': CurrencyExchangeRate.objects.filter(
+                currency_id=currency_id, date__gte=start, date__lte=day).order_by('-date'),
+            'Exchange rates of all currencies on a date': CurrencyExchangeRate.objects.filter(date=day).order_by(),
+            'Latest date of the final exchange rates of all currencies (imports)': currencies.order_by().annotate(
+                latest_date=Subquery(latest_rates.filter(provisional=False).values('date')[:1])),
+        }
+
+    def add_arguments(self, parser):
+        help_check = 'Fail if any of the queries reads all prices or exchange rates, instead of using an index to ' \
+                     'only read the ones it needs'
+        parser.add_argument('--check', action='store_true', help=help_check)
@@ -0,0 +1,83 @@
+import fnmatch
+import json
+import platform
+import subprocess
+from datetime import datetime, timezone
+from typing import Optional
+
+from django.core.management import BaseCommand, CommandError
+from django.test.runner import DiscoverRunner
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from common.benchmark import compare, discover_benchmarks, run_benchmark
+
+
+class Command(BaseCommand):
+    help = 'Time the ingestion, parsing and screening hot paths on synthetic data in a separate test database'
+
+    def handle(self, *args, **options):
+        benchmarks = [
+            benchmark for name, benchmark in sorted(discover_benchmarks().items())
+            if not options['filter'] or any(fnmatch.fnmatch(name, pattern) for pattern in options['filter'])
+        ]
+        if not benchmarks:
+            raise CommandError('No benchmarks match the filter')
+
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)['results']
+
+        results = {}
+        setup_test_environment()
+        runner = DiscoverRunner(verbosity=0)
+        old_config = runner.setup_databases()
+        try:
+            for benchmark in benchmarks:
+                result = run_benchmark(benchmark, scale=options['scale'], rounds=options['rounds'])
+                results[benchmark.name] = result.to_dict()
+                self.stdout.write(f'{benchmark.name:<40} median {result.median:.4f}s  min {result.min:.4f}s  '
+                                  f'max {result.max:.4f}s  ({result.rounds} rounds)')
+        finally:
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+
+        if options['output']:
+            report = {
+                'commit': self._get_commit(),
+                'timestamp': datetime.now(timezone.utc).isoformat(),
+                'python': platform.python_version(),
+                'scale': options['scale'],
+                'results': results,
+            }
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+
+        if baseline is not None:
+            regressions = compare(results, baseline, options['threshold'])
+            if regressions:
+                msg = 'Benchmarks slower than the baseline:\n' + '\n'.join(regressions)
+                raise CommandError(msg)
+            self.stdout.write(f'No benchmark is more than {options["threshold"]:.0%} slower than the baseline')
+
+    @staticmethod
+    def _get_commit() -> Optional[str]:
+        try:
+            return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                  check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def add_arguments(self, parser):
+        help_filter = 'Only run the benchmarks with a name that matches one of these patterns, e.g. "yahoo.*"'
+        parser.add_argument('filter', type=str, nargs='*', help=help_filter)
+        help_rounds = 'Number of timed rounds of every benchmark. Optional, default = the rounds of the benchmark'
+        parser.add_argument('--rounds', type=int, default=None, help=help_rounds)
+        help_scale = 'Factor to multiply the amount of synthetic data with. Optional, default = 1'
+        parser.add_argument('--scale', type=int, default=1, help=help_scale)
+        parser.add_argument('--output', type=str, default=None, help='Write the results as JSON to this file')
+        help_compare = 'Compare the median timings with the results in this JSON file, written earlier by --output, ' \
+                       'and fail if any benchmark regressed'
+        parser.add_argument('--compare', type=str, default=None, help=help_compare)
+        help_threshold = 'Maximum allowed slowdown compared to the baseline. Optional, default = 0.2 (20%%)'
+        parser.add_argument('--threshold', type=float, default=0.2, help=help_threshold)
@@ -0,0 +1,55 @@
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from django.db import models, transaction
+from django.utils import timezone
+
+
+class Ingestion(models.Model):
+    """
+    Time at which data was last written, such that clients can tell whether their copy of the data is still current
+    """
+
+    MARKET_DATA = 'market_data'
+
+    name = models.CharField(primary_key=True, max_length=32)
+    timestamp = models.DateTimeField()
+
+    # Timestamps this process read or wrote recently, by name: (time.monotonic() of the read or write, timestamp)
+    _recent: Dict[str, Tuple[float, Optional[datetime]]] = {}
+
+    def __str__(self):
+        return f'{self.name} ({self.timestamp})'
+
+    @classmethod
+    def record(cls, name: str = MARKET_DATA):
+        """
+        Record that the data with the given name has been written just now
+        """
+
+        timestamp = timezone.now()
+        cls.objects.update_or_create(name=name, defaults={'timestamp': timestamp})
+        # Let this process see the new timestamp right away, but not before the written data itself is visible
+        transaction.on_commit(lambda: cls._recent.__setitem__(name, (time.monotonic(), timestamp)))
+
+    @classmethod
+    def last(cls, name: str = MARKET_DATA, max_age: float = 0) -> Optional[datetime]:
+        """
+        Return the time at which the data with the given name was last written, or None if it never was
+
+        :param name: Name of the data
+        :param max_age: Number of seconds that this process may reuse a timestamp it read or wrote before, instead of
+                        querying the database. Only used outside transactions, since a transaction may see other data
+                        than the rest of the process. Optional, default = 0 (always query).
+        """
+
+        in_transaction = transaction.get_connection().in_atomic_block
+        if max_age and not in_transaction:
+            recent = cls._recent.get(name)
+            if recent and time.monotonic() - recent[0] < max_age:
+                return recent[1]
+        timestamp = cls.objects.filter(name=name).values_list('timestamp', flat=True).first()
+        if not in_transaction:
+            cls._recent[name] = (time.monotonic(), timestamp)
+        return timestamp
@@ -0,0 +1,251 @@
+import math
+from datetime import date, timedelta
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple, Type
+
+import numpy as np
+from django.db import connection, models, transaction
+
+from common.fields import to_ticks
+from common.utils import chunked
+from currency.models import Currency, CurrencyExchangeRate
+from stock.models import Stock, StockPrice
+
+# Currencies of the generated universe in order of how many stocks are listed in them, EUR has no exchange rates
+CURRENCY_SYMBOLS = ['EUR', 'USD', 'GBP', 'JPY', 'CHF', 'CAD', 'AUD', 'SEK', 'HKD', 'NOK', 'DKK', 'SGD', 'CNY', 'KRW',
+                    'INR', 'BRL', 'MXN', 'ZAR', 'NZD', 'PLN', 'CZK', 'HUF', 'TRY', 'ILS', 'TWD', 'THB', 'IDR', 'MYR',
+                    'PHP', 'SAR']
+
+# Highest price that fits in the price fields of StockPrice
+MAX_PRICE = 999999.0
+
+
+class SyntheticUniverse:
+    """
+    Generator of a reproducible universe of stocks and currencies with a daily price history, without any API calls
+
+    The histories look like what Yahoo returns: prices on weekdays only, no prices on the holidays of the exchange of
+    the currency of a stock, stocks that are listed after the start or delisted before the end, trading halts, missing
+    days and rows without close, high or low price. Rows are inserted with plain INSERT statements, since creating
+    model instances for tens of millions of prices would take much longer than inserting them.
+
+    Usage:
+        universe = SyntheticUniverse(nr_stocks=10000, nr_currencies=30, years=30)
+        universe.create()
+    """
+
+    # Fraction of the stocks that are listed after the start date, or delisted before the end date
+    listing_rate = 0.3
+    delisting_rate = 0.02
+    # Average number of trading halts per stock per year, and their maximum length in trading days
+    halts_per_year = 0.1
+    max_halt_days = 30
+    # Fraction of the trading days without a row, and of the rows without close or high and low price
+    missing_rate = 0.002
+    null_close_rate = 0.005
+    null_range_rate = 0.02
+    # Number of exchange holidays per year on top of New Year's Day and Christmas
+    holidays_per_year = 7
+
+    def __init__(self, nr_stocks: int, nr_currencies: int, years: int, end_date: Optional[date] = None,
+                 seed: int = 0, symbol_prefix: str = 'SYN'):
+        """
+        :param nr_stocks: Number of stocks to create
+        :param nr_currencies: Number of currencies to create, including EUR
+        :param years: Number of years of history before the end date
+        :param end_date: Date of the last prices. Optional, default = the last weekday before today
+        :param seed: Seed of the random generator, the same seed generates the same universe. Optional, default = 0
+        :param symbol_prefix: Prefix of the symbols of the stocks. Optional, default = SYN
+        """
+
+        if nr_currencies < 1:
+            raise ValueError('The universe needs at least one currency')
+        self.nr_stocks = nr_stocks
+        self.nr_currencies = nr_currencies
+        self.end_date = end_date or _last_weekday_before(date.today())
+        self.start_date = self.end_date - timedelta(days=round(years * 365.25))
+        self.seed = seed
+        self.symbol_prefix = symbol_prefix
+
+    def create(self, batch_size: int = 100, log: Callable[[str], None] = lambda message: None) -> Tuple[int, int]:
+        """
+        Create the currencies, stocks, exchange rates and stock prices
+
+        Derived data like the latest prices and indicators is not updated.
+
+        :param batch_size: Number of stocks to insert the prices of in a single transaction. Optional, default = 100
+        :param log: Function to report the progress to. Optional, default = no progress reports
+        :return: Number of created exchange rates and stock prices
+        """
+
+        currencies = self._create_currencies()
+        nr_rates = 0
+        with transaction.atomic():
+            for currency in currencies:
+                if currency.symbol != 'EUR':
+                    nr_rates += _insert(CurrencyExchangeRate, ('currency', 'date', 'rate'),
+                                        self.generate_rates(currency))
+        log(f'Created {len(currencies)} currencies with {nr_rates} exchange rates')
+
+        calendars = {currency.pk: self.trading_days(currency.symbol) for currency in currencies}
+        stocks = self._create_stocks(currencies)
+        nr_stocks, nr_prices = 0, 0
+        for batch in chunked(stocks, batch_size):
+            with transaction.atomic():
+                for stock in batch:
+                    nr_prices += _insert(StockPrice, ('stock', 'date', 'open', 'close', 'high', 'low'),
+                                         self.generate_prices(stock, calendars[stock.currency_id]))
+            nr_stocks += len(batch)
+            log(f'Created {nr_stocks} of {len(stocks)} stocks with {nr_prices} prices')
+        return nr_rates, nr_prices
+
+    def trading_days(self, exchange: str) -> np.ndarray:
+        """
+        Return the weekdays between the start and end date on which the exchange is open, as datetime64[D]
+
+        :param exchange: Name of the exchange, every exchange has its own holidays
+        """
+
+        generator = self._generator('calendar', exchange)
+        days = np.arange(np.datetime64(self.start_date), np.datetime64(self.end_date) + 1)
+        # 1970-01-01 was a Thursday
+        weekdays = (days.astype(np.int64) + 3) % 7
+        months = days.astype('datetime64[M]')
+        month_numbers = months.astype(np.int64) % 12 + 1
+        month_days = (days - months).astype(np.int64) + 1
+        fixed_holidays = ((month_numbers == 1) & (month_days == 1)) | ((month_numbers == 12) & (month_days == 25))
+        days = days[(weekdays < 5) & ~fixed_holidays]
+
+        years = len(days) / 261
+        holidays = generator.choice(len(days), size=min(len(days), round(years * self.holidays_per_year)),
+                                    replace=False)
+        return np.delete(days, holidays)
+
+    def generate_rates(self, currency: Currency) -> List[Tuple]:
+        """
+        Return the exchange rates of the currency as (currency_id, date, rate) rows in the format of the database, on
+        all weekdays but New Year's Day and Christmas
+        """
+
+        generator = self._generator('rates', currency.symbol)
+        days = self.trading_days('FX')
+        start = math.exp(generator.uniform(math.log(0.0005), math.log(2)))
+        returns = generator.normal(0, 0.005, len(days))
+        rates = _to_price_column(start * np.exp(np.cumsum(returns)))
+        return list(zip([currency.pk] * len(days), days.astype(str).tolist(), rates.tolist()))
+
+    def generate_prices(self, stock: Stock, calendar: np.ndarray) -> List[Tuple]:
+        """
+        Return the prices of the stock as (stock_id, date, open, close, high, low) rows in the format of the database
+
+        :param stock: Stock to generate the prices of
+        :param calendar: Trading days of the exchange of the stock
+        """
+
+        generator = self._generator('prices', stock.symbol)
+        first, last = 0, len(calendar)
+        if generator.random() < self.listing_rate:
+            first = generator.integers(0, max(1, int(last * 0.9)))
+        if generator.random() < self.delisting_rate:
+            last = generator.integers(first + 1, last + 1)
+        days = calendar[first:last]
+
+        keep = generator.random(len(days)) >= self.missing_rate
+        for _ in range(generator.poisson(self.halts_per_year * len(days) / 261)):
+            halt_start = generator.integers(0, len(days))
+            keep[halt_start:halt_start + generator.integers(1, self.max_halt_days + 1)] = False
+
+        volatility = generator.uniform(0.01, 0.04)
+        start = math.exp(generator.uniform(0, math.log(500)))
+        returns = generator.normal(0.0002, volatility, len(days))
+        close = start * np.exp(np.cumsum(returns))
+        open_ = np.r_[start, close[:-1]] * np.exp(generator.normal(0, volatility / 4, len(days)))
+        high = np.maximum(open_, close) * np.exp(np.abs(generator.normal(0, volatility / 2, len(days))))
+        low = np.minimum(open_, close) * np.exp(-np.abs(generator.normal(0, volatility / 2, len(days))))
+
+        null_close = generator.random(len(days)) < self.null_close_rate
+        null_range = generator.random(len(days)) < self.null_range_rate
+        days, null_close, null_range = days[keep], null_close[keep], null_range[keep]
+        open_, close, high, low = (_to_price_column(prices[keep]) for prices in (open_, close, high, low))
+        close[null_close] = None
+        high[null_range] = None
+        low[null_range] = None
+        return list(zip([stock.pk] * len(days), days.astype(str).tolist(), open_.tolist(), close.tolist(),
+                        high.tolist(), low.tolist()))
+
+    def _create_currencies(self) -> List[Currency]:
+        symbols = CURRENCY_SYMBOLS[:self.nr_currencies]
+        symbols += [f'X{i:03}' for i in range(self.nr_currencies - len(symbols))]
+        Currency.objects.bulk_create([
+            Currency(symbol=symbol, name=f'Synthetic currency {symbol}') for symbol in symbols
+        ], ignore_conflicts=True)
+        return list(Currency.objects.filter(symbol__in=symbols).order_by('pk'))
+
+    def _create_stocks(self, currencies: Sequence[Currency]) -> List[Stock]:
+        """
+        Create the stocks, with most stocks in the first currencies like in a real universe
+        """
+
+        generator = self._generator('stocks', '')
+        weights = 1 / np.arange(1, len(currencies) + 1)
+        currency_indexes = generator.choice(len(currencies), size=self.nr_stocks, p=weights / weights.sum())
+        symbols = [f'{self.symbol_prefix}{i:05}' for i in range(self.nr_stocks)]
+        for batch in chunked(list(zip(symbols, currency_indexes)), 1000):
+            Stock.objects.bulk_create([
+                Stock(symbol=symbol, name=f'Synthetic stock {symbol}', currency=currencies[index])
+                for symbol, index in batch
+            ])
+        # SQLite does not return the primary keys of bulk created rows
+        return list(Stock.objects.filter(symbol__startswith=self.symbol_prefix).order_by('pk'))
+
+    def _generator(self, purpose: str, name: str) -> np.random.Generator:
+        """
+        Return a random generator that only depends on the seed, the purpose and the name, such that every stock gets
+        the same history regardless of the other stocks in the universe
+        """
+
+        return np.random.default_rng([self.seed, *f'{purpose}:{name}'.encode()])
+
+
+def _to_price_column(prices: np.ndarray) -> np.ndarray:
+    """
+    Convert the prices to the ticks that a FixedPointField with 4 decimal places stores, as Python ints
+    """
+
+    return to_ticks(np.clip(prices, 0.0001, MAX_PRICE), decimal_places=4).astype(object)
+
+
+def _insert(model: Type[models.Model], field_names: Sequence[str], rows: Iterable[Tuple],
+            batch_size: int = 10000) -> int:
+    """
+    Insert the rows into the table of the model with plain INSERT statements
+
+    The database has no defaults, so the other fields with a default are inserted with their default value.
+
+    :param model: Model of the table
+    :param field_names: Names of the fields of the values in the rows
+    :param rows: Values of the rows, in the format of the database, e.g. dates as YYYY-MM-DD
+    :return: Number of inserted rows
+    """
+
+    quote = connection.ops.quote_name
+    fields = [model._meta.get_field(name) for name in field_names]
+    defaults = [field for field in model._meta.concrete_fields if field not in fields and field.has_default()]
+    default_values = tuple(field.get_db_prep_save(field.get_default(), connection) for field in defaults)
+    columns = ', '.join(quote(field.column) for field in fields + defaults)
+    placeholders = ', '.join(['%s'] * len(fields + defaults))
+    sql = f'INSERT INTO {quote(model._meta.db_table)} ({columns}) VALUES ({placeholders})'
+    nr_rows = 0
+    with connection.cursor() as cursor:
+        for batch in chunked(rows, batch_size):
+            if default_values:
+                batch = [tuple(row) + default_values for row in batch]
+            cursor.executemany(sql, batch)
+            nr_rows += len(batch)
+    return nr_rows
+
+
+def _last_weekday_before(day: date) -> date:
+    day -= timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day
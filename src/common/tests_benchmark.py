@@ -0,0 +1,29 @@
+from django.test import TestCase
+
+from common.benchmark import Benchmark, compare, discover_benchmarks, run_benchmark
+from currency.models import Currency
+
+
+class BenchmarkTestCase(TestCase):
+    def test_run_benchmark(self):
+        def setup(scale: int):
+            Currency.objects.bulk_create([Currency(symbol=f'C{i}', name=f'Currency {i}') for i in range(scale)])
+            yield lambda: self.assertEqual(Currency.objects.count(), scale)
+            calls.append(scale)
+
+        calls = []
+        result = run_benchmark(Benchmark(name='count', setup=setup, rounds=3), scale=2)
+        self.assertEqual(result.rounds, 3)
+        self.assertEqual(calls, [2, 2, 2, 2])
+        self.assertLessEqual(result.min, result.median)
+        self.assertFalse(Currency.objects.exists())
+
+    def test_compare(self):
+        baseline = {'fast': {'median': 1.0}, 'slow': {'median': 1.0}}
+        results = {'fast': {'median': 1.1}, 'slow': {'median': 1.5}, 'new': {'median': 2.0}}
+        self.assertEqual(compare(results, baseline, 0.2), ['slow: 1.0000s -> 1.5000s (+50%)'])
+
+    def test_discover_benchmarks(self):
+        benchmarks = discover_benchmarks()
+        self.assertIn('yahoo.parse_stock_csv', benchmarks)
+        self.assertIn('screener.screen', benchmarks)
@@ -0,0 +1,64 @@
+from datetime import date
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from common.cache import market_data_cache
+from common.models import Ingestion
+from currency.models import Currency, CurrencyExchangeRate, LatestExchangeRate
+from stock.models import LatestStockPrice, Stock, StockPrice
+
+
+class MarketDataCacheTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usd = Currency.objects.create(symbol='USD', name='US dollar')
+        CurrencyExchangeRate.objects.create(currency=cls.usd, date=date(2020, 10, 16), rate=Decimal('0.8'))
+        LatestExchangeRate.refresh(Currency.objects.all())
+        cls.stock = Stock.objects.create(symbol='MIK', name='The Michaels Company', currency=cls.usd)
+        StockPrice.objects.create(stock=cls.stock, date=date(2020, 10, 16), open=Decimal(10))
+        LatestStockPrice.refresh(Stock.objects.all())
+
+    def setUp(self):
+        cache.clear()
+
+    def test_nothing_is_cached_without_ingestion(self):
+        calls = []
+        for _ in range(2):
+            self.assertEqual(market_data_cache.get_or_set('key', lambda: calls.append(1) or len(calls)), len(calls))
+        self.assertEqual(len(calls), 2)
+
+    def test_values_are_cached_until_next_ingestion(self):
+        Ingestion.record()
+        stock = Stock.objects.get(pk=self.stock.pk)
+        with self.assertNumQueries(2):
+            self.assertEqual(stock.price, Decimal('10.00'))
+        stock = Stock.objects.get(pk=self.stock.pk)
+        # Only the version is checked, inside a transaction it is never reused
+        with self.assertNumQueries(1):
+            self.assertEqual(stock.price_in_euro, Decimal('8.00'))
+
+        LatestStockPrice.objects.filter(stock=self.stock).update(price=Decimal(12), price_in_euro=Decimal('9.6'))
+        self.assertEqual(Stock.objects.get(pk=self.stock.pk).price, Decimal('10.00'))
+        Ingestion.record()
+        self.assertEqual(Stock.objects.get(pk=self.stock.pk).price, Decimal('12.00'))
+
+    def test_missing_rates_are_cached(self):
+        Ingestion.record()
+        eur = Currency.objects.create(symbol='EUR', name='Euro')
+        self.assertEqual(Currency.objects.get(pk=eur.pk).rate, Decimal(1))
+        eur = Currency.objects.get(pk=eur.pk)
+        with self.assertNumQueries(1):
+            self.assertIsNone(eur.latest_rate_date)
+
+    def test_local_values_are_only_kept_for_the_current_version(self):
+        Ingestion.record()
+        value = object()
+        self.assertIs(market_data_cache.get_or_set_local('key', lambda: value), value)
+        self.assertIs(market_data_cache.get_or_set_local('key', object), value)
+
+        Ingestion.record()
+        market_data_cache.get_or_set_local('other', object)
+        self.assertNotIn('key', market_data_cache._local)
+        self.assertIsNot(market_data_cache.get_or_set_local('key', object), value)
@@ -0,0 +1,64 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+
+from common.db import CommitBatcher
+from currency.models import Currency
+from stock.benchmarks import create_stocks_with_prices
+
+
+class SqlitePragmasTestCase(TestCase):
+    def test_pragmas_are_set_on_new_connections(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], -64000)
+
+
+class CommitBatcherTestCase(TransactionTestCase):
+    def test_units_are_committed_in_batches(self):
+        with self.assertRaises(ValueError):
+            with CommitBatcher(commit_size=2) as batcher:
+                for symbol in ['USD', 'GBP', 'JPY']:
+                    self.assertTrue(connection.in_atomic_block)
+                    Currency.objects.create(symbol=symbol, name=symbol)
+                    batcher.done()
+                with transaction.atomic():
+                    Currency.objects.create(symbol='CHF', name='Swiss franc')
+                raise ValueError('Interrupted')
+
+        # The first batch was committed, the second one was rolled back
+        self.assertEqual(set(Currency.objects.values_list('symbol', flat=True)), {'USD', 'GBP'})
+
+    def test_commit_commits_the_units_that_are_done(self):
+        with self.assertRaises(ValueError):
+            with CommitBatcher(commit_size=10) as batcher:
+                Currency.objects.create(symbol='USD', name='US dollar')
+                batcher.done()
+                batcher.commit()
+                self.assertTrue(connection.in_atomic_block)
+                Currency.objects.create(symbol='GBP', name='British pound')
+                raise ValueError('Interrupted')
+
+        self.assertEqual(list(Currency.objects.values_list('symbol', flat=True)), ['USD'])
+
+    def test_commit_size_of_one_does_not_start_transactions(self):
+        with CommitBatcher() as batcher:
+            self.assertFalse(connection.in_atomic_block)
+            batcher.done()
+            self.assertFalse(connection.in_atomic_block)
+
+
+class ExplainQueriesTestCase(TestCase):
+    def test_core_queries_do_not_scan_all_prices(self):
+        # The query planner only knows how selective the indexes are after ANALYZE, like on a production database
+        create_stocks_with_prices(nr_stocks=20, nr_days=100)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        out = StringIO()
+        call_command('explain_queries', '--check', stdout=out)
+        self.assertIn('stockprice_date_stock_idx', out.getvalue())
@@ -0,0 +1,128 @@
+import asyncio
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+import httpx
+from django.test import SimpleTestCase
+from requests import RequestException
+
+from common.async_api import AsyncBaseService
+from common.external_api import BaseService, JitteredRetry
+
+
+class FlakyRequestHandler(BaseHTTPRequestHandler):
+    """
+    Respond with 429 Too Many Requests to every first call of a path, and with 200 OK afterwards
+    """
+
+    seen_paths = set()
+
+    def do_GET(self):
+        if self.path in self.seen_paths:
+            self.send_response(200)
+            body = b'OK'
+        else:
+            self.seen_paths.add(self.path)
+            self.send_response(429)
+            body = b'Too Many Requests'
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TextService(BaseService):
+    response_in_json = False
+
+
+class NoRetryTextService(TextService):
+    retry_status_codes = ()
+
+
+class AsyncTextService(AsyncBaseService):
+    service = TextService
+
+
+class AsyncNoRetryTextService(AsyncBaseService):
+    service = NoRetryTextService
+
+
+class BaseServiceTestCase(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('localhost', 0), FlakyRequestHandler)
+        Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f'http://localhost:{cls.server.server_port}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def test_session_is_shared_per_service(self):
+        self.assertIs(TextService._get_session(), TextService._get_session())
+        self.assertIsNot(TextService._get_session(), BaseService._get_session())
+
+    def test_session_has_the_settings_of_the_service(self):
+        class SmallPoolService(TextService):
+            pool_size = 2
+
+        BaseService._get_session()
+        SmallPoolService.set_pool_size(3)
+        self.addCleanup(lambda: BaseService._sessions.pop(SmallPoolService).close())
+        adapter = SmallPoolService._get_session().get_adapter(self.url)
+        self.assertEqual(adapter._pool_maxsize, 3)
+        self.assertEqual(adapter.max_retries.status_forcelist, TextService.retry_status_codes)
+        self.assertEqual(BaseService.pool_size, 10)
+
+    def test_retry_on_too_many_requests(self):
+        response = TextService._make_get_call(f'{self.url}/retry')
+        self.assertEqual(response, 'OK')
+
+    def test_streaming_get_call_yields_lines(self):
+        lines = TextService._make_streaming_get_call(f'{self.url}/stream')
+        self.assertEqual(list(lines), ['OK'])
+
+    def test_jittered_backoff_is_bounded(self):
+        retry = JitteredRetry(total=5, backoff_factor=1)
+        for _ in range(3):
+            retry = retry.increment(method='GET', url='/')
+        for _ in range(100):
+            self.assertTrue(0 <= retry.get_backoff_time() <= 4)
+
+    def test_async_calls_are_retried_and_yielded_in_the_calling_thread(self):
+        service = AsyncTextService(max_concurrency=2)
+        paths = ['/async-1', '/async-2', '/async-3']
+        results = list(service.run_in_background(lambda path: service._make_get_call(f'{self.url}{path}'), paths))
+        self.assertEqual(sorted((path, response, error) for path, response, error in results),
+                         [(path, 'OK', None) for path in paths])
+
+    def test_async_retries_wait_for_retry_after(self):
+        retry = TextService._create_retry().increment(method='GET', url='/')
+        delay = AsyncBaseService._get_retry_delay
+        self.assertEqual(delay(retry, httpx.Response(429, headers={'Retry-After': '7'})), 7)
+        self.assertLessEqual(delay(retry, httpx.Response(429, headers={'Retry-After': 'soon'})), 1)
+        self.assertLessEqual(delay(retry, httpx.Response(503)), 1)
+        self.assertLessEqual(delay(retry, None), 1)
+
+    def test_on_wait_is_called_before_waiting_for_a_result(self):
+        async def slow(item):
+            await asyncio.sleep(0.1)
+            return item
+
+        waits = []
+        results = list(AsyncTextService().run_in_background(slow, [1], on_wait=lambda: waits.append(True)))
+        self.assertEqual(results, [(1, 1, None)])
+        self.assertTrue(waits)
+
+    def test_async_errors_are_yielded_per_item(self):
+        service = AsyncNoRetryTextService()
+        (path, response, error), = service.run_in_background(
+            lambda path: service._make_get_call(f'{self.url}{path}'), ['/async-error'])
+        self.assertIsNone(response)
+        self.assertIsInstance(error, RequestException)
+        self.assertIn('429', str(error))
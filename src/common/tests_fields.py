@@ -0,0 +1,47 @@
+from datetime import date
+from decimal import Decimal
+
+import numpy as np
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test import TestCase
+
+from common.fields import FixedPointField, values_arrays
+from currency.models import Currency
+from stock.models import Stock, StockPrice
+
+
+class FixedPointFieldTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        currency = Currency.objects.create(symbol='USD', name='US dollar')
+        cls.stock = Stock.objects.create(symbol='MIK', name='The Michaels Company', currency=currency)
+        StockPrice.objects.create(stock=cls.stock, date=date(2020, 10, 15), open=Decimal('12.3456'), close=None)
+        StockPrice.objects.create(stock=cls.stock, date=date(2020, 10, 16), open='10.5', close=Decimal('11.00005'))
+
+    def test_round_trip(self):
+        price = StockPrice.objects.get(date=date(2020, 10, 16))
+        self.assertEqual(price.open, Decimal('10.5000'))
+        self.assertEqual(str(price.close), '11.0000')
+        self.assertEqual(StockPrice.objects.filter(open__gt=Decimal('10.5')).count(), 1)
+
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT open FROM stock_stockprice WHERE date = %s', ['2020-10-15'])
+            self.assertEqual(cursor.fetchone(), (123456,))
+
+    def test_validation(self):
+        field = FixedPointField(max_digits=6, decimal_places=4)
+        self.assertEqual(field.clean('1.5', None), Decimal('1.5000'))
+        with self.assertRaises(ValidationError):
+            field.clean('100', None)
+        with self.assertRaises(ValidationError):
+            field.clean('abc', None)
+
+    def test_values_arrays(self):
+        dates, open_, close = values_arrays(StockPrice.objects.order_by('date'), 'date', 'open', 'close')
+        np.testing.assert_array_equal(dates, np.array(['2020-10-15', '2020-10-16'], dtype='datetime64[D]'))
+        np.testing.assert_array_equal(open_, [12.3456, 10.5])
+        np.testing.assert_array_equal(close, [np.nan, 11.0])
+
+        stock_ids, = values_arrays(StockPrice.objects.filter(pk__in=[]), 'stock_id')
+        self.assertEqual(len(stock_ids), 0)
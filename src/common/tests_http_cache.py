@@ -0,0 +1,139 @@
+import os
+import tempfile
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+from django.test import SimpleTestCase, override_settings
+from requests import RequestException
+
+from common.async_api import AsyncBaseService
+from common.external_api import BaseService
+from common.http_cache import ResponseCache
+
+
+class VersionedRequestHandler(BaseHTTPRequestHandler):
+    """
+    Respond with a body and ETag per path, or with 304 Not Modified if the client already has the current version
+    """
+
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        etag = '"v1"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        body = f'Response to {self.path}\n'.encode() * 100
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class CachedService(BaseService):
+    response_in_json = False
+    cache_max_age = (
+        (r'/fresh', 3600),
+        (r'/stale', 0),
+    )
+
+
+class AsyncCachedService(AsyncBaseService):
+    service = CachedService
+
+
+class ResponseCacheTestCase(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('localhost', 0), VersionedRequestHandler)
+        Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f'http://localhost:{cls.server.server_port}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        VersionedRequestHandler.requests.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        cache_settings = override_settings(HTTP_CACHE_DIR=self.directory, HTTP_CACHE_MODE='on')
+        cache_settings.enable()
+        self.addCleanup(cache_settings.disable)
+
+    def test_fresh_responses_are_served_from_the_cache(self):
+        first = CachedService._make_get_call(f'{self.url}/fresh', params={'b': 2, 'a': 1})
+        second = CachedService._make_get_call(f'{self.url}/fresh', params={'a': 1, 'b': 2})
+        lines = list(CachedService._make_streaming_get_call(f'{self.url}/fresh', params={'a': 1, 'b': 2}))
+
+        self.assertEqual(first, second)
+        self.assertEqual(lines[0], 'Response to /fresh?b=2&a=1')
+        self.assertEqual(len(VersionedRequestHandler.requests), 1)
+
+    def test_stale_responses_are_revalidated(self):
+        first = CachedService._make_get_call(f'{self.url}/stale')
+        second = CachedService._make_get_call(f'{self.url}/stale')
+
+        self.assertEqual(first, second)
+        self.assertEqual(VersionedRequestHandler.requests, ['/stale', '/stale'])
+
+    def test_async_calls_share_the_cache(self):
+        service = AsyncCachedService()
+        expected = CachedService._make_get_call(f'{self.url}/fresh')
+        (_, response, error), = service.run_in_background(
+            lambda path: service._make_get_call(f'{self.url}{path}'), ['/fresh'])
+        self.assertIsNone(error)
+        self.assertEqual(response, expected)
+        self.assertEqual(VersionedRequestHandler.requests, ['/fresh'])
+
+        with override_settings(HTTP_CACHE_MODE='replay'):
+            (_, response, error), = service.run_in_background(
+                lambda path: service._make_get_call(f'{self.url}{path}'), ['/other'])
+        self.assertIn('replay mode', str(error))
+
+    def test_responses_of_other_endpoints_are_not_cached(self):
+        CachedService._make_get_call(f'{self.url}/other')
+        CachedService._make_get_call(f'{self.url}/other')
+        self.assertEqual(len(VersionedRequestHandler.requests), 2)
+
+    def test_replay_mode_makes_no_calls(self):
+        expected = CachedService._make_get_call(f'{self.url}/stale')
+        with override_settings(HTTP_CACHE_MODE='replay'):
+            self.assertEqual(CachedService._make_get_call(f'{self.url}/stale'), expected)
+            with self.assertRaisesMessage(RequestException, 'replay mode'):
+                CachedService._make_get_call(f'{self.url}/fresh')
+        self.assertEqual(VersionedRequestHandler.requests, ['/stale'])
+
+    def test_responses_are_compressed(self):
+        text = CachedService._make_get_call(f'{self.url}/fresh')
+        file_names = [os.path.join(root, name) for root, _, names in os.walk(self.directory) for name in names]
+        self.assertEqual(len(file_names), 1)
+        self.assertLess(os.path.getsize(file_names[0]), len(text) / 5)
+
+    def test_least_recently_used_responses_are_evicted(self):
+        cache = ResponseCache(self.directory, max_size=10000)
+        keys = [cache.get_key(f'{self.url}/{i}') for i in range(5)]
+        for i, key in enumerate(keys[:4]):
+            cache.put(key, CachedService._get_session().get(f'{self.url}/{i}'))
+            # Make sure the times of last use differ
+            time.sleep(0.01)
+        cache.get(keys[0])
+
+        cache.max_size = cache._size / 4 * 3.5
+        cache.put(keys[4], CachedService._get_session().get(f'{self.url}/4'))
+
+        self.assertEqual([cache.get(key) is not None for key in keys], [True, False, False, True, True])
+        self.assertLessEqual(cache._size, cache.max_size)
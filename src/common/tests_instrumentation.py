@@ -0,0 +1,66 @@
+import time
+
+from django.test import TestCase
+
+from common.instrumentation import Instrumentation
+from currency.models import Currency
+
+
+class InstrumentationTestCase(TestCase):
+    def setUp(self):
+        self.instrumentation = Instrumentation()
+
+    def test_nested_phases_record_their_own_time(self):
+        with self.instrumentation.symbol('MIK'):
+            with self.instrumentation.phase('store'):
+                time.sleep(0.01)
+                with self.instrumentation.phase('write'):
+                    time.sleep(0.02)
+            with self.instrumentation.phase('write'):
+                pass
+
+        record, = self.instrumentation.records()
+        self.assertEqual(record['symbol'], 'MIK')
+        store, write = record['phases']['store'], record['phases']['write']
+        self.assertGreaterEqual(write['seconds'], 0.02)
+        self.assertGreaterEqual(store['seconds'], 0.01)
+        self.assertLess(store['seconds'], 0.02)
+        self.assertEqual((store['calls'], write['calls']), (1, 2))
+
+    def test_timed_iter(self):
+        def parse():
+            for i in range(3):
+                with self.instrumentation.phase('download'):
+                    pass
+                yield i
+
+        with self.instrumentation.symbol('MIK'):
+            items = list(self.instrumentation.timed_iter('parse', parse(), counter='rows_parsed'))
+
+        self.assertEqual(items, [0, 1, 2])
+        phases, counters = self.instrumentation.summary()
+        self.assertEqual(phases['parse'].calls, 1)
+        self.assertEqual(phases['download'].calls, 3)
+        self.assertEqual(counters, {'rows_parsed': 3})
+
+    def test_count_queries(self):
+        with self.instrumentation.count_queries():
+            with self.instrumentation.phase('write'):
+                Currency.objects.create(symbol='USD', name='US dollar')
+            Currency.objects.count()
+
+        phases, _ = self.instrumentation.summary()
+        self.assertEqual(phases['write'].queries, 1)
+        self.assertEqual(phases['other'].queries, 1)
+
+    def test_prometheus(self):
+        with self.instrumentation.symbol('MIK'):
+            self.instrumentation.count('bytes_downloaded', 1024)
+        with self.instrumentation.symbol('MOMO'):
+            self.instrumentation.count('bytes_downloaded', 1024)
+            with self.instrumentation.phase('download'):
+                pass
+
+        text = self.instrumentation.to_prometheus('fetch')
+        self.assertIn('stockscreener_ingestion_bytes_downloaded{command="fetch"} 2048\n', text)
+        self.assertIn('stockscreener_ingestion_phase_calls{command="fetch",phase="download"} 1\n', text)
@@ -0,0 +1,37 @@
+from datetime import date
+
+import numpy as np
+from django.test import TestCase
+
+from common.synthetic import SyntheticUniverse
+from currency.models import Currency, CurrencyExchangeRate
+from stock.models import Stock, StockPrice
+
+
+class SyntheticUniverseTestCase(TestCase):
+    def test_create(self):
+        universe = SyntheticUniverse(nr_stocks=50, nr_currencies=4, years=2, end_date=date(2020, 10, 16))
+        nr_rates, nr_prices = universe.create()
+
+        self.assertEqual(Stock.objects.count(), 50)
+        self.assertEqual(list(Currency.objects.values_list('symbol', flat=True)), ['EUR', 'GBP', 'JPY', 'USD'])
+        self.assertEqual(CurrencyExchangeRate.objects.count(), nr_rates)
+        self.assertEqual(StockPrice.objects.count(), nr_prices)
+        self.assertFalse(CurrencyExchangeRate.objects.filter(currency__symbol='EUR').exists())
+
+        prices = StockPrice.objects.all()
+        self.assertFalse(prices.filter(date__week_day__in=[1, 7]).exists())
+        self.assertFalse(prices.filter(date=date(2019, 12, 25)).exists())
+        self.assertTrue(prices.filter(close__isnull=True).exists())
+        self.assertTrue(prices.filter(high__isnull=True, low__isnull=True).exists())
+        self.assertEqual(prices.latest('date').date, date(2020, 10, 16))
+        # Stocks that are listed later have fewer prices
+        counts = {stock.prices.count() for stock in Stock.objects.all()}
+        self.assertGreater(len(counts), 1)
+
+    def test_reproducible(self):
+        universe = SyntheticUniverse(nr_stocks=1, nr_currencies=1, years=1, end_date=date(2020, 10, 16))
+        stock = Stock(pk=1, symbol='SYN00000')
+        self.assertEqual(universe.generate_prices(stock, universe.trading_days('EUR')),
+                         universe.generate_prices(stock, universe.trading_days('EUR')))
+        self.assertFalse(np.array_equal(universe.trading_days('EUR'), universe.trading_days('USD')))
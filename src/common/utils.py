@@ -1,9 +1,15 @@
+import queue
+import threading
+from concurrent.futures import Executor
 from datetime import date, datetime
 from decimal import Decimal
-from typing import Optional
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, TypeVar
 
 from django.utils.dateparse import parse_date
 
+T = TypeVar('T')
+
 
 def date_str_to_timestamp(date_str: Optional[str]) -> Optional[int]:
     if not date_str:
@@ -30,3 +36,88 @@ def round_currency(amount: Decimal) -> Decimal:
         return amount.quantize(Decimal('.01'))
     else:
         return amount.quantize(Decimal('.0001'))
+
+
+def chunked(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    """
+    Split the items into consecutive chunks of at most the given size
+
+    Only one chunk is held in memory at a time, so the items can be a generator of arbitrary length.
+    """
+
+    iterator = iter(items)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+class BackgroundIterator(Iterator[T]):
+    """
+    Iterator over items that are produced by an executor, with at most max_size items waiting to be consumed
+
+    The producer blocks while max_size items are waiting, so memory usage does not depend on the number of items.
+    An exception of the producer is raised by the iterator once the items before it are consumed.
+
+    Usage:
+        with ThreadPoolExecutor() as executor:
+            batches = BackgroundIterator(executor, chunked(download(), 1000), max_size=2)
+            for batch in batches:
+                store(batch)
+    """
+
+    _END = object()
+
+    def __init__(self, executor: Executor, items: Iterable[T], max_size: int = 1):
+        """
+        :param executor: Executor to iterate over the items with
+        :param items: Items to produce, usually a generator that does the work when the next item is requested
+        :param max_size: Maximum number of produced items that wait to be consumed. Optional, default = 1
+        """
+
+        self._queue = queue.Queue(max_size)
+        self._closed = threading.Event()
+        self._ended = False
+        self._future = executor.submit(self._produce, items)
+
+    @property
+    def ready(self) -> bool:
+        """
+        Whether the next item, or the end of the items, can be consumed without waiting for the producer
+        """
+
+        return self._ended or not self._queue.empty()
+
+    def __next__(self) -> T:
+        if self._ended:
+            raise StopIteration
+        item = self._queue.get()
+        if item is self._END:
+            self._ended = True
+            # Raises the exception of the producer, if any
+            self._future.result()
+            raise StopIteration
+        return item
+
+    def close(self):
+        """
+        Stop producing items, and wait until the producer has stopped
+        """
+
+        self._closed.set()
+        while not self._ended:
+            self._ended = self._queue.get() is self._END
+
+    def _produce(self, items: Iterable[T]):
+        iterator = iter(items)
+        try:
+            while not self._closed.is_set():
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                self._queue.put(item)
+        finally:
+            if hasattr(iterator, 'close'):
+                iterator.close()
+            self._queue.put(self._END)
@@ -1,12 +1,17 @@
 from django.contrib import admin
 
-from currency.models import Currency, CurrencyExchangeRate
+from common.admin import PaginatedTabularInline
+from common.models import Ingestion
+from currency.models import Currency, CurrencyExchangeRate, LatestExchangeRate
+from stock.models import LatestStockPrice, Stock
 
 
-class CurrencyExchangeRateInline(admin.TabularInline):
+class CurrencyExchangeRateInline(PaginatedTabularInline):
     model = CurrencyExchangeRate
     readonly_fields = ('date', 'rate')
     extra = 0
+    ordering = ('-date',)
+    page_param = 'rates_page'
 
 
 @admin.register(Currency)
@@ -14,3 +19,12 @@ class CurrencyAdmin(admin.ModelAdmin):
     list_display = ('symbol', 'name', 'rate', 'latest_rate_date')
     readonly_fields = ('symbol', 'name', 'rate')
     inlines = (CurrencyExchangeRateInline,)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_latest_rate()
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        LatestExchangeRate.refresh(Currency.objects.filter(pk=form.instance.pk))
+        LatestStockPrice.refresh(Stock.objects.filter(currency=form.instance))
+        Ingestion.record()
@@ -0,0 +1,55 @@
+# Generated by Django 3.1.2 on 2026-10-18 16:55
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def remove_duplicates(apps, schema_editor):
+    """
+    Keep only the newest currency per symbol and the newest exchange rate of a currency per date, such that the unique
+    constraints can be added. Stocks and exchange rates of a removed currency move to the currency that is kept.
+    """
+
+    Currency = apps.get_model('currency', 'Currency')
+    CurrencyExchangeRate = apps.get_model('currency', 'CurrencyExchangeRate')
+    Stock = apps.get_model('stock', 'Stock')
+
+    duplicates = Currency.objects.order_by().values('symbol').annotate(newest=Max('id'), count=Count('id')).filter(
+        count__gt=1)
+    for duplicate in duplicates:
+        removed = Currency.objects.filter(symbol=duplicate['symbol']).exclude(id=duplicate['newest'])
+        Stock.objects.filter(currency__in=removed).update(currency_id=duplicate['newest'])
+        CurrencyExchangeRate.objects.filter(currency__in=removed).update(currency_id=duplicate['newest'])
+        removed.delete()
+
+    duplicates = CurrencyExchangeRate.objects.order_by().values('currency', 'date').annotate(
+        newest=Max('id'), count=Count('id')).filter(count__gt=1)
+    for duplicate in duplicates:
+        CurrencyExchangeRate.objects.filter(currency=duplicate['currency'], date=duplicate['date']).exclude(
+            id=duplicate['newest']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('currency', '0001_initial'),
+        # The stocks of duplicate currencies are moved
+        ('stock', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AlterModelOptions(
+            name='currencyexchangerate',
+            options={'ordering': ('currency', '-date')},
+        ),
+        migrations.AlterField(
+            model_name='currency',
+            name='symbol',
+            field=models.CharField(help_text='Symbol to look up the currency on e.g. Google', max_length=16, unique=True),
+        ),
+        migrations.AlterUniqueTogether(
+            name='currencyexchangerate',
+            unique_together={('currency', 'date')},
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.1.2 on 2026-10-18 17:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_latest_exchange_rates(apps, schema_editor):
+    Currency = apps.get_model('currency', 'Currency')
+    CurrencyExchangeRate = apps.get_model('currency', 'CurrencyExchangeRate')
+    LatestExchangeRate = apps.get_model('currency', 'LatestExchangeRate')
+    for currency in Currency.objects.all():
+        latest = CurrencyExchangeRate.objects.filter(currency=currency).order_by('-date').first()
+        if latest:
+            LatestExchangeRate.objects.create(currency=currency, date=latest.date, rate=latest.rate)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('currency', '0002_unique_rate_per_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatestExchangeRate',
+            fields=[
+                ('currency', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='latest_rate', serialize=False, to='currency.currency')),
+                ('date', models.DateField()),
+                ('rate', models.DecimalField(decimal_places=4, help_text='Value of 1 unit of the currency in EUR', max_digits=10)),
+            ],
+        ),
+        migrations.RunPython(fill_latest_exchange_rates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 3.1.2 on 2026-10-18 17:38
+
+import common.fields
+from common.fields import convert_to_fixed_point
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('currency', '0003_latest_exchange_rate'),
+    ]
+
+    operations = convert_to_fixed_point('currency_currencyexchangerate', ['rate'], 10, 4, [
+        migrations.AlterField(
+            model_name='currencyexchangerate',
+            name='rate',
+            field=common.fields.FixedPointField(decimal_places=4, help_text='Value of 1 unit of the currency in EUR', max_digits=10),
+        ),
+    ])
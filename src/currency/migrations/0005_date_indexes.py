@@ -0,0 +1,17 @@
+# Generated by Django 3.1.2 on 2026-10-18 17:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('currency', '0004_fixed_point_prices'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='currencyexchangerate',
+            index=models.Index(fields=['date', 'currency'], name='rate_date_currency_idx'),
+        ),
+    ]
@@ -3,6 +3,22 @@ from decimal import Decimal
 from typing import Optional
 
 from django.db import models
+from django.db.models import OuterRef, Subquery
+
+from common.cache import market_data_cache
+from common.db import bulk_upsert
+from common.fields import FixedPointField
+
+
+class CurrencyQuerySet(models.QuerySet):
+    def with_latest_rate(self) -> 'CurrencyQuerySet':
+        """
+        Join the currencies with their latest exchange rate
+
+        This avoids an extra query per currency when the rate properties of many currencies are needed.
+        """
+
+        return self.select_related('latest_rate')
 
 
 class Currency(models.Model):
@@ -12,6 +28,9 @@ class Currency(models.Model):
     name = models.CharField(max_length=64)
 
     rates: models.QuerySet['CurrencyExchangeRate']  # Dynamically added by class CurrencyExchangeRate
+    latest_rate: 'LatestExchangeRate'  # Dynamically added by class LatestExchangeRate
+
+    objects = CurrencyQuerySet.as_manager()
 
     class Meta:
         verbose_name_plural = 'currencies'
@@ -22,20 +41,31 @@ class Currency(models.Model):
 
     @property
     def rate(self) -> Decimal:
-        first_rate = self.rates.first()
-        if first_rate:
-            return first_rate.rate
-        else:
+        self._load_latest_rate()
+        try:
+            return self.latest_rate.rate
+        except LatestExchangeRate.DoesNotExist:
             return Decimal(1)
 
     @property
     def latest_rate_date(self) -> Optional[date]:
-        first_rate = self.rates.first()
-        if first_rate:
-            return first_rate.date
-        else:
+        self._load_latest_rate()
+        try:
+            return self.latest_rate.date
+        except LatestExchangeRate.DoesNotExist:
             return None
 
+    def _load_latest_rate(self):
+        """
+        Load the latest rate from the market data cache, unless it was already joined by with_latest_rate
+        """
+
+        related = Currency.latest_rate.related
+        if not related.is_cached(self):
+            latest_rate = market_data_cache.get_or_set(
+                f'latest_rate:{self.pk}', lambda: LatestExchangeRate.objects.filter(currency_id=self.pk).first())
+            related.set_cached_value(self, latest_rate)
+
 
 class CurrencyExchangeRate(models.Model):
     """
@@ -43,14 +73,64 @@ class CurrencyExchangeRate(models.Model):
     """
 
     help_rate = 'Value of 1 unit of the currency in EUR'
+    help_provisional = 'Whether the rate is an intraday quote, to be replaced by the rate of the day in the next ' \
+                       'download of the history'
 
     currency = models.ForeignKey(Currency, related_name='rates', on_delete=models.CASCADE)
     date = models.DateField()
-    rate = models.DecimalField(max_digits=10, decimal_places=4, help_text=help_rate)
+    rate = FixedPointField(max_digits=10, decimal_places=4, help_text=help_rate)
+    provisional = models.BooleanField(default=False, help_text=help_provisional)
 
     class Meta:
+        # Like StockPrice, the unique index serves the rates of a currency and the index on date the rates of all
+        # currencies on or since a date
         ordering = ('currency', '-date')
         unique_together = ('currency', 'date')
+        indexes = [
+            models.Index(fields=['date', 'currency'], name='rate_date_currency_idx'),
+        ]
 
     def __str__(self):
         return f'{self.rate} ({self.date})'
+
+
+class LatestExchangeRate(models.Model):
+    """
+    Copy of the latest CurrencyExchangeRate of a currency
+
+    This table is kept up to date by calling refresh after exchange rates have been written, such that the current
+    rate of a currency can be read without sorting all its exchange rates.
+    """
+
+    currency = models.OneToOneField(Currency, related_name='latest_rate', on_delete=models.CASCADE, primary_key=True)
+    date = models.DateField()
+    rate = models.DecimalField(max_digits=10, decimal_places=4, help_text=CurrencyExchangeRate.help_rate)
+
+    def __str__(self):
+        return f'{self.rate} ({self.date})'
+
+    @classmethod
+    def refresh(cls, currencies: models.QuerySet):
+        """
+        Update the latest exchange rates of the given currencies
+
+        The latest prices of stocks in these currencies depend on the exchange rates, so these should be refreshed
+        as well with LatestStockPrice.refresh.
+
+        :param currencies: Currencies to update
+        """
+
+        latest_rates = CurrencyExchangeRate.objects.filter(currency=OuterRef('pk')).order_by('-date')
+        rows = currencies.order_by().annotate(
+            latest_date=Subquery(latest_rates.values('date')[:1]),
+            current_rate=Subquery(latest_rates.values('rate')[:1]),
+        ).values_list('pk', 'latest_date', 'current_rate')
+
+        latest_exchange_rates, without_rates = [], []
+        for currency_id, latest_date, current_rate in rows:
+            if latest_date is None:
+                without_rates.append(currency_id)
+            else:
+                latest_exchange_rates.append(cls(currency_id=currency_id, date=latest_date, rate=current_rate))
+        cls.objects.filter(currency_id__in=without_rates).delete()
+        bulk_upsert(cls, latest_exchange_rates, unique_fields=('currency',), update_fields=('date', 'rate'))
@@ -0,0 +1,45 @@
+from datetime import date
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from currency.models import Currency, CurrencyExchangeRate, LatestExchangeRate
+
+
+class CurrencyAdminTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser(username='admin', email='admin@example.com', password='admin')
+        cls.eur = Currency.objects.create(symbol='EUR', name='Euro')
+        cls.usd = Currency.objects.create(symbol='USD', name='US dollar')
+        CurrencyExchangeRate.objects.create(currency=cls.usd, date=date(2020, 10, 15), rate=Decimal('0.9'))
+        CurrencyExchangeRate.objects.create(currency=cls.usd, date=date(2020, 10, 16), rate=Decimal('0.8'))
+        LatestExchangeRate.refresh(Currency.objects.all())
+
+    def test_annotated_rates_match_properties(self):
+        currencies = Currency.objects.with_latest_rate()
+        for currency in (self.eur, self.usd):
+            annotated = currencies.get(pk=currency.pk)
+            self.assertEqual(annotated.rate, currency.rate)
+            self.assertEqual(annotated.latest_rate_date, currency.latest_rate_date)
+        self.assertEqual(self.usd.rate, Decimal('0.8'))
+        self.assertEqual(self.eur.rate, Decimal(1))
+
+    def test_changelist_queries_do_not_depend_on_number_of_currencies(self):
+        self.client.force_login(self.user)
+        url = reverse('admin:currency_currency_changelist')
+
+        with CaptureQueriesContext(connection) as few_currencies:
+            self.client.get(url)
+
+        for i in range(20):
+            currency = Currency.objects.create(symbol=f'C{i}', name=f'Currency {i}')
+            CurrencyExchangeRate.objects.create(currency=currency, date=date(2020, 10, 16), rate=Decimal(i))
+        LatestExchangeRate.refresh(Currency.objects.all())
+        with CaptureQueriesContext(connection) as many_currencies:
+            self.client.get(url)
+        self.assertEqual(len(many_currencies), len(few_currencies))
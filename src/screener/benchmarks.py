@@ -0,0 +1,21 @@
+from common.benchmark import register
+from screener.screener import Condition, PriceMatrix
+from stock.benchmarks import create_stocks_with_prices
+
+
+@register('screener.load_price_matrix')
+def load_price_matrix(scale: int):
+    """
+    Load two years of prices of 200 stocks
+    """
+
+    create_stocks_with_prices(200 * scale, 730)
+    return PriceMatrix.load
+
+
+@register('screener.screen')
+def screen(scale: int):
+    create_stocks_with_prices(200 * scale, 730)
+    matrix = PriceMatrix.load()
+    conditions = [Condition.parse('drawdown_52w > 10%'), Condition.parse('momentum_3m > 0')]
+    return lambda: PriceMatrix(matrix.dates, matrix.symbols, matrix.prices, matrix.rates).screen(*conditions)
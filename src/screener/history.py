@@ -0,0 +1,108 @@
+from typing import Dict, NamedTuple, Optional
+
+import numpy as np
+from django.db.models import QuerySet
+
+from common.fields import values_arrays
+from currency.models import Currency, CurrencyExchangeRate
+from stock.models import Stock, StockPrice
+
+
+class TimeSeries(NamedTuple):
+    """
+    Values at sorted dates
+
+    dates: Sorted array of dates (datetime64[D])
+    values: Float array with the value at each date
+    """
+
+    dates: np.ndarray
+    values: np.ndarray
+
+
+def as_of(series: TimeSeries, dates: np.ndarray) -> np.ndarray:
+    """
+    Return the last known value of the series on each of the given dates
+
+    Values are carried forward over dates that are not in the series, such as weekends and holidays. Dates before the
+    first date of the series get NaN. The lookup is a single binary search over the series for all dates at once.
+
+    :param series: Series to look up the values in
+    :param dates: Dates (datetime64[D]) to look up, in any order
+    :return: Float array with a value per date
+    """
+
+    indices = np.searchsorted(series.dates, dates, side='right') - 1
+    values = np.full(len(dates), np.nan)
+    known = indices >= 0
+    values[known] = series.values[indices[known]]
+    return values
+
+
+def load_price_histories(stocks: QuerySet) -> Dict[int, TimeSeries]:
+    """
+    Load the price history of the given stocks in their original currency, in a single query
+
+    :param stocks: Stocks to load the prices for
+    :return: Dictionary of stock ID to price history
+    """
+
+    prices = StockPrice.objects.filter(stock__in=stocks.values('pk')).order_by('stock_id', 'date')
+    stock_ids, dates, close, open_ = values_arrays(prices, 'stock_id', 'date', 'close', 'open')
+    return _split_by_key(stock_ids, dates, np.where(np.isnan(close), open_, close))
+
+
+def load_exchange_rate_histories(currencies: QuerySet) -> Dict[int, TimeSeries]:
+    """
+    Load the exchange rate history of the given currencies, in a single query
+
+    :param currencies: Currencies to load the exchange rates for
+    :return: Dictionary of currency ID to exchange rate history, without currencies that have no exchange rates
+    """
+
+    rates = CurrencyExchangeRate.objects.filter(currency__in=currencies.values('pk')).order_by('currency_id', 'date')
+    return _split_by_key(*values_arrays(rates, 'currency_id', 'date', 'rate'))
+
+
+def load_euro_price_histories(stocks: Optional[QuerySet] = None) -> Dict[str, TimeSeries]:
+    """
+    Load the price history of the given stocks in EUR
+
+    Every price is converted with the exchange rate that was known on the date of the price. Currencies without any
+    exchange rates are valued at 1 EUR, like Currency.rate does. Prices before the first known exchange rate are NaN.
+
+    :param stocks: Stocks to load the prices for. Optional, default = all stocks
+    :return: Dictionary of stock symbol to price history in EUR
+    """
+
+    if stocks is None:
+        stocks = Stock.objects.all()
+    prices = load_price_histories(stocks)
+    rates = load_exchange_rate_histories(Currency.objects.filter(pk__in=stocks.values('currency_id')))
+
+    result = {}
+    for stock_id, symbol, currency_id in stocks.order_by().values_list('pk', 'symbol', 'currency_id'):
+        series = prices.get(stock_id)
+        if series is None:
+            continue
+        if currency_id in rates:
+            result[symbol] = TimeSeries(series.dates, series.values * as_of(rates[currency_id], series.dates))
+        else:
+            result[symbol] = series
+    return result
+
+
+def _split_by_key(keys: np.ndarray, dates: np.ndarray, values: np.ndarray) -> Dict[int, TimeSeries]:
+    """
+    Split the values with their keys and dates, sorted by key and date, into a time series per key
+    """
+
+    if not len(keys):
+        return {}
+
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], len(keys)]
+    return {
+        int(keys[start]): TimeSeries(dates[start:end], values[start:end])
+        for start, end in zip(starts, ends)
+    }
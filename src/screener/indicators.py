@@ -0,0 +1,278 @@
+from abc import ABC, abstractmethod
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from django.db import transaction
+
+from screener.models import StockIndicators
+from screener.screener import WEEKS_52
+from stock.models import Stock, StockPrice
+from stock.price_store import StoredPrices, query_stored_prices
+
+State = Dict[str, Any]
+
+# Number of values that exponential_smoothing processes at once, small enough to keep the decay weights representable
+SMOOTHING_CHUNK = 128
+TRADING_DAYS_PER_YEAR = 252
+
+
+class Indicator(ABC):
+    """
+    Technical indicator that is computed over the price bars of a stock and can be continued on later bars
+
+    compute processes all given bars at once with numpy. The state it returns holds everything that is needed to
+    continue on bars that come later, so a daily update only processes the new bars instead of the full history.
+    """
+
+    name: str
+
+    @abstractmethod
+    def compute(self, bars: StoredPrices, state: Optional[State] = None) -> Tuple[np.ndarray, State]:
+        """
+        :param bars: Bars sorted by date, all after the bars that produced the state
+        :param state: State returned by the previous call, or None to start at the first bar of the stock
+        :return: Value of the indicator at every bar, NaN while there are not enough bars, and the new state
+        """
+
+
+class MovingAverage(Indicator):
+    """
+    Simple moving average of the price over the last period bars
+    """
+
+    def __init__(self, period: int):
+        self.period = period
+        self.name = f'sma_{period}'
+
+    def compute(self, bars: StoredPrices, state: Optional[State] = None) -> Tuple[np.ndarray, State]:
+        window = np.array(state['window'] if state else [], dtype=np.float64)
+        prices = np.r_[window, bars.current]
+        averages = _rolling_sum(prices, self.period) / self.period
+        return averages[len(window):], {'window': prices[-(self.period - 1):].tolist()}
+
+
+class RelativeStrengthIndex(Indicator):
+    """
+    Wilder's relative strength index of the price changes, from 0 to 100
+    """
+
+    def __init__(self, period: int):
+        self.period = period
+        self.name = f'rsi_{period}'
+
+    def compute(self, bars: StoredPrices, state: Optional[State] = None) -> Tuple[np.ndarray, State]:
+        state = state or {'previous': None, 'gain': None, 'loss': None, 'count': 0}
+        prices = bars.current
+        if state['previous'] is None:
+            # The first bar of a stock has no price change
+            changes, offset = np.diff(prices), min(len(prices), 1)
+        else:
+            changes, offset = np.diff(np.r_[state['previous'], prices]), 0
+
+        gains = _wilder_smoothing(np.fmax(changes, 0), self.period, state['gain'])
+        losses = _wilder_smoothing(np.fmax(-changes, 0), self.period, state['loss'])
+        counts = state['count'] + np.arange(1, len(changes) + 1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rsi = np.where(losses == 0, 100.0, 100 - 100 / (1 + gains / losses))
+
+        values = np.full(len(prices), np.nan)
+        values[offset:] = np.where(counts >= self.period, rsi, np.nan)
+        if len(changes):
+            state = {'previous': float(prices[-1]), 'gain': float(gains[-1]), 'loss': float(losses[-1]),
+                     'count': int(counts[-1])}
+        elif len(prices):
+            state = dict(state, previous=float(prices[-1]))
+        return values, state
+
+
+class AverageTrueRange(Indicator):
+    """
+    Wilder's average of the true range, the daily price range including gaps from the previous close
+    """
+
+    def __init__(self, period: int):
+        self.period = period
+        self.name = f'atr_{period}'
+
+    def compute(self, bars: StoredPrices, state: Optional[State] = None) -> Tuple[np.ndarray, State]:
+        state = state or {'previous': None, 'atr': None, 'count': 0}
+        prices = bars.current
+        # Bars without high or low price only move from the previous close to the current price
+        high = np.where(np.isnan(bars.high), prices, bars.high)
+        low = np.where(np.isnan(bars.low), prices, bars.low)
+        previous = np.r_[np.nan if state['previous'] is None else state['previous'], prices[:-1]]
+        true_ranges = np.fmax(high - low, np.fmax(np.abs(high - previous), np.abs(low - previous)))
+
+        atr = _wilder_smoothing(true_ranges, self.period, state['atr'])
+        counts = state['count'] + np.arange(1, len(prices) + 1)
+        values = np.where(counts >= self.period, atr, np.nan)
+        if len(prices):
+            state = {'previous': float(prices[-1]), 'atr': float(atr[-1]), 'count': int(counts[-1])}
+        return values, state
+
+
+class RollingExtreme(Indicator):
+    """
+    Highest or lowest price within a number of calendar days, like the 52 week high and low of the screener
+    """
+
+    def __init__(self, name: str, function: np.ufunc, days: int):
+        self.name = name
+        self.function = function
+        self.days = days
+
+    def compute(self, bars: StoredPrices, state: Optional[State] = None) -> Tuple[np.ndarray, State]:
+        window_days = np.array(state['days'] if state else [], dtype=np.int64)
+        days = np.r_[window_days, bars.days]
+        prices = np.r_[np.array(state['prices'] if state else [], dtype=np.float64), bars.current]
+        if not len(days):
+            return np.array([]), {'days': [], 'prices': []}
+
+        # Reduce the windows [start, end) of all bars at once, the odd segments in between are ignored
+        starts = np.searchsorted(days, days - self.days, side='right')
+        ends = np.arange(1, len(days) + 1)
+        extremes = self.function.reduceat(np.r_[prices, np.nan], np.column_stack([starts, ends]).ravel())[::2]
+
+        keep = days > days[-1] - self.days
+        return extremes[len(window_days):], {'days': days[keep].tolist(), 'prices': prices[keep].tolist()}
+
+
+class Volatility(Indicator):
+    """
+    Annualized standard deviation of the daily log returns over the last period returns
+    """
+
+    def __init__(self, period: int):
+        self.period = period
+        self.name = f'volatility_{period}d'
+
+    def compute(self, bars: StoredPrices, state: Optional[State] = None) -> Tuple[np.ndarray, State]:
+        state = state or {'previous': None, 'returns': []}
+        prices = bars.current
+        if state['previous'] is None:
+            new_returns, offset = np.diff(np.log(prices)), min(len(prices), 1)
+        else:
+            new_returns, offset = np.diff(np.log(np.r_[state['previous'], prices])), 0
+
+        window = np.array(state['returns'], dtype=np.float64)
+        returns = np.r_[window, new_returns]
+        sums = _rolling_sum(returns, self.period)
+        squares = _rolling_sum(returns ** 2, self.period)
+        with np.errstate(invalid='ignore'):
+            variance = np.maximum((squares - sums ** 2 / self.period) / (self.period - 1), 0)
+
+        values = np.full(len(prices), np.nan)
+        values[offset:] = np.sqrt(variance[len(window):] * TRADING_DAYS_PER_YEAR)
+        if len(prices):
+            state = {'previous': float(prices[-1]), 'returns': returns[-(self.period - 1):].tolist()}
+        return values, state
+
+
+INDICATORS: List[Indicator] = [
+    MovingAverage(50),
+    MovingAverage(200),
+    RelativeStrengthIndex(14),
+    AverageTrueRange(14),
+    RollingExtreme('high_52w', np.fmax, WEEKS_52),
+    RollingExtreme('low_52w', np.fmin, WEEKS_52),
+    Volatility(20),
+]
+
+
+def update_indicators(stock: Stock, since: Optional[date] = None) -> Optional[StockIndicators]:
+    """
+    Update the indicators of the given stock with its prices in the database
+
+    Only the last price of the previous update and the prices after it are processed, if all written prices are at or
+    after that last price. The state is kept one price behind for this, so a price that replaces the last price, like
+    a newer intraday quote, does not need the full history either. Otherwise the indicators are recomputed from the
+    full price history.
+
+    :param stock: Stock to update the indicators of
+    :param since: Date of the oldest price that was written since the last update. Optional, default = unknown, which
+                  recomputes the indicators from the full history.
+    :return: Updated indicators, or None if the stock has no prices
+    """
+
+    with transaction.atomic():
+        current = StockIndicators.objects.filter(stock=stock).first()
+        if current and current.state and since and since >= current.date:
+            bars = _load_bars(stock, since=current.date)
+            states = current.state
+        else:
+            bars = _load_bars(stock)
+            states = {}
+
+        if not len(bars.days):
+            StockIndicators.objects.filter(stock=stock).delete()
+            return None
+
+        # The state up to the last bar, and the values at the last bar
+        previous_bars = StoredPrices(bars.days[:-1], bars.prices[:, :-1])
+        last_bar = StoredPrices(bars.days[-1:], bars.prices[:, -1:])
+        values, new_states = {}, {}
+        for indicator in INDICATORS:
+            _, new_states[indicator.name] = indicator.compute(previous_bars, states.get(indicator.name))
+            indicator_values, _ = indicator.compute(last_bar, new_states[indicator.name])
+            values[indicator.name] = _to_optional_float(indicator_values[-1])
+        indicators = current or StockIndicators(stock=stock)
+        indicators.date = bars.dates[-1].item()
+        indicators.state = new_states
+        for name, value in values.items():
+            setattr(indicators, name, value)
+        indicators.save()
+        return indicators
+
+
+def exponential_smoothing(values: np.ndarray, alpha: float, initial: float) -> np.ndarray:
+    """
+    Return y with y[i] = (1 - alpha) * y[i - 1] + alpha * values[i] and y[-1] = initial, without a Python loop per value
+
+    Within a chunk, y[k] = decay[k] * (initial + alpha * sum(values[j] / decay[j] for j <= k)) with
+    decay[k] = (1 - alpha) ** (k + 1), which is a cumulative sum.
+    """
+
+    result = np.empty(len(values))
+    previous = initial
+    for start in range(0, len(values), SMOOTHING_CHUNK):
+        chunk = values[start:start + SMOOTHING_CHUNK]
+        decay = (1 - alpha) ** np.arange(1, len(chunk) + 1)
+        result[start:start + len(chunk)] = decay * (previous + alpha * np.cumsum(chunk / decay))
+        previous = result[start + len(chunk) - 1]
+    return result
+
+
+def _wilder_smoothing(values: np.ndarray, period: int, previous: Optional[float]) -> np.ndarray:
+    """
+    Wilder's moving average, which starts at the first value when there is no previous average
+    """
+
+    if previous is None:
+        if not len(values):
+            return values.astype(np.float64)
+        return np.r_[values[0], exponential_smoothing(values[1:], 1 / period, values[0])]
+    return exponential_smoothing(values, 1 / period, previous)
+
+
+def _rolling_sum(values: np.ndarray, period: int) -> np.ndarray:
+    """
+    Sum of every value and the period - 1 values before it, NaN if there are fewer values before it
+    """
+
+    sums = np.full(len(values), np.nan)
+    if len(values) >= period:
+        cumulative = np.cumsum(np.r_[0, values])
+        sums[period - 1:] = cumulative[period:] - cumulative[:-period]
+    return sums
+
+
+def _load_bars(stock: Stock, since: Optional[date] = None) -> StoredPrices:
+    prices = StockPrice.objects.filter(stock=stock)
+    if since:
+        prices = prices.filter(date__gte=since)
+    return query_stored_prices(prices.order_by('date'))
+
+
+def _to_optional_float(value: float) -> Optional[float]:
+    return None if np.isnan(value) else float(value)
@@ -0,0 +1,23 @@
+from django.core.management import BaseCommand
+
+from screener.indicators import update_indicators
+from stock.models import Stock
+
+
+class Command(BaseCommand):
+    help = 'Recompute the technical indicators of the given stocks from their full price history'
+
+    def handle(self, *args, **options):
+        stocks = Stock.objects.all()
+        if options['symbols']:
+            stocks = stocks.filter(symbol__in=options['symbols'])
+
+        nr_stocks = 0
+        for stock in stocks.iterator():
+            if update_indicators(stock):
+                nr_stocks += 1
+        self.stdout.write(f'Computed indicators of {nr_stocks} stocks')
+
+    def add_arguments(self, parser):
+        parser.add_argument('symbols', type=str, nargs='*',
+                            help='Symbols of the stocks to compute the indicators of. Optional, default = all stocks')
@@ -0,0 +1,37 @@
+from django.core.management import BaseCommand, CommandError
+
+from screener.screener import METRICS, Condition, PriceMatrix
+from stock.price_store import PriceStore
+
+
+class Command(BaseCommand):
+    help = 'Print all stocks that match the given screen expressions'
+
+    def handle(self, *args, **options):
+        try:
+            conditions = [Condition.parse(expression) for expression in options['expressions']]
+        except ValueError as e:
+            raise CommandError(str(e)) from e
+
+        if options['price_store']:
+            store = PriceStore.from_settings()
+            if store is None:
+                raise CommandError('The price store is disabled, set PRICE_STORE_DIR to use it')
+            matrix = PriceMatrix.from_store(store)
+        else:
+            matrix = PriceMatrix.load()
+        mask = matrix.match(*conditions)
+        metrics = sorted(set.union({'price_in_euro'}, *[condition.metrics for condition in conditions]))
+        values = [matrix.metric(metric)[mask] for metric in metrics]
+        symbols = [symbol for symbol, match in zip(matrix.symbols, mask) if match]
+
+        self.stdout.write('\t'.join(['symbol'] + metrics))
+        for row, symbol in enumerate(symbols):
+            self.stdout.write('\t'.join([symbol] + [f'{metric_values[row]:.4f}' for metric_values in values]))
+
+    def add_arguments(self, parser):
+        help_expressions = f'Expressions like "price_in_euro < 20" or "drawdown_52w > 30%" that all must match. ' \
+                           f'Available metrics: {", ".join(sorted(METRICS))}.'
+        parser.add_argument('expressions', type=str, nargs='+', help=help_expressions)
+        parser.add_argument('--price-store', action='store_true',
+                            help='Read the prices from the price store (PRICE_STORE_DIR) instead of the database')
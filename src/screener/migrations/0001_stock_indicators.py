@@ -0,0 +1,34 @@
+# Generated by Django 3.1.2 on 2026-10-18 17:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('stock', '0003_latest_stock_price'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockIndicators',
+            fields=[
+                ('stock', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='indicators', serialize=False, to='stock.stock')),
+                ('date', models.DateField(help_text='Date of the last price that is included in the indicators')),
+                ('sma_50', models.FloatField(blank=True, help_text='Moving average of the price over 50 days', null=True)),
+                ('sma_200', models.FloatField(blank=True, help_text='Moving average of the price over 200 days', null=True)),
+                ('rsi_14', models.FloatField(blank=True, help_text='Relative strength index over 14 days', null=True)),
+                ('atr_14', models.FloatField(blank=True, help_text='Average true range over 14 days', null=True)),
+                ('high_52w', models.FloatField(blank=True, help_text='Highest price in the last 52 weeks', null=True)),
+                ('low_52w', models.FloatField(blank=True, help_text='Lowest price in the last 52 weeks', null=True)),
+                ('volatility_20d', models.FloatField(blank=True, help_text='Annualized volatility of the daily returns over 20 days', null=True)),
+                ('state', models.JSONField(default=dict)),
+            ],
+            options={
+                'verbose_name_plural': 'stock indicators',
+            },
+        ),
+    ]
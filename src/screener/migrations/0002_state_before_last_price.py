@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+def clear_states(apps, schema_editor):
+    # States that include the last price cannot be continued anymore, the next update recomputes the full history
+    StockIndicators = apps.get_model('screener', 'StockIndicators')
+    StockIndicators.objects.update(state={})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('screener', '0001_stock_indicators'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_states, migrations.RunPython.noop),
+    ]
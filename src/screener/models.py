@@ -0,0 +1,30 @@
+from django.db import models
+
+from stock.models import Stock
+
+
+class StockIndicators(models.Model):
+    """
+    Latest values of the technical indicators of a stock, see screener.indicators
+
+    The state holds everything that is needed to update the indicators with new prices without processing the full
+    price history again. It includes all prices but the last one, such that the last price can be replaced as well.
+    """
+
+    stock = models.OneToOneField(Stock, related_name='indicators', on_delete=models.CASCADE, primary_key=True)
+    date = models.DateField(help_text='Date of the last price that is included in the indicators')
+    sma_50 = models.FloatField(blank=True, null=True, help_text='Moving average of the price over 50 days')
+    sma_200 = models.FloatField(blank=True, null=True, help_text='Moving average of the price over 200 days')
+    rsi_14 = models.FloatField(blank=True, null=True, help_text='Relative strength index over 14 days')
+    atr_14 = models.FloatField(blank=True, null=True, help_text='Average true range over 14 days')
+    high_52w = models.FloatField(blank=True, null=True, help_text='Highest price in the last 52 weeks')
+    low_52w = models.FloatField(blank=True, null=True, help_text='Lowest price in the last 52 weeks')
+    volatility_20d = models.FloatField(blank=True, null=True,
+                                       help_text='Annualized volatility of the daily returns over 20 days')
+    state = models.JSONField(default=dict)
+
+    class Meta:
+        verbose_name_plural = 'stock indicators'
+
+    def __str__(self):
+        return f'{self.stock} ({self.date})'
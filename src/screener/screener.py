@@ -0,0 +1,368 @@
+import operator
+import re
+from datetime import date
+from typing import Callable, Dict, List, Optional, Set
+
+import numpy as np
+from django.db.models import QuerySet
+
+from common.cache import market_data_cache
+from common.fields import values_arrays
+from currency.models import Currency, LatestExchangeRate
+from screener.history import as_of, load_exchange_rate_histories
+from screener.models import StockIndicators
+from stock.models import Stock, StockPrice
+from stock.price_store import EPOCH, PriceStore, query_stored_prices
+
+# Number of calendar days in the windows of the metrics
+WEEKS_52 = 364
+MONTH = 30
+
+
+class PriceMatrix:
+    """
+    Prices of all stocks in a matrix with a row per date and a column per stock
+
+    The matrix is loaded from the database once, after which all metrics are computed for all stocks at the same time.
+    Dates on which a stock has no price are NaN in the raw prices. The filled prices carry the last known price
+    forward, such that every stock has a price on every date after its first price.
+    """
+
+    def __init__(self, dates: np.ndarray, symbols: List[str], prices: np.ndarray, rates: np.ndarray,
+                 currency_ids: Optional[List[int]] = None):
+        """
+        :param dates: Sorted array of dates (datetime64[D]) of the rows
+        :param symbols: Symbols of the stocks of the columns
+        :param prices: Float matrix of prices in the original currency of the stocks, NaN if there is no price
+        :param rates: Float array with the current exchange rate to EUR of each stock
+        :param currency_ids: IDs of the currencies of the stocks. Optional, only needed for euro_prices.
+        """
+
+        self.dates = dates
+        self.symbols = symbols
+        self.prices = prices
+        self.rates = rates
+        self.currency_ids = currency_ids
+        self._filled_prices: Optional[np.ndarray] = None
+        self._euro_prices: Optional[np.ndarray] = None
+        self._metrics: Dict[str, np.ndarray] = {}
+
+    @classmethod
+    def load(cls, stocks: Optional[QuerySet] = None, start: Optional[date] = None) -> 'PriceMatrix':
+        """
+        Load the prices of the given stocks from the database
+
+        :param stocks: Stocks to load. Optional, default = all stocks
+        :param start: Date of the first price to load. Optional, default = load all prices
+        """
+
+        if stocks is None:
+            stocks = Stock.objects.all()
+        prices = StockPrice.objects.filter(stock__in=stocks.values('id'))
+        stocks = list(stocks.order_by('symbol').values_list('id', 'symbol', 'currency_id'))
+
+        if start:
+            prices = prices.filter(date__gte=start)
+        stock_ids, dates, close, open_ = values_arrays(prices.order_by(), 'stock_id', 'date', 'close', 'open')
+
+        # Map the stock IDs to columns with a lookup array instead of a dictionary lookup per price
+        column_by_id = np.full(max([stock_id for stock_id, _, _ in stocks], default=0) + 1, -1, dtype=np.int64)
+        column_by_id[[stock_id for stock_id, _, _ in stocks]] = np.arange(len(stocks))
+        unique_dates, row_indices = np.unique(dates, return_inverse=True)
+        matrix = np.full((len(unique_dates), len(stocks)), np.nan)
+        matrix[row_indices, column_by_id[stock_ids.astype(np.int64)]] = np.where(np.isnan(close), open_, close)
+
+        rates_by_currency = _get_latest_rates()
+        rates = np.array([rates_by_currency.get(currency_id, 1.0) for _, _, currency_id in stocks])
+        currency_ids = [currency_id for _, _, currency_id in stocks]
+        return cls(unique_dates, [symbol for _, symbol, _ in stocks], matrix, rates, currency_ids)
+
+    @classmethod
+    def load_cached(cls, start: Optional[date] = None) -> 'PriceMatrix':
+        """
+        Load the prices of all stocks, from the market data cache if they have not changed since the last load
+
+        :param start: Date of the first price to load. Optional, default = load all prices
+        """
+
+        return market_data_cache.get_or_set_local(f'price_matrix:{start}', lambda: cls.load(start=start))
+
+    @classmethod
+    def from_store(cls, store: PriceStore, stocks: Optional[QuerySet] = None,
+                   start: Optional[date] = None) -> 'PriceMatrix':
+        """
+        Load the prices of the given stocks from the memory mapped price store instead of the database
+
+        Only the stocks themselves are queried, and the prices of stale stocks. Stocks that are not in the price store
+        get a column without prices.
+
+        :param store: Price store to read the prices from
+        :param stocks: Stocks to load. Optional, default = all stocks
+        :param start: Date of the first price to load. Optional, default = load all prices
+        """
+
+        if stocks is None:
+            stocks = Stock.objects.all()
+        stocks = list(stocks.order_by('symbol').values_list('id', 'symbol', 'currency_id'))
+        first_day = (np.datetime64(start, 'D') - EPOCH).astype(np.int32) if start else None
+
+        stale = set(store.stale_stock_ids())
+        columns = []
+        for column, (stock_id, symbol, _) in enumerate(stocks):
+            if stock_id in stale:
+                stored = query_stored_prices(StockPrice.objects.filter(stock_id=stock_id).order_by('date'))
+            else:
+                stored = store.read(symbol)
+            if stored is None:
+                continue
+            first_row = np.searchsorted(stored.days, first_day) if first_day is not None else 0
+            columns.append((column, stored.days[first_row:], stored.current[first_row:]))
+
+        unique_days = np.unique(np.concatenate([days for _, days, _ in columns])) if columns else np.array([])
+        matrix = np.full((len(unique_days), len(stocks)), np.nan)
+        for column, days, values in columns:
+            matrix[np.searchsorted(unique_days, days), column] = values
+
+        rates_by_currency = _get_latest_rates()
+        rates = np.array([rates_by_currency.get(currency_id, 1.0) for _, _, currency_id in stocks])
+        currency_ids = [currency_id for _, _, currency_id in stocks]
+        dates = EPOCH + unique_days.astype('timedelta64[D]')
+        return cls(dates, [symbol for _, symbol, _ in stocks], matrix, rates, currency_ids)
+
+    @property
+    def filled_prices(self) -> np.ndarray:
+        """
+        Prices where missing values are filled with the last known price of the same stock
+        """
+
+        if self._filled_prices is None:
+            self._filled_prices = forward_fill(self.prices)
+        return self._filled_prices
+
+    @property
+    def euro_prices(self) -> np.ndarray:
+        """
+        Prices in EUR, where every price is converted with the exchange rate that was known on its date
+
+        Currencies without any exchange rates are valued at 1 EUR, like Currency.rate does.
+        """
+
+        if self._euro_prices is None:
+            if self.currency_ids is None:
+                msg = 'The currencies of the stocks are needed to compute prices in EUR'
+                raise ValueError(msg)
+            currency_ids = np.array(self.currency_ids, dtype=np.int64)
+            rates = np.ones(self.prices.shape)
+            histories = load_exchange_rate_histories(Currency.objects.filter(pk__in=set(self.currency_ids)))
+            for currency_id, history in histories.items():
+                rates[:, currency_ids == currency_id] = as_of(history, self.dates)[:, np.newaxis]
+            self._euro_prices = self.prices * rates
+        return self._euro_prices
+
+    def metric(self, name: str) -> np.ndarray:
+        """
+        Return the values of the metric with the given name for all stocks
+
+        :param name: Name of the metric, must be one of METRICS
+        :return: Float array with a value per stock, NaN if the metric cannot be computed for a stock
+        """
+
+        if name not in METRICS:
+            msg = f'Unknown metric {name}. Available metrics: {", ".join(sorted(METRICS))}'
+            raise ValueError(msg)
+        if name not in self._metrics:
+            self._metrics[name] = METRICS[name](self)
+        return self._metrics[name]
+
+    def match(self, *conditions: 'Condition') -> np.ndarray:
+        """
+        Return a boolean array that indicates for every stock whether it matches all conditions
+        """
+
+        mask = np.ones(len(self.symbols), dtype=bool)
+        for condition in conditions:
+            mask &= condition.evaluate(self)
+        return mask
+
+    def screen(self, *conditions: 'Condition') -> List[str]:
+        """
+        Return the symbols of all stocks that match all conditions
+        """
+
+        mask = self.match(*conditions)
+        return [symbol for symbol, match in zip(self.symbols, mask) if match]
+
+    def row_at(self, days_ago: int) -> int:
+        """
+        Return the index of the last row on or before the given number of days before the last date, -1 if none
+        """
+
+        if len(self.dates) == 0:
+            return -1
+        target = self.dates[-1] - np.timedelta64(days_ago, 'D')
+        return int(np.searchsorted(self.dates, target, side='right')) - 1
+
+
+class Condition:
+    """
+    Condition on a metric that is evaluated for all stocks at once
+
+    Conditions can be combined with & (and) and | (or). Stocks for which the metric is not available never match.
+    """
+
+    operators: Dict[str, Callable] = {
+        '<': operator.lt,
+        '<=': operator.le,
+        '>': operator.gt,
+        '>=': operator.ge,
+        '==': operator.eq,
+        '!=': operator.ne,
+    }
+    pattern = re.compile(r'^\s*(?P<metric>\w+)\s*(?P<operator><=|>=|==|!=|<|>)\s*(?P<value>[-+]?[\d.]+%?)\s*$')
+
+    def __init__(self, evaluate: Callable[[PriceMatrix], np.ndarray], description: str, metrics: Set[str]):
+        """
+        :param evaluate: Function returning a boolean array that indicates which stocks match the condition
+        :param description: Human readable description of the condition
+        :param metrics: Names of the metrics the condition uses
+        """
+
+        self.evaluate = evaluate
+        self.description = description
+        self.metrics = metrics
+
+    @classmethod
+    def compare(cls, metric: str, operator_symbol: str, value: float) -> 'Condition':
+        if metric not in METRICS:
+            msg = f'Unknown metric {metric}. Available metrics: {", ".join(sorted(METRICS))}'
+            raise ValueError(msg)
+        compare = cls.operators[operator_symbol]
+
+        def evaluate(matrix: PriceMatrix) -> np.ndarray:
+            values = matrix.metric(metric)
+            with np.errstate(invalid='ignore'):
+                return compare(values, value) & ~np.isnan(values)
+
+        return cls(evaluate, f'{metric} {operator_symbol} {value}', {metric})
+
+    @classmethod
+    def parse(cls, expression: str) -> 'Condition':
+        """
+        Parse an expression like "price_in_euro < 20" or "drawdown_52w > 30%" into a condition
+        """
+
+        match = cls.pattern.match(expression)
+        if not match:
+            msg = f'Invalid screen expression "{expression}", expected e.g. "price_in_euro < 20"'
+            raise ValueError(msg)
+        value_str = match.group('value')
+        if value_str.endswith('%'):
+            value = float(value_str[:-1]) / 100
+        else:
+            value = float(value_str)
+        return cls.compare(match.group('metric'), match.group('operator'), value)
+
+    def __and__(self, other: 'Condition') -> 'Condition':
+        return Condition(lambda matrix: self.evaluate(matrix) & other.evaluate(matrix),
+                         f'({self.description} and {other.description})', self.metrics | other.metrics)
+
+    def __or__(self, other: 'Condition') -> 'Condition':
+        return Condition(lambda matrix: self.evaluate(matrix) | other.evaluate(matrix),
+                         f'({self.description} or {other.description})', self.metrics | other.metrics)
+
+    def __str__(self):
+        return self.description
+
+
+def forward_fill(matrix: np.ndarray) -> np.ndarray:
+    """
+    Replace every NaN in the matrix by the last non-NaN value above it in the same column
+    """
+
+    if matrix.size == 0:
+        return matrix.copy()
+    rows = np.arange(matrix.shape[0])[:, np.newaxis]
+    last_valid_row = np.where(np.isnan(matrix), 0, rows)
+    np.maximum.accumulate(last_valid_row, axis=0, out=last_valid_row)
+    filled = matrix[last_valid_row, np.arange(matrix.shape[1])]
+    return filled
+
+
+def _get_latest_rates() -> Dict[int, float]:
+    """
+    Return the latest exchange rate to EUR of all currencies with at least one rate
+    """
+
+    def get_rates() -> Dict[int, float]:
+        rates = LatestExchangeRate.objects.values_list('currency_id', 'rate')
+        return {currency_id: float(rate) for currency_id, rate in rates}
+
+    return market_data_cache.get_or_set('latest_rates', get_rates)
+
+
+def _price(matrix: PriceMatrix) -> np.ndarray:
+    if len(matrix.dates) == 0:
+        return np.full(len(matrix.symbols), np.nan)
+    return matrix.filled_prices[-1]
+
+
+def _price_in_euro(matrix: PriceMatrix) -> np.ndarray:
+    return matrix.metric('price') * matrix.rates
+
+
+def _window_high(matrix: PriceMatrix, days: int) -> np.ndarray:
+    first_row = matrix.row_at(days) + 1
+    return np.fmax.reduce(matrix.prices[first_row:], axis=0, initial=np.nan)
+
+
+def _window_low(matrix: PriceMatrix, days: int) -> np.ndarray:
+    first_row = matrix.row_at(days) + 1
+    return np.fmin.reduce(matrix.prices[first_row:], axis=0, initial=np.nan)
+
+
+def _drawdown(matrix: PriceMatrix, days: int) -> np.ndarray:
+    """
+    Relative decline of the current price from the highest price in the window, e.g. 0.3 for a 30% drawdown
+    """
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return 1 - matrix.metric('price') / _window_high(matrix, days)
+
+
+def _momentum(matrix: PriceMatrix, days: int) -> np.ndarray:
+    """
+    Relative change of the price over the given number of days, e.g. 0.1 for a 10% increase
+    """
+
+    row = matrix.row_at(days)
+    if row < 0:
+        return np.full(len(matrix.symbols), np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return matrix.metric('price') / matrix.filled_prices[row] - 1
+
+
+def _indicator(matrix: PriceMatrix, name: str) -> np.ndarray:
+    """
+    Latest value of the indicator with the given name, as stored by screener.indicators.update_indicators
+    """
+
+    values = dict(StockIndicators.objects.filter(stock__symbol__in=matrix.symbols).values_list('stock__symbol', name))
+    return np.array([values.get(symbol) for symbol in matrix.symbols], dtype=np.float64)
+
+
+METRICS: Dict[str, Callable[[PriceMatrix], np.ndarray]] = {
+    'price': _price,
+    'price_in_euro': _price_in_euro,
+    'high_52w': lambda matrix: _window_high(matrix, WEEKS_52),
+    'low_52w': lambda matrix: _window_low(matrix, WEEKS_52),
+    'drawdown_52w': lambda matrix: _drawdown(matrix, WEEKS_52),
+    'momentum_1m': lambda matrix: _momentum(matrix, MONTH),
+    'momentum_3m': lambda matrix: _momentum(matrix, 3 * MONTH),
+    'momentum_6m': lambda matrix: _momentum(matrix, 6 * MONTH),
+    'momentum_12m': lambda matrix: _momentum(matrix, WEEKS_52),
+    'sma_50': lambda matrix: _indicator(matrix, 'sma_50'),
+    'sma_200': lambda matrix: _indicator(matrix, 'sma_200'),
+    'rsi_14': lambda matrix: _indicator(matrix, 'rsi_14'),
+    'atr_14': lambda matrix: _indicator(matrix, 'atr_14'),
+    'volatility_20d': lambda matrix: _indicator(matrix, 'volatility_20d'),
+}
@@ -0,0 +1,222 @@
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+
+import numpy as np
+from django.core.management import call_command
+from django.test import TestCase
+
+from currency.models import Currency, CurrencyExchangeRate, LatestExchangeRate
+from screener.history import TimeSeries, as_of, load_euro_price_histories
+from screener.indicators import INDICATORS, Indicator, MovingAverage, RelativeStrengthIndex, update_indicators
+from screener.models import StockIndicators
+from screener.screener import Condition, PriceMatrix, forward_fill
+from stock.models import Stock, StockPrice
+from stock.price_store import PriceStore, StoredPrices
+
+
+class PriceMatrixTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        eur = Currency.objects.create(symbol='EUR', name='Euro')
+        usd = Currency.objects.create(symbol='USD', name='US dollar')
+        CurrencyExchangeRate.objects.create(currency=usd, date=date(2020, 10, 16), rate=Decimal('0.5'))
+        LatestExchangeRate.refresh(Currency.objects.all())
+
+        cls.start = date(2019, 10, 16)
+        falling = Stock.objects.create(symbol='FALL', name='Falling', currency=eur)
+        rising = Stock.objects.create(symbol='RISE', name='Rising', currency=usd)
+        Stock.objects.create(symbol='EMPTY', name='No prices', currency=eur)
+        prices = []
+        for day in range(367):
+            price_date = cls.start + timedelta(days=day)
+            prices.append(StockPrice(stock=falling, date=price_date, open=Decimal(100 - day / 4)))
+            if day % 7 != 0:
+                # Leave gaps in the prices of the rising stock
+                prices.append(StockPrice(stock=rising, date=price_date, open=Decimal(10 + day / 10),
+                                         close=Decimal(10 + day / 10)))
+        StockPrice.objects.bulk_create(prices)
+
+    def test_load(self):
+        matrix = PriceMatrix.load()
+        self.assertEqual(matrix.symbols, ['EMPTY', 'FALL', 'RISE'])
+        self.assertEqual(matrix.prices.shape, (367, 3))
+        self.assertTrue(np.isnan(matrix.prices[:, 0]).all())
+        np.testing.assert_array_equal(matrix.rates, [1, 1, 0.5])
+
+    def test_from_store(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = PriceStore(directory)
+            for stock in Stock.objects.all():
+                store.export_stock(stock)
+            loaded = PriceMatrix.load(start=date(2020, 1, 1))
+            stored = PriceMatrix.from_store(store, start=date(2020, 1, 1))
+            self.assertEqual(stored.symbols, loaded.symbols)
+            np.testing.assert_array_equal(stored.dates, loaded.dates)
+            np.testing.assert_array_equal(stored.prices, loaded.prices)
+            np.testing.assert_array_equal(stored.metric('price_in_euro'), loaded.metric('price_in_euro'))
+
+            # Stale stocks are read from the database
+            rise = Stock.objects.get(symbol='RISE')
+            store.delete('RISE')
+            store.mark_stale(rise.pk)
+            stored = PriceMatrix.from_store(store, start=date(2020, 1, 1))
+            np.testing.assert_array_equal(stored.prices, loaded.prices)
+
+    def test_metrics(self):
+        matrix = PriceMatrix.load()
+        np.testing.assert_allclose(matrix.metric('price'), [np.nan, 8.5, 46.6])
+        np.testing.assert_allclose(matrix.metric('price_in_euro'), [np.nan, 8.5, 23.3])
+        self.assertAlmostEqual(matrix.metric('drawdown_52w')[1], 1 - 8.5 / 99.25)
+        self.assertAlmostEqual(matrix.metric('drawdown_52w')[2], 0)
+        self.assertGreater(matrix.metric('momentum_12m')[2], 1)
+
+    def test_screen(self):
+        matrix = PriceMatrix.load()
+        self.assertEqual(matrix.screen(Condition.parse('price_in_euro < 20')), ['FALL'])
+        self.assertEqual(matrix.screen(Condition.parse('drawdown_52w > 30%')), ['FALL'])
+        self.assertEqual(matrix.screen(Condition.parse('momentum_3m > 0'), Condition.parse('price < 100')), ['RISE'])
+        condition = Condition.parse('price_in_euro < 10') | Condition.parse('momentum_1m > 0')
+        self.assertEqual(matrix.screen(condition), ['FALL', 'RISE'])
+
+    def test_invalid_expression(self):
+        with self.assertRaises(ValueError):
+            Condition.parse('unknown_metric < 10')
+        with self.assertRaises(ValueError):
+            Condition.parse('price <')
+
+    def test_forward_fill(self):
+        matrix = np.array([[np.nan, 1], [2, np.nan], [np.nan, np.nan], [3, 4]])
+        expected = np.array([[np.nan, 1], [2, 1], [2, 1], [3, 4]])
+        np.testing.assert_array_equal(forward_fill(matrix), expected)
+
+    def test_screen_command(self):
+        stdout = StringIO()
+        call_command('screen', 'price_in_euro < 20', stdout=stdout)
+        self.assertEqual(stdout.getvalue().splitlines()[1:], ['FALL\t8.5000'])
+
+
+class HistoryTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        eur = Currency.objects.create(symbol='EUR', name='Euro')
+        usd = Currency.objects.create(symbol='USD', name='US dollar')
+        # Friday and Monday, the rate of Friday is carried over the weekend
+        CurrencyExchangeRate.objects.create(currency=usd, date=date(2020, 10, 16), rate=Decimal('0.8'))
+        CurrencyExchangeRate.objects.create(currency=usd, date=date(2020, 10, 19), rate=Decimal('0.5'))
+        dollar_stock = Stock.objects.create(symbol='USD1', name='Dollar stock', currency=usd)
+        euro_stock = Stock.objects.create(symbol='EUR1', name='Euro stock', currency=eur)
+        for day in range(15, 21):
+            price_date = date(2020, 10, day)
+            StockPrice.objects.create(stock=dollar_stock, date=price_date, open=Decimal(day))
+            StockPrice.objects.create(stock=euro_stock, date=price_date, open=Decimal(day))
+
+    def test_as_of(self):
+        series = TimeSeries(np.array(['2020-10-16', '2020-10-19'], dtype='datetime64[D]'), np.array([1.0, 2.0]))
+        dates = np.array(['2020-10-20', '2020-10-15', '2020-10-17', '2020-10-19'], dtype='datetime64[D]')
+        np.testing.assert_array_equal(as_of(series, dates), [2, np.nan, 1, 2])
+
+    def test_load_euro_price_histories(self):
+        with self.assertNumQueries(3):
+            histories = load_euro_price_histories()
+
+        dollar = histories['USD1']
+        self.assertEqual(dollar.dates[0], np.datetime64('2020-10-15'))
+        np.testing.assert_allclose(dollar.values, [np.nan, 16 * 0.8, 17 * 0.8, 18 * 0.8, 19 * 0.5, 20 * 0.5])
+        np.testing.assert_array_equal(histories['EUR1'].values, [15, 16, 17, 18, 19, 20])
+
+    def test_matrix_euro_prices(self):
+        matrix = PriceMatrix.load()
+        self.assertEqual(matrix.symbols, ['EUR1', 'USD1'])
+        np.testing.assert_allclose(matrix.euro_prices[:, 1], [np.nan, 16 * 0.8, 17 * 0.8, 18 * 0.8, 19 * 0.5, 20 * 0.5])
+        np.testing.assert_array_equal(matrix.euro_prices[:, 0], [15, 16, 17, 18, 19, 20])
+
+
+class IndicatorTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        eur = Currency.objects.create(symbol='EUR', name='Euro')
+        cls.stock = Stock.objects.create(symbol='WAVE', name='Wave', currency=eur)
+        cls.start = date(2019, 1, 1)
+        prices = []
+        for day in range(500):
+            if day % 7 in (5, 6):
+                continue
+            wave = 10 * np.sin(day / 10)
+            prices.append(StockPrice(stock=cls.stock, date=cls.start + timedelta(days=day),
+                                     open=Decimal(f'{100 + wave:.4f}'),
+                                     close=Decimal(f'{101 + wave:.4f}') if day % 5 else None,
+                                     high=Decimal(f'{112 + wave:.4f}'), low=Decimal(f'{90 + wave:.4f}')))
+        StockPrice.objects.bulk_create(prices)
+
+    @staticmethod
+    def _bars(nr_bars: int) -> StoredPrices:
+        days = np.arange(nr_bars, dtype=np.int32) + 18000
+        prices = 100 + np.cumsum(np.sin(np.arange(nr_bars) / 3))
+        return StoredPrices(days, np.vstack([prices, prices + 0.5, prices + 2, prices - 2]))
+
+    def test_indicators_implement_compute(self):
+        class Unfinished(Indicator):
+            name = 'unfinished'
+
+        with self.assertRaises(TypeError):
+            Unfinished()
+
+    def test_incremental_updates_match_full_computation(self):
+        bars = self._bars(600)
+        for indicator in INDICATORS:
+            expected, _ = indicator.compute(bars)
+            values, state = [], None
+            for start, end in [(0, 1), (1, 30), (30, 31), (31, 400), (400, 400), (400, 600)]:
+                chunk_values, state = indicator.compute(StoredPrices(bars.days[start:end], bars.prices[:, start:end]),
+                                                        state)
+                values.append(chunk_values)
+            np.testing.assert_allclose(np.concatenate(values), expected, err_msg=indicator.name)
+
+    def test_indicator_values(self):
+        bars = StoredPrices(np.arange(5, dtype=np.int32), np.tile([1.0, 2.0, 3.0, 4.0, 5.0], (4, 1)))
+        np.testing.assert_array_equal(MovingAverage(3).compute(bars)[0], [np.nan, np.nan, 2, 3, 4])
+        np.testing.assert_array_equal(RelativeStrengthIndex(2).compute(bars)[0], [np.nan, np.nan, 100, 100, 100])
+
+    def test_update_indicators(self):
+        indicators = update_indicators(self.stock)
+        expected_high = max(float(price.close or price.open) for price in self.stock.prices.filter(
+            date__gt=indicators.date - timedelta(days=364)))
+        self.assertAlmostEqual(indicators.high_52w, expected_high)
+        self.assertIsNotNone(indicators.sma_200)
+
+        last = indicators.date
+        StockPrice.objects.bulk_create([
+            StockPrice(stock=self.stock, date=last + timedelta(days=day), open=Decimal(120 + day),
+                       close=Decimal(121 + day))
+            for day in range(1, 4)
+        ])
+        # Only the new prices are read
+        with self.assertNumQueries(5):
+            incremental = update_indicators(self.stock, since=last + timedelta(days=1))
+        full = update_indicators(self.stock)
+        self.assertEqual(incremental.date, last + timedelta(days=3))
+        for indicator in INDICATORS:
+            self.assertAlmostEqual(getattr(incremental, indicator.name), getattr(full, indicator.name),
+                                   msg=indicator.name)
+
+    def test_replacing_the_last_price_is_incremental(self):
+        last = update_indicators(self.stock).date
+        StockPrice.objects.filter(stock=self.stock, date=last).update(close=Decimal(150), high=Decimal(151))
+
+        with self.assertNumQueries(5):
+            incremental = update_indicators(self.stock, since=last)
+        full = update_indicators(self.stock)
+        self.assertEqual(incremental.date, last)
+        self.assertAlmostEqual(incremental.high_52w, 150)
+        for indicator in INDICATORS:
+            self.assertAlmostEqual(getattr(incremental, indicator.name), getattr(full, indicator.name),
+                                   msg=indicator.name)
+
+    def test_screen_on_indicators(self):
+        update_indicators(self.stock)
+        matrix = PriceMatrix.load()
+        rsi = StockIndicators.objects.get(stock=self.stock).rsi_14
+        self.assertEqual(matrix.screen(Condition.compare('rsi_14', '<=', rsi)), ['WAVE'])
+        self.assertEqual(matrix.screen(Condition.compare('rsi_14', '>', rsi)), [])
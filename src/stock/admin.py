@@ -1,15 +1,27 @@
 from django.contrib import admin
 
-from stock.models import Stock, StockPrice
+from common.admin import PaginatedTabularInline
+from common.models import Ingestion
+from stock.models import LatestStockPrice, Stock, StockPrice
 
 
-class StockPriceInline(admin.TabularInline):
+class StockPriceInline(PaginatedTabularInline):
     model = StockPrice
     readonly_fields = ('date', 'open', 'close', 'high', 'low')
     extra = 0
+    ordering = ('-date',)
+    page_param = 'prices_page'
 
 
 @admin.register(Stock)
 class StockAdmin(admin.ModelAdmin):
     list_display = ('symbol', 'ticker', 'name', 'currency', 'price', 'price_in_euro')
     inlines = (StockPriceInline,)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_latest_price()
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        LatestStockPrice.refresh(Stock.objects.filter(pk=form.instance.pk))
+        Ingestion.record()
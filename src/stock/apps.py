@@ -1,5 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete
 
 
 class StockConfig(AppConfig):
     name = 'stock'
+
+    def ready(self):
+        from stock.models import Stock, StockPrice
+        from stock.price_store import mark_deleted_prices_stale, remove_deleted_stock
+
+        post_delete.connect(mark_deleted_prices_stale, sender=StockPrice,
+                            dispatch_uid='stock.mark_deleted_prices_stale')
+        post_delete.connect(remove_deleted_stock, sender=Stock, dispatch_uid='stock.remove_deleted_stock')
@@ -0,0 +1,91 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import List
+
+from django.contrib.auth.models import User
+from django.test import Client
+from django.urls import reverse
+
+from common.benchmark import register
+from common.db import bulk_upsert
+from currency.models import Currency, CurrencyExchangeRate, LatestExchangeRate
+from stock.models import LatestStockPrice, Stock, StockPrice
+
+
+def create_stocks_with_prices(nr_stocks: int, nr_days: int) -> List[Stock]:
+    """
+    Create stocks in two currencies with a price on every day before 2020-10-17, and refresh their latest prices
+    """
+
+    usd = Currency.objects.create(symbol='USD', name='US dollar')
+    eur = Currency.objects.create(symbol='EUR', name='Euro')
+    end = date(2020, 10, 16)
+    CurrencyExchangeRate.objects.bulk_create([
+        CurrencyExchangeRate(currency=usd, date=end - timedelta(days=day), rate=Decimal('0.85'))
+        for day in range(nr_days)
+    ])
+    Stock.objects.bulk_create([
+        Stock(symbol=f'BENCH{i:05}', name=f'Benchmark stock {i}', currency=usd if i % 2 else eur)
+        for i in range(nr_stocks)
+    ])
+    # SQLite does not return the primary keys of bulk created rows
+    stocks = list(Stock.objects.all())
+    StockPrice.objects.bulk_create([
+        StockPrice(stock=stock, date=end - timedelta(days=day), open=Decimal(10 + (i + day) % 50),
+                   close=Decimal(11 + (i + day) % 50))
+        for i, stock in enumerate(stocks)
+        for day in range(nr_days)
+    ], batch_size=1000)
+    LatestExchangeRate.refresh(Currency.objects.all())
+    LatestStockPrice.refresh(Stock.objects.all())
+    return stocks
+
+
+@register('stock.bulk_upsert_new_prices')
+def bulk_upsert_new_prices(scale: int):
+    stocks = create_stocks_with_prices(10, 0)
+    start = date(2000, 1, 1)
+    prices = [
+        StockPrice(stock=stock, date=start + timedelta(days=day), open=Decimal('10.5'), close=Decimal('11.25'),
+                   high=Decimal(12), low=Decimal(10))
+        for stock in stocks
+        for day in range(1000 * scale)
+    ]
+    return lambda: bulk_upsert(StockPrice, prices, unique_fields=('stock', 'date'),
+                               update_fields=('open', 'close', 'high', 'low'))
+
+
+@register('stock.bulk_upsert_unchanged_prices')
+def bulk_upsert_unchanged_prices(scale: int):
+    """
+    Upsert prices that are already stored, which is what a forced update of the full history does
+    """
+
+    create_stocks_with_prices(10, 1000 * scale)
+    prices = list(StockPrice.objects.all())
+    return lambda: bulk_upsert(StockPrice, prices, unique_fields=('stock', 'date'),
+                               update_fields=('open', 'close', 'high', 'low'))
+
+
+@register('stock.price_in_euro')
+def price_in_euro(scale: int):
+    """
+    Read price_in_euro of 500 stocks with their latest prices joined
+    """
+
+    create_stocks_with_prices(500 * scale, 5)
+    return lambda: [stock.price_in_euro for stock in Stock.objects.with_latest_price()]
+
+
+@register('stock.admin_changelist', rounds=3)
+def admin_changelist(scale: int):
+    """
+    Render the first page of the admin changelist of 500 stocks
+    """
+
+    create_stocks_with_prices(500 * scale, 5)
+    user = User.objects.create_superuser(username='benchmark', email='benchmark@example.com', password='benchmark')
+    client = Client()
+    client.force_login(user)
+    url = reverse('admin:stock_stock_changelist')
+    return lambda: client.get(url)
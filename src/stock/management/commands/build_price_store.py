@@ -0,0 +1,41 @@
+from django.core.management import BaseCommand, CommandError
+
+from stock.models import Stock
+from stock.price_store import PriceStore
+
+
+class Command(BaseCommand):
+    help = 'Write the prices of all stocks in the database to the price store (PRICE_STORE_DIR)'
+
+    def handle(self, *args, **options):
+        store = PriceStore.from_settings()
+        if store is None:
+            raise CommandError('The price store is disabled, set PRICE_STORE_DIR to use it')
+
+        stocks = Stock.objects.all()
+        if options['symbols']:
+            stocks = stocks.filter(symbol__in=options['symbols'])
+        if options['stale']:
+            stocks = stocks.filter(pk__in=store.stale_stock_ids())
+        nr_stocks = 0
+        for stock in stocks.iterator():
+            store.export_stock(stock)
+            nr_stocks += 1
+
+        if not options['symbols']:
+            # Remove stocks that no longer exist in the database
+            symbols = set(Stock.objects.values_list('symbol', flat=True))
+            for symbol in store.symbols():
+                if symbol not in symbols:
+                    store.delete(symbol)
+            stock_ids = set(Stock.objects.values_list('pk', flat=True))
+            for stock_id in store.stale_stock_ids():
+                if stock_id not in stock_ids:
+                    store.clear_stale(stock_id)
+        self.stdout.write(f'Wrote prices of {nr_stocks} stocks to {store.directory}')
+
+    def add_arguments(self, parser):
+        parser.add_argument('symbols', type=str, nargs='*',
+                            help='Symbols of the stocks to write. Optional, default = all stocks')
+        parser.add_argument('--stale', action='store_true',
+                            help='Only write the stocks that are marked as stale, e.g. because prices were deleted')
@@ -0,0 +1,43 @@
+# Generated by Django 3.1.2 on 2026-10-18 16:55
+
+from django.db import migrations
+from django.db.models import Count, Max
+
+from stock.price_store import PriceStore
+
+
+def remove_duplicate_prices(apps, schema_editor):
+    """
+    Keep only the newest price of a stock per date, such that the unique constraint can be added
+
+    The price store may contain another one of the prices, so the stocks are marked as stale in the price store.
+    """
+
+    StockPrice = apps.get_model('stock', 'StockPrice')
+    store = PriceStore.from_settings()
+    duplicates = StockPrice.objects.order_by().values('stock', 'date').annotate(
+        newest=Max('id'), count=Count('id')).filter(count__gt=1)
+    for duplicate in duplicates:
+        StockPrice.objects.filter(stock=duplicate['stock'], date=duplicate['date']).exclude(
+            id=duplicate['newest']).delete()
+        if store:
+            store.mark_stale(duplicate['stock'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_prices, migrations.RunPython.noop),
+        migrations.AlterModelOptions(
+            name='stockprice',
+            options={'ordering': ('stock', '-date')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='stockprice',
+            unique_together={('stock', 'date')},
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 3.1.2 on 2026-10-18 17:03
+
+from decimal import Decimal
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_latest_stock_prices(apps, schema_editor):
+    Stock = apps.get_model('stock', 'Stock')
+    StockPrice = apps.get_model('stock', 'StockPrice')
+    LatestExchangeRate = apps.get_model('currency', 'LatestExchangeRate')
+    LatestStockPrice = apps.get_model('stock', 'LatestStockPrice')
+    rates = dict(LatestExchangeRate.objects.values_list('currency_id', 'rate'))
+    for stock in Stock.objects.all():
+        latest = StockPrice.objects.filter(stock=stock).order_by('-date').first()
+        if latest:
+            price = latest.close or latest.open
+            rate = rates.get(stock.currency_id, Decimal(1))
+            LatestStockPrice.objects.create(stock=stock, date=latest.date, price=price, rate=rate,
+                                            price_in_euro=price * rate)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('currency', '0003_latest_exchange_rate'),
+        ('stock', '0002_unique_price_per_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatestStockPrice',
+            fields=[
+                ('stock', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='latest_price', serialize=False, to='stock.stock')),
+                ('date', models.DateField()),
+                ('price', models.DecimalField(decimal_places=4, max_digits=10)),
+                ('rate', models.DecimalField(decimal_places=4, help_text='Value of 1 unit of the currency in EUR', max_digits=10)),
+                ('price_in_euro', models.DecimalField(decimal_places=4, max_digits=20)),
+            ],
+        ),
+        migrations.RunPython(fill_latest_stock_prices, migrations.RunPython.noop),
+    ]
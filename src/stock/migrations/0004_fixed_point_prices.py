@@ -0,0 +1,35 @@
+# Generated by Django 3.1.2 on 2026-10-18 17:38
+
+import common.fields
+from common.fields import convert_to_fixed_point
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock', '0003_latest_stock_price'),
+    ]
+
+    operations = convert_to_fixed_point('stock_stockprice', ['open', 'close', 'high', 'low'], 10, 4, [
+        migrations.AlterField(
+            model_name='stockprice',
+            name='close',
+            field=common.fields.FixedPointField(blank=True, decimal_places=4, max_digits=10, null=True),
+        ),
+        migrations.AlterField(
+            model_name='stockprice',
+            name='high',
+            field=common.fields.FixedPointField(blank=True, decimal_places=4, max_digits=10, null=True),
+        ),
+        migrations.AlterField(
+            model_name='stockprice',
+            name='low',
+            field=common.fields.FixedPointField(blank=True, decimal_places=4, max_digits=10, null=True),
+        ),
+        migrations.AlterField(
+            model_name='stockprice',
+            name='open',
+            field=common.fields.FixedPointField(decimal_places=4, max_digits=10),
+        ),
+    ])
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.2 on 2026-10-18 18:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock', '0005_date_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stockprice',
+            name='provisional',
+            field=models.BooleanField(default=False, help_text='Whether the price is an intraday quote, to be replaced by the price of the day in the next download of the history'),
+        ),
+    ]
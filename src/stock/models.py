@@ -2,9 +2,25 @@ from decimal import Decimal
 from typing import Optional
 
 from django.db import models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
 
-from common.utils import round_currency
-from currency.models import Currency
+from common.cache import market_data_cache
+from common.db import bulk_upsert
+from common.fields import FixedPointField
+from common.utils import chunked, round_currency
+from currency.models import Currency, CurrencyExchangeRate
+
+
+class StockQuerySet(models.QuerySet):
+    def with_latest_price(self) -> 'StockQuerySet':
+        """
+        Join the stocks with their latest price and the latest exchange rate of their currency
+
+        This avoids extra queries per stock when the price properties of many stocks are needed.
+        """
+
+        return self.select_related('currency__latest_rate', 'latest_price')
 
 
 class Stock(models.Model):
@@ -16,23 +32,28 @@ class Stock(models.Model):
     currency = models.ForeignKey(Currency, on_delete=models.CASCADE)
 
     prices: models.QuerySet['StockPrice']
+    latest_price: 'LatestStockPrice'  # Dynamically added by class LatestStockPrice
+
+    objects = StockQuerySet.as_manager()
 
     class Meta:
         ordering = ('symbol',)
 
     @property
     def price(self) -> Optional[Decimal]:
-        first_price = self.prices.first()
-        if first_price:
-            return first_price.current
-        else:
+        self._load_latest_price()
+        try:
+            return round_currency(self.latest_price.price)
+        except LatestStockPrice.DoesNotExist:
             return None
 
     @property
     def price_in_euro(self) -> Optional[Decimal]:
         price = self.price
-        rate = self.currency.rate
-        if price and rate:
+        if not price:
+            return None
+        rate = self.latest_price.rate
+        if rate:
             return round_currency(price * rate)
         else:
             return None
@@ -40,22 +61,44 @@ class Stock(models.Model):
     def __str__(self):
         return self.symbol
 
+    def _load_latest_price(self):
+        """
+        Load the latest price from the market data cache, unless it was already joined by with_latest_price
+        """
+
+        related = Stock.latest_price.related
+        if not related.is_cached(self):
+            latest_price = market_data_cache.get_or_set(
+                f'latest_price:{self.pk}', lambda: LatestStockPrice.objects.filter(stock_id=self.pk).first())
+            related.set_cached_value(self, latest_price)
+
 
 class StockPrice(models.Model):
     """
     Price of a stock at a certain date, in its original currency
     """
 
+    help_provisional = 'Whether the price is an intraday quote, to be replaced by the price of the day in the next ' \
+                       'download of the history'
+
     stock = models.ForeignKey(Stock, related_name='prices', on_delete=models.CASCADE)
     date = models.DateField()
-    open = models.DecimalField(max_digits=10, decimal_places=4)
-    close = models.DecimalField(max_digits=10, decimal_places=4, blank=True, null=True)
-    high = models.DecimalField(max_digits=10, decimal_places=4, blank=True, null=True)
-    low = models.DecimalField(max_digits=10, decimal_places=4, blank=True, null=True)
+    open = FixedPointField(max_digits=10, decimal_places=4)
+    close = FixedPointField(max_digits=10, decimal_places=4, blank=True, null=True)
+    high = FixedPointField(max_digits=10, decimal_places=4, blank=True, null=True)
+    low = FixedPointField(max_digits=10, decimal_places=4, blank=True, null=True)
+    provisional = models.BooleanField(default=False, help_text=help_provisional)
 
     class Meta:
+        # The unique index on stock and date serves the prices of a stock, in any date range and in either order. The
+        # index on date and stock serves the prices of all stocks on a date or since a date. Bulk reads should clear
+        # the ordering with order_by(), or sort by date. See the explain_queries command for the plans of the core
+        # queries.
         ordering = ('stock', '-date')
         unique_together = ('stock', 'date')
+        indexes = [
+            models.Index(fields=['date', 'stock'], name='stockprice_date_stock_idx'),
+        ]
 
     @property
     def current(self) -> Decimal:
@@ -68,3 +111,51 @@ class StockPrice(models.Model):
 
     def __str__(self):
         return f'{self.current:0.2f} ({self.date})'
+
+
+class LatestStockPrice(models.Model):
+    """
+    Copy of the latest StockPrice of a stock, together with the latest exchange rate of its currency
+
+    This table is kept up to date by calling refresh after stock prices or exchange rates have been written, such that
+    the current price of a stock can be read without sorting all its prices.
+    """
+
+    stock = models.OneToOneField(Stock, related_name='latest_price', on_delete=models.CASCADE, primary_key=True)
+    date = models.DateField()
+    price = models.DecimalField(max_digits=10, decimal_places=4)
+    rate = models.DecimalField(max_digits=10, decimal_places=4, help_text=CurrencyExchangeRate.help_rate)
+    price_in_euro = models.DecimalField(max_digits=20, decimal_places=4)
+
+    def __str__(self):
+        return f'{round_currency(self.price):0.2f} ({self.date})'
+
+    @classmethod
+    def refresh(cls, stocks: models.QuerySet):
+        """
+        Update the latest prices of the given stocks
+
+        The exchange rates are read from LatestExchangeRate, which should be refreshed first.
+
+        :param stocks: Stocks to update
+        """
+
+        latest_prices = StockPrice.objects.filter(stock=OuterRef('pk')).order_by('-date')
+        rows = stocks.order_by().annotate(
+            latest_date=Subquery(latest_prices.values('date')[:1]),
+            current_price=Subquery(latest_prices.annotate(current=Coalesce('close', 'open')).values('current')[:1]),
+        ).values_list('pk', 'latest_date', 'current_price', 'currency__latest_rate__rate')
+
+        latest_stock_prices, without_prices = [], []
+        for stock_id, latest_date, current_price, rate in rows.iterator():
+            if latest_date is None:
+                without_prices.append(stock_id)
+                continue
+            if rate is None:
+                rate = Decimal(1)
+            latest_stock_prices.append(cls(stock_id=stock_id, date=latest_date, price=current_price, rate=rate,
+                                           price_in_euro=current_price * rate))
+        for chunk in chunked(without_prices, 500):
+            cls.objects.filter(stock_id__in=chunk).delete()
+        bulk_upsert(cls, latest_stock_prices, unique_fields=('stock',),
+                    update_fields=('date', 'price', 'rate', 'price_in_euro'))
@@ -0,0 +1,263 @@
+import logging
+import os
+from typing import Dict, Iterable, List, NamedTuple, Optional
+from urllib.parse import quote, unquote
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import QuerySet
+
+from common.fields import values_arrays
+from stock.models import Stock, StockPrice
+
+logger = logging.getLogger(__name__)
+
+EPOCH = np.datetime64('1970-01-01', 'D')
+
+
+class StoredPrices(NamedTuple):
+    """
+    Price history of a single stock, as columns sorted by date
+
+    days: Int32 array with the number of days since 1970-01-01 of every price
+    prices: Float64 matrix with the open, close, high and low price as rows, NaN if unknown
+    """
+
+    days: np.ndarray
+    prices: np.ndarray
+
+    @property
+    def dates(self) -> np.ndarray:
+        return EPOCH + self.days.astype('timedelta64[D]')
+
+    @property
+    def open(self) -> np.ndarray:
+        return self.prices[0]
+
+    @property
+    def close(self) -> np.ndarray:
+        return self.prices[1]
+
+    @property
+    def high(self) -> np.ndarray:
+        return self.prices[2]
+
+    @property
+    def low(self) -> np.ndarray:
+        return self.prices[3]
+
+    @property
+    def current(self) -> np.ndarray:
+        """
+        Close price, or the open price if the close price is unknown, like StockPrice.current
+        """
+
+        return np.where(np.isnan(self.close), self.open, self.close)
+
+
+class PriceStore:
+    """
+    Columnar copy of the StockPrice table on disk, with a pair of .npy files per stock
+
+    Reads are memory mapped, so loading the history of all stocks only maps files into memory instead of querying and
+    converting millions of rows. Files are replaced atomically, so readers never see a partially written file.
+
+    A stock is marked stale when its files may differ from the database, e.g. when prices were deleted or a merge
+    failed. Its prices should then be read from the database, until export_stock rebuilds its files.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    @classmethod
+    def from_settings(cls) -> Optional['PriceStore']:
+        """
+        Return the store configured in the PRICE_STORE_DIR setting, or None if the store is disabled
+        """
+
+        directory = getattr(settings, 'PRICE_STORE_DIR', None)
+        if directory:
+            return cls(directory)
+        return None
+
+    def symbols(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(unquote(file_name[:-len('.days.npy')])
+                      for file_name in os.listdir(self.directory) if file_name.endswith('.days.npy'))
+
+    def read(self, symbol: str) -> Optional[StoredPrices]:
+        """
+        Memory map the price history of the given stock
+
+        :return: Price history, or None if the store has no prices for this stock
+        """
+
+        days_file, prices_file = self._get_file_names(symbol)
+        for _ in range(2):
+            try:
+                days = np.load(days_file, mmap_mode='r')
+                prices = np.load(prices_file, mmap_mode='r')
+            except FileNotFoundError:
+                return None
+            if len(days) == prices.shape[1]:
+                return StoredPrices(days, prices)
+            # A writer replaced one of the files in between, read both again
+        msg = f'Price store files of {symbol} are inconsistent'
+        raise ValueError(msg)
+
+    def read_all(self) -> Dict[str, StoredPrices]:
+        stored = {symbol: self.read(symbol) for symbol in self.symbols()}
+        return {symbol: prices for symbol, prices in stored.items() if prices is not None}
+
+    def write(self, symbol: str, stored: StoredPrices):
+        """
+        Replace the price history of the given stock
+        """
+
+        os.makedirs(self.directory, exist_ok=True)
+        days_file, prices_file = self._get_file_names(symbol)
+        self._save_atomically(prices_file, np.ascontiguousarray(stored.prices, dtype=np.float64))
+        self._save_atomically(days_file, np.ascontiguousarray(stored.days, dtype=np.int32))
+
+    def merge(self, symbol: str, new: StoredPrices):
+        """
+        Add the given prices to the price history of the stock, overwriting existing prices on the same dates
+        """
+
+        existing = self.read(symbol)
+        if existing is not None and len(existing.days):
+            days = np.concatenate([new.days, existing.days])
+            prices = np.concatenate([new.prices, existing.prices], axis=1)
+            # np.unique returns the first occurrence of every day, which is the new price
+            days, indices = np.unique(days, return_index=True)
+            new = StoredPrices(days, prices[:, indices])
+        else:
+            order = np.argsort(new.days, kind='stable')
+            new = StoredPrices(new.days[order], new.prices[:, order])
+        self.write(symbol, new)
+
+    def merge_or_mark_stale(self, stock: Stock, new: StoredPrices):
+        """
+        Merge the prices like merge, or mark the stock as stale if that fails, instead of raising the error
+
+        The prices are already in the database when they are merged, so failing to merge them should not fail the
+        ingestion. Stale stocks are not merged at all, as their files are rebuilt anyway.
+        """
+
+        if self.is_stale(stock.pk):
+            return
+        try:
+            self.merge(stock.symbol, new)
+        except Exception:
+            logger.exception(f'Failed to merge the prices of {stock.symbol} into the price store, marking it as stale')
+            self.mark_stale(stock.pk)
+
+    def delete(self, symbol: str):
+        for file_name in self._get_file_names(symbol):
+            if os.path.exists(file_name):
+                os.remove(file_name)
+
+    def export_stock(self, stock: Stock):
+        """
+        Replace the price history of the given stock by all its prices in the database, which makes it no longer stale
+        """
+
+        self.write(stock.symbol, query_stored_prices(StockPrice.objects.filter(stock=stock).order_by('date')))
+        self.clear_stale(stock.pk)
+
+    def mark_stale(self, stock_id: int):
+        """
+        Record that the files of the stock may differ from the database, until export_stock rebuilds them
+
+        Stocks are marked by ID, so the stock itself is not queried, e.g. when its prices are deleted one by one.
+        """
+
+        try:
+            os.makedirs(self._stale_directory, exist_ok=True)
+            open(os.path.join(self._stale_directory, str(stock_id)), 'a').close()
+        except OSError:
+            logger.exception(f'Failed to mark stock {stock_id} as stale in the price store, rebuild the price store')
+
+    def clear_stale(self, stock_id: int):
+        file_name = os.path.join(self._stale_directory, str(stock_id))
+        if os.path.exists(file_name):
+            os.remove(file_name)
+
+    def is_stale(self, stock_id: int) -> bool:
+        return os.path.exists(os.path.join(self._stale_directory, str(stock_id)))
+
+    def stale_stock_ids(self) -> List[int]:
+        if not os.path.isdir(self._stale_directory):
+            return []
+        return sorted(int(file_name) for file_name in os.listdir(self._stale_directory))
+
+    @property
+    def _stale_directory(self) -> str:
+        return os.path.join(self.directory, 'stale')
+
+    def _get_file_names(self, symbol: str) -> (str, str):
+        base_name = os.path.join(self.directory, quote(symbol, safe=''))
+        return f'{base_name}.days.npy', f'{base_name}.prices.npy'
+
+    @staticmethod
+    def _save_atomically(file_name: str, array: np.ndarray):
+        tmp_file_name = f'{file_name}.{os.getpid()}.tmp'
+        with open(tmp_file_name, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp_file_name, file_name)
+
+
+def to_stored_prices(rows: Iterable[tuple]) -> StoredPrices:
+    """
+    Convert rows of (date, open, close, high, low) into columns, with NaN for unknown prices
+    """
+
+    rows = list(rows)
+    days = np.array([row[0] for row in rows], dtype='datetime64[D]')
+    prices = np.array([[np.nan if value is None else float(value) for value in row[1:]] for row in rows],
+                      dtype=np.float64).reshape(len(rows), 4)
+    return StoredPrices((days - EPOCH).astype(np.int32), prices.T)
+
+
+def query_stored_prices(prices: QuerySet) -> StoredPrices:
+    """
+    Read the given stock prices into columns, without creating a Decimal per price
+
+    :param prices: Stock prices sorted by date
+    """
+
+    dates, *columns = values_arrays(prices, 'date', 'open', 'close', 'high', 'low')
+    return StoredPrices((dates - EPOCH).astype(np.int32), np.vstack(columns).reshape(4, len(dates)))
+
+
+def mark_deleted_prices_stale(sender, instance: StockPrice, **kwargs):
+    """
+    Mark the stock of a deleted price as stale in the price store, connected to the post_delete signal of StockPrice
+
+    The stock is marked right away instead of on commit, so it is at worst rebuilt for nothing if the deletion is
+    rolled back.
+    """
+
+    store = PriceStore.from_settings()
+    if store:
+        store.mark_stale(instance.stock_id)
+
+
+def remove_deleted_stock(sender, instance: Stock, **kwargs):
+    """
+    Remove a deleted stock from the price store once the deletion is committed, connected to the post_delete signal
+    of Stock
+    """
+
+    store = PriceStore.from_settings()
+    if store:
+        # Read from the database until then, in case the deletion is rolled back
+        store.mark_stale(instance.pk)
+
+        def delete():
+            store.delete(instance.symbol)
+            store.clear_stale(instance.pk)
+
+        transaction.on_commit(delete)
@@ -0,0 +1,184 @@
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+import numpy as np
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from currency.models import Currency, CurrencyExchangeRate, LatestExchangeRate
+from stock.models import LatestStockPrice, Stock, StockPrice
+from stock.price_store import PriceStore, to_stored_prices
+
+
+class StockAdminTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser(username='admin', email='admin@example.com', password='admin')
+        cls.usd = Currency.objects.create(symbol='USD', name='US dollar')
+        CurrencyExchangeRate.objects.create(currency=cls.usd, date=date(2020, 10, 15), rate=Decimal('0.9'))
+        CurrencyExchangeRate.objects.create(currency=cls.usd, date=date(2020, 10, 16), rate=Decimal('0.8'))
+        LatestExchangeRate.refresh(Currency.objects.all())
+        cls.stock = cls._create_stocks(1)[0]
+
+    @classmethod
+    def _create_stocks(cls, nr_stocks: int):
+        first = Stock.objects.count()
+        stocks = [
+            Stock.objects.create(symbol=f'STOCK{i}', name=f'Stock {i}', currency=cls.usd)
+            for i in range(first, first + nr_stocks)
+        ]
+        StockPrice.objects.bulk_create([
+            StockPrice(stock=stock, date=date(2020, 10, 14) + timedelta(days=day), open=Decimal(10 + day),
+                       close=Decimal(11 + day) if day < 2 else None)
+            for stock in stocks
+            for day in range(3)
+        ])
+        LatestStockPrice.refresh(Stock.objects.all())
+        return stocks
+
+    def test_annotated_prices_match_properties(self):
+        annotated = Stock.objects.with_latest_price().get(pk=self.stock.pk)
+        self.assertEqual(annotated.price, self.stock.price)
+        self.assertEqual(annotated.price, Decimal('12.00'))
+        self.assertEqual(annotated.price_in_euro, self.stock.price_in_euro)
+        self.assertEqual(annotated.price_in_euro, Decimal('9.60'))
+
+    def test_latest_price_follows_new_prices_and_rates(self):
+        StockPrice.objects.create(stock=self.stock, date=date(2020, 10, 17), open=Decimal(20))
+        CurrencyExchangeRate.objects.create(currency=self.usd, date=date(2020, 10, 17), rate=Decimal('0.5'))
+        LatestExchangeRate.refresh(Currency.objects.filter(pk=self.usd.pk))
+        LatestStockPrice.refresh(Stock.objects.filter(currency=self.usd))
+
+        stock = Stock.objects.with_latest_price().get(pk=self.stock.pk)
+        self.assertEqual(stock.latest_price.date, date(2020, 10, 17))
+        self.assertEqual(stock.price, Decimal('20.00'))
+        self.assertEqual(stock.price_in_euro, Decimal('10.00'))
+
+        StockPrice.objects.filter(stock=self.stock).delete()
+        LatestStockPrice.refresh(Stock.objects.filter(pk=self.stock.pk))
+        self.assertIsNone(Stock.objects.get(pk=self.stock.pk).price)
+
+    def test_changelist_queries_do_not_depend_on_number_of_stocks(self):
+        self.client.force_login(self.user)
+        url = reverse('admin:stock_stock_changelist')
+
+        with CaptureQueriesContext(connection) as few_stocks:
+            response = self.client.get(url)
+        self.assertContains(response, '9.60')
+
+        self._create_stocks(20)
+        with CaptureQueriesContext(connection) as many_stocks:
+            self.client.get(url)
+        self.assertEqual(len(many_stocks), len(few_stocks))
+
+    def test_change_page_shows_one_page_of_prices(self):
+        StockPrice.objects.bulk_create([
+            StockPrice(stock=self.stock, date=date(2019, 1, 1) + timedelta(days=day), open=Decimal(day))
+            for day in range(120)
+        ])
+        self.client.force_login(self.user)
+        url = reverse('admin:stock_stock_change', args=(self.stock.pk,))
+
+        response = self.client.get(url)
+        self.assertEqual(response.context['inline_admin_formsets'][0].formset.initial_form_count(), 50)
+        self.assertContains(response, '123 stock prices from Jan. 1, 2019 to Oct. 16, 2020, showing 1&ndash;50.')
+        self.assertContains(response, '?prices_page=2')
+
+        response = self.client.get(url, {'prices_page': 3})
+        self.assertEqual(response.context['inline_admin_formsets'][0].formset.initial_form_count(), 23)
+        self.assertContains(response, 'showing 101&ndash;123.')
+        self.assertNotContains(response, '?prices_page=4')
+
+        response = self.client.post(f'{url}?prices_page=3', {
+            'symbol': self.stock.symbol, 'name': 'Renamed', 'currency': self.usd.pk,
+            'prices-TOTAL_FORMS': 23, 'prices-INITIAL_FORMS': 23,
+            'prices-MIN_NUM_FORMS': 0, 'prices-MAX_NUM_FORMS': 1000,
+            **{f'prices-{i}-id': price.pk for i, price in enumerate(self.stock.prices.order_by('-date')[100:])},
+            **{f'prices-{i}-stock': self.stock.pk for i in range(23)},
+        })
+        self.assertEqual(response.status_code, 302)
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.name, 'Renamed')
+
+
+class PriceStoreTestCase(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = PriceStore(directory.name)
+
+    def test_merge_and_read(self):
+        self.assertIsNone(self.store.read('CARD.L'))
+        self.store.merge('CARD.L', to_stored_prices([
+            (date(2020, 10, 16), Decimal('10.5'), Decimal('11.5'), Decimal('12'), Decimal('10')),
+            (date(2020, 10, 15), Decimal('10'), None, Decimal('11'), Decimal('9.5')),
+        ]))
+        self.store.merge('CARD.L', to_stored_prices([
+            (date(2020, 10, 19), Decimal('11'), Decimal('11'), Decimal('11.5'), Decimal('10.5')),
+            (date(2020, 10, 16), Decimal('10.5'), Decimal('11.25'), Decimal('12'), Decimal('10')),
+        ]))
+
+        stored = self.store.read('CARD.L')
+        self.assertIsInstance(stored.prices, np.memmap)
+        np.testing.assert_array_equal(stored.dates, np.array(['2020-10-15', '2020-10-16', '2020-10-19'],
+                                                             dtype='datetime64[D]'))
+        np.testing.assert_array_equal(stored.current, [10, 11.25, 11])
+        self.assertEqual(self.store.symbols(), ['CARD.L'])
+
+    def test_build_price_store_command(self):
+        currency = Currency.objects.create(symbol='EUR', name='Euro')
+        stock = Stock.objects.create(symbol='ASML.AS', name='ASML', currency=currency)
+        StockPrice.objects.create(stock=stock, date=date(2020, 10, 16), open=Decimal('300'), close=Decimal('310'))
+        self.store.write('DELISTED', to_stored_prices([]))
+
+        with self.settings(PRICE_STORE_DIR=self.store.directory):
+            call_command('build_price_store', stdout=StringIO())
+        self.assertEqual(self.store.symbols(), ['ASML.AS'])
+        np.testing.assert_array_equal(self.store.read('ASML.AS').prices, [[300], [310], [np.nan], [np.nan]])
+
+    def test_failed_merge_marks_stock_as_stale(self):
+        currency = Currency.objects.create(symbol='EUR', name='Euro')
+        stock = Stock.objects.create(symbol='ASML.AS', name='ASML', currency=currency)
+        new = to_stored_prices([(date(2020, 10, 16), Decimal('300'), None, None, None)])
+
+        with patch.object(PriceStore, 'merge', side_effect=OSError('Disk full')), self.assertLogs('stock.price_store'):
+            self.store.merge_or_mark_stale(stock, new)
+        self.assertTrue(self.store.is_stale(stock.pk))
+
+        # Stale stocks are only rebuilt, not merged
+        self.store.merge_or_mark_stale(stock, new)
+        self.assertIsNone(self.store.read('ASML.AS'))
+
+
+class PriceStoreDeletionTestCase(TransactionTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = PriceStore(directory.name)
+
+    def test_deleted_prices_and_stocks_are_invalidated(self):
+        currency = Currency.objects.create(symbol='EUR', name='Euro')
+        stock = Stock.objects.create(symbol='ASML.AS', name='ASML', currency=currency)
+        StockPrice.objects.create(stock=stock, date=date(2020, 10, 15), open=Decimal('290'))
+        StockPrice.objects.create(stock=stock, date=date(2020, 10, 16), open=Decimal('300'))
+        self.store.export_stock(stock)
+
+        with self.settings(PRICE_STORE_DIR=self.store.directory):
+            stock.prices.filter(date=date(2020, 10, 16)).delete()
+            self.assertEqual(self.store.stale_stock_ids(), [stock.pk])
+
+            call_command('build_price_store', '--stale', stdout=StringIO())
+            self.assertEqual(self.store.stale_stock_ids(), [])
+            np.testing.assert_array_equal(self.store.read('ASML.AS').open, [290])
+
+            stock.delete()
+        self.assertEqual(self.store.symbols(), [])
+        self.assertEqual(self.store.stale_stock_ids(), [])
@@ -0,0 +1,12 @@
+from django.contrib import admin
+
+from yahoo.models import BackfillCheckpoint
+
+
+@admin.register(BackfillCheckpoint)
+class BackfillCheckpointAdmin(admin.ModelAdmin):
+    list_display = ('name', 'stock', 'status', 'start', 'end', 'completed_until', 'attempts', 'updated')
+    list_filter = ('name', 'status')
+    list_select_related = ('stock',)
+    search_fields = ('stock__symbol',)
+    readonly_fields = ('updated',)
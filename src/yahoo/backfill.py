@@ -0,0 +1,169 @@
+import logging
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import date, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from django.db import transaction
+
+from common.db import CommitBatcher, UpsertResult
+from common.utils import date_to_timestamp
+from stock.models import Stock
+from yahoo.models import BackfillCheckpoint
+from yahoo.yahoo import YahooApi
+
+logger = logging.getLogger(__name__)
+
+Chunk = Tuple[date, date]
+
+
+class Backfill:
+    """
+    Resumable fetch of the full price history of many stocks, in date chunks with a checkpoint per stock
+
+    Every chunk is stored in the same transaction as the progress in its BackfillCheckpoint, so running a backfill
+    again with the same name continues with the first chunk that was not stored yet. A stock that fails is marked as
+    failed, its error is kept as a dead letter, and the backfill continues with the other stocks. Failed stocks are
+    skipped when resuming, unless they are explicitly retried.
+
+    Chunks of different stocks are downloaded in parallel by a pool of workers, the chunks of a stock one after the
+    other. Like the fetch command, all database writes are done from the calling thread.
+
+    Usage:
+        backfill = Backfill('2020-full-history', start=date(1970, 1, 1), end=date.today(), chunk_days=1826)
+        result, dead_letters = backfill.run(stocks)
+    """
+
+    def __init__(self, name: str, start: date, end: date, chunk_days: int = 1826, workers: int = 1):
+        """
+        :param name: Name of the backfill, to resume it by
+        :param start: First date of the history of stocks that have no checkpoint yet
+        :param end: Last date of the history of stocks that have no checkpoint yet
+        :param chunk_days: Number of days of history to fetch per call. Optional, default = about 5 years
+        :param workers: Number of stocks to download in parallel. Optional, default = 1
+        """
+
+        if chunk_days < 1:
+            raise ValueError('A chunk should be at least 1 day')
+        self.name = name
+        self.start = start
+        self.end = end
+        self.chunk_days = chunk_days
+        self.workers = workers
+        self.yahoo = YahooApi()
+
+    def get_checkpoints(self, stocks: List[Stock]) -> List[BackfillCheckpoint]:
+        """
+        Return the checkpoints of the given stocks in the same order, creating the ones that do not exist yet
+
+        Existing checkpoints keep their start and end date, so resuming with other dates does not leave gaps.
+        """
+
+        BackfillCheckpoint.objects.bulk_create([
+            BackfillCheckpoint(name=self.name, stock=stock, start=self.start, end=self.end) for stock in stocks
+        ], ignore_conflicts=True)
+        checkpoints = BackfillCheckpoint.objects.filter(name=self.name, stock__in=stocks).select_related('stock')
+        checkpoints_by_stock = {checkpoint.stock_id: checkpoint for checkpoint in checkpoints}
+        return [checkpoints_by_stock[stock.pk] for stock in stocks]
+
+    def run(self, stocks: List[Stock], retry_failed: bool = False,
+            batcher: Optional[CommitBatcher] = None) -> Tuple[UpsertResult, Dict[str, str]]:
+        """
+        Fetch and store all chunks of the given stocks that are not stored yet
+
+        :param stocks: Stocks to backfill
+        :param retry_failed: Whether to retry the stocks that failed in an earlier run. Optional, default = False
+        :param batcher: Batcher to group the chunks into transactions with. Optional, default = a transaction per
+                        chunk
+        :return: Number of inserted, updated and unchanged stock prices, and the dead letters: the error message by
+                 symbol of every stock that failed in this or an earlier run
+        """
+
+        result = UpsertResult()
+        dead_letters = {}
+        todo = []
+        for checkpoint in self.get_checkpoints(stocks):
+            if checkpoint.status == BackfillCheckpoint.FAILED and not retry_failed:
+                dead_letters[checkpoint.stock.symbol] = checkpoint.error
+            elif checkpoint.status != BackfillCheckpoint.COMPLETED:
+                todo.append(checkpoint)
+
+        pending: Dict[Future, Tuple[BackfillCheckpoint, Chunk]] = {}
+        checkpoints = iter(todo)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for _ in range(self.workers):
+                self._submit_next_stock(executor, checkpoints, pending)
+            while pending:
+                if batcher and not any(future.done() for future in pending):
+                    # Do not keep other writers waiting for the downloads
+                    batcher.commit()
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    checkpoint, chunk = pending.pop(future)
+                    stored = self._store_chunk(checkpoint, chunk, future, result, dead_letters)
+                    if batcher:
+                        batcher.done()
+                    if stored:
+                        # Continue with the next chunk of the same stock, or with the next stock once it is complete
+                        if not self._submit(executor, checkpoint, pending):
+                            self._submit_next_stock(executor, checkpoints, pending)
+                    else:
+                        self._submit_next_stock(executor, checkpoints, pending)
+        return result, dead_letters
+
+    def _submit_next_stock(self, executor: ThreadPoolExecutor, checkpoints: Iterator[BackfillCheckpoint],
+                           pending: Dict[Future, Tuple[BackfillCheckpoint, Chunk]]):
+        for checkpoint in checkpoints:
+            if self._submit(executor, checkpoint, pending):
+                return
+
+    def _submit(self, executor: ThreadPoolExecutor, checkpoint: BackfillCheckpoint,
+                pending: Dict[Future, Tuple[BackfillCheckpoint, Chunk]]) -> bool:
+        """
+        Start downloading the next chunk of the stock, or mark its checkpoint as completed if there is none
+
+        :return: Whether a download was started
+        """
+
+        chunk = checkpoint.next_chunk(self.chunk_days)
+        if chunk is None:
+            checkpoint.status = BackfillCheckpoint.COMPLETED
+            checkpoint.error = ''
+            checkpoint.save(update_fields=['status', 'error', 'updated'])
+            return False
+        first, last = chunk
+        # The end of a download is exclusive, so it is the start of the day after the last day of the chunk
+        future = executor.submit(self.yahoo.download_historical_stock_data, checkpoint.stock,
+                                 date_to_timestamp(first), date_to_timestamp(last + timedelta(days=1)))
+        pending[future] = (checkpoint, chunk)
+        return True
+
+    def _store_chunk(self, checkpoint: BackfillCheckpoint, chunk: Chunk, future: Future, result: UpsertResult,
+                     dead_letters: Dict[str, str]) -> bool:
+        """
+        Store the downloaded chunk together with the progress of the stock, or mark the stock as failed
+
+        :return: Whether the chunk was stored
+        """
+
+        symbol = checkpoint.stock.symbol
+        try:
+            response = future.result()
+            with transaction.atomic():
+                if response is not None:
+                    result += self.yahoo.store_historical_stock_data(checkpoint.stock, response)
+                checkpoint.completed_until = chunk[1]
+                checkpoint.status = BackfillCheckpoint.IN_PROGRESS
+                checkpoint.save(update_fields=['completed_until', 'status', 'updated'])
+        except Exception as e:
+            # Continue with the other stocks, the failed ones are retried on request
+            logger.exception(f'Failed to backfill {chunk[0]} to {chunk[1]} of stock {symbol}')
+            checkpoint.completed_until = BackfillCheckpoint.objects.values_list(
+                'completed_until', flat=True).get(pk=checkpoint.pk)
+            checkpoint.status = BackfillCheckpoint.FAILED
+            checkpoint.attempts += 1
+            checkpoint.error = str(e)
+            checkpoint.save(update_fields=['status', 'attempts', 'error', 'updated'])
+            dead_letters[symbol] = checkpoint.error
+            return False
+        logger.debug(f'Backfilled {chunk[0]} to {chunk[1]} of stock {symbol}')
+        return True
@@ -0,0 +1,88 @@
+from datetime import date
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import override_settings
+
+from common.benchmark import register
+from currency.models import Currency
+from stock.models import Stock
+from yahoo.standin import YahooStandin
+from yahoo.yahoo import YahooApi
+
+# Fixed end date of the generated histories, such that every run parses exactly the same data
+END_DATE = date(2020, 10, 16)
+HISTORY_DAYS = 3650
+
+
+def _get_history_csv(symbol: str, history_days: int = HISTORY_DAYS) -> str:
+    standin = YahooStandin(history_days=history_days, end_date=END_DATE, fixtures_dir=None)
+    try:
+        return standin.get_csv(symbol, 0, 2 ** 31)
+    finally:
+        standin.stop()
+
+
+def _create_stocks(nr_stocks: int) -> list:
+    currency = Currency.objects.create(symbol='USD', name='US dollar')
+    Stock.objects.bulk_create([
+        Stock(symbol=f'BENCH{i}', name=f'Benchmark stock {i}', currency=currency)
+        for i in range(nr_stocks)
+    ])
+    # SQLite does not return the primary keys of bulk created rows
+    return list(Stock.objects.all())
+
+
+@register('yahoo.parse_stock_csv')
+def parse_stock_csv(scale: int):
+    stock = Stock(symbol='BENCH')
+    lines = _get_history_csv(stock.symbol, HISTORY_DAYS * scale).splitlines()
+    return lambda: list(YahooApi._iter_stock_prices(stock, lines))
+
+
+@register('yahoo.parse_currency_csv')
+def parse_currency_csv(scale: int):
+    currency = Currency(symbol='USD')
+    lines = _get_history_csv('USDEUR=X', HISTORY_DAYS * scale).splitlines()
+    return lambda: list(YahooApi._iter_currency_exchange_rates(currency, lines))
+
+
+@register('yahoo.store_stock_history')
+def store_stock_history(scale: int):
+    """
+    Parse and store 10 years of prices of a new stock
+    """
+
+    stock = _create_stocks(1)[0]
+    text = _get_history_csv(stock.symbol, HISTORY_DAYS * scale)
+    return lambda: YahooApi._parse_historical_stock_data_response(stock, text)
+
+
+@register('yahoo.store_currency_history')
+def store_currency_history(scale: int):
+    currency = Currency.objects.create(symbol='USD', name='US dollar')
+    text = _get_history_csv('USDEUR=X', HISTORY_DAYS * scale)
+    return lambda: YahooApi._parse_historical_currency_data_response(currency, text)
+
+
+@register('yahoo.fetch_historical_stock_data', rounds=3)
+def fetch_historical_stock_data(scale: int):
+    """
+    Run the fetch command for 20 new stocks with a year of history against a local stand-in of Yahoo
+    """
+
+    symbols = [stock.symbol for stock in _create_stocks(20 * scale)]
+    with YahooStandin(history_days=365, end_date=END_DATE) as standin, \
+            override_settings(YAHOO_BASE_URL=standin.url):
+        yield lambda: call_command('fetch_historical_stock_data', *symbols, '--workers', '4', stdout=StringIO())
+
+
+@register('yahoo.fetch_historical_currency_data', rounds=3)
+def fetch_historical_currency_data(scale: int):
+    currencies = Currency.objects.bulk_create([
+        Currency(symbol=f'BENCH{i}', name=f'Benchmark currency {i}') for i in range(10 * scale)
+    ])
+    symbols = [currency.symbol for currency in currencies]
+    with YahooStandin(history_days=365, end_date=END_DATE) as standin, \
+            override_settings(YAHOO_BASE_URL=standin.url):
+        yield lambda: call_command('fetch_historical_currency_data', *symbols, stdout=StringIO())
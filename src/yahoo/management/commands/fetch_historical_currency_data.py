@@ -1,11 +1,19 @@
-from datetime import date, timedelta
-from typing import Optional
+import logging
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Tuple
 
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 
-from common.utils import date_str_to_timestamp, date_to_timestamp
-from currency.models import Currency
-from yahoo.yahoo import YahooApi
+from common.db import UpsertResult
+from common.instrumentation import add_metrics_arguments, instrumentation, write_metrics
+from common.utils import chunked, date_str_to_timestamp, date_to_timestamp
+from currency.models import Currency, CurrencyExchangeRate
+from yahoo.yahoo import AsyncYahooApi, YahooApi
+
+logger = logging.getLogger(__name__)
 
 
 class Command(BaseCommand):
@@ -18,16 +26,74 @@ class Command(BaseCommand):
         start_str = options['start']
         end_str = options['end']
 
-        for symbol in symbols:
-            try:
-                currency = Currency.objects.get(symbol=symbol)
-            except Currency.DoesNotExist as e:
-                msg = f'No currency with symbol {symbol} exists'
-                raise Currency.DoesNotExist(msg) from e
+        if options['concurrency'] < 1:
+            raise CommandError('The concurrency should be at least 1')
+
+        result = UpsertResult()
+        instrumentation.reset()
+        with instrumentation.count_queries():
+            requests = []
+            for currency in self._get_currencies(symbols):
+                start, end = self._get_start_and_end(start_str, end_str, force_update, currency)
+                if start and start > (end or int(timezone.now().timestamp())):
+                    logger.debug(f'Currency exchange rates of {currency.symbol} are already up to date')
+                    continue
+                requests.append((currency, start, end))
+
+            if options['use_async']:
+                result += self._fetch_currencies_async(yahoo, options, requests)
+            else:
+                for currency, start, end in requests:
+                    currency_result = yahoo.fetch_historical_currency_data(currency, start, end)
+                    if currency_result:
+                        result += currency_result
+
+        write_metrics('fetch_historical_currency_data', self.stdout, options)
+        self.stdout.write(f'Currency exchange rates: {result}')
+
+    @staticmethod
+    def _fetch_currencies_async(yahoo: YahooApi, options: Dict[str, Any],
+                                requests: List[Tuple[Currency, Optional[int], Optional[int]]]) -> UpsertResult:
+        """
+        Download the exchange rates in an event loop, and store them from the calling thread as they come in
+        """
+
+        async_yahoo = AsyncYahooApi(max_concurrency=options['concurrency'], requests_per_second=options['rate_limit'])
 
-            start, end = self._get_start_and_end(start_str, end_str, force_update, currency)
+        async def download(request: Tuple[Currency, Optional[int], Optional[int]]) -> Optional[str]:
+            return await async_yahoo.download_historical_currency_data(*request)
 
-            yahoo.fetch_historical_currency_data(currency, start, end)
+        result = UpsertResult()
+        for (currency, _, _), response, error in async_yahoo.run_in_background(download, requests):
+            if error:
+                raise error
+            if response is not None:
+                result += yahoo.store_historical_currency_data(currency, response)
+        return result
+
+    @staticmethod
+    def _get_currencies(symbols: List[str]) -> List[Currency]:
+        """
+        Return the currencies for the given symbols, annotated with the date of their latest known exchange rate
+
+        Provisional rates of intraday quotes are ignored, so the next download replaces them by the rates of the day.
+
+        :raise Currency.DoesNotExist: if any of the symbols does not exist
+        """
+
+        currencies_by_symbol = {}
+        # Provisional rows are the latest ones, so this only reads a few rows of each currency from the unique index
+        latest_dates = CurrencyExchangeRate.objects.filter(currency=OuterRef('pk'), provisional=False).order_by('-date')
+        for chunk in chunked(symbols, 500):
+            currencies = Currency.objects.filter(symbol__in=chunk).annotate(
+                latest_date=Subquery(latest_dates.values('date')[:1]))
+            currencies_by_symbol.update({currency.symbol: currency for currency in currencies})
+
+        for symbol in symbols:
+            if symbol not in currencies_by_symbol:
+                msg = f'No currency with symbol {symbol} exists'
+                raise Currency.DoesNotExist(msg)
+        return [currencies_by_symbol[symbol] for symbol in symbols]
 
     @staticmethod
     def _get_start_and_end(start_str: str, end_str: str, force_update: bool,
@@ -38,31 +104,23 @@ class Command(BaseCommand):
             start = None
 
         if end_str:
-            end = date_str_to_timestamp(end_str)
+            # The end of a download is exclusive, so the end date is included by ending at the start of the next day
+            end = date_to_timestamp(parse_date(end_str) + timedelta(days=1))
         else:
             end = None
 
-        if not start and not force_update:
-            last_known_date = Command._get_date_of_latest_exchange_rate(currency)
-            if last_known_date:
-                start_date = last_known_date + timedelta(days=1)
-                start = date_to_timestamp(start_date)
+        if not start and not force_update and currency.latest_date:
+            start_date = currency.latest_date + timedelta(days=1)
+            start = date_to_timestamp(start_date)
 
         return start, end
 
-    @staticmethod
-    def _get_date_of_latest_exchange_rate(currency: Currency) -> Optional[date]:
-        last_rate = currency.rates.order_by('date').last()
-        if last_rate:
-            return last_rate.date
-        else:
-            return None
-
     def add_arguments(self, parser):
         help_symbols = 'Space separated list of symbols to fetch data for.'
         parser.add_argument('symbols', type=str, nargs='+', help=help_symbols)
 
-        help_force_update = 'Remove all existing currency exchange rates before importing new ones.'
+        help_force_update = 'Fetch and update all currency exchange rates, not only the ones since the last known ' \
+                            'rate.'
         parser.add_argument('--force-update', dest='force_update', action='store_true',
                             default=False, help=help_force_update)
 
@@ -74,3 +132,14 @@ class Command(BaseCommand):
         help_end = 'End date in the format YYYY-MM-DD. Optional, if not given, all currency exchange rates up to ' \
                    'today are fetched.'
         parser.add_argument('--end', type=str, default=None, help=help_end)
+
+        help_async = 'Download the currencies with asynchronous calls, storing each one as soon as it is downloaded.'
+        parser.add_argument('--async', dest='use_async', action='store_true', default=False, help=help_async)
+
+        help_concurrency = 'Number of currencies to download at the same time with --async. Optional, default = 100'
+        parser.add_argument('--concurrency', type=int, default=100, help=help_concurrency)
+
+        help_rate_limit = 'Maximum number of requests per second to Yahoo with --async. Optional, default = no limit'
+        parser.add_argument('--rate-limit', dest='rate_limit', type=float, default=None, help=help_rate_limit)
+
+        add_metrics_arguments(parser)
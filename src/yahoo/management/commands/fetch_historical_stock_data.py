@@ -1,11 +1,27 @@
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, timedelta
-from typing import Optional
+from functools import partial
+from itertools import chain
+from typing import Callable, Deque, Dict, List, Optional, Tuple
 
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 
-from common.utils import date_str_to_timestamp, date_to_timestamp
-from stock.models import Stock
-from yahoo.yahoo import YahooApi
+from common.db import CommitBatcher, UpsertResult
+from common.instrumentation import add_metrics_arguments, instrumentation, write_metrics
+from common.utils import BackgroundIterator, chunked, date_str_to_timestamp, date_to_timestamp
+from stock.models import Stock, StockPrice
+from yahoo.backfill import Backfill
+from yahoo.yahoo import AsyncYahooApi, YahooApi
+
+logger = logging.getLogger(__name__)
+
+# First date of a backfill without start date, Yahoo has no prices before the Unix epoch
+BACKFILL_START = date(1970, 1, 1)
 
 
 class Command(BaseCommand):
@@ -17,17 +33,186 @@ class Command(BaseCommand):
         force_update = options['force_update']
         start_str = options['start']
         end_str = options['end']
+        workers = options['workers']
+        if workers < 1:
+            raise CommandError('The number of workers should be at least 1')
+        if options['concurrency'] < 1:
+            raise CommandError('The concurrency should be at least 1')
+        if options['backfill'] and options['use_async']:
+            raise CommandError('A backfill cannot be combined with --async')
+        if options['chunk_days'] < 1:
+            raise CommandError('The number of days per chunk should be at least 1')
+        if options['commit_size'] < 1:
+            raise CommandError('The commit size should be at least 1')
+        YahooApi.set_pool_size(workers)
 
-        for symbol in symbols:
-            try:
-                stock = Stock.objects.get(symbol=symbol)
-            except Stock.DoesNotExist as e:
-                msg = f'No stock with symbol {symbol} exists'
-                raise Stock.DoesNotExist(msg) from e
+        instrumentation.reset()
+        with instrumentation.count_queries(), CommitBatcher(options['commit_size']) as self.batcher:
+            stocks = self._get_stocks(symbols)
+            result = UpsertResult()
+            if options['backfill']:
+                failures = self._backfill(stocks, start_str, end_str, workers, options, result)
+            elif options['use_async']:
+                async_yahoo = AsyncYahooApi(max_concurrency=options['concurrency'],
+                                            requests_per_second=options['rate_limit'])
+                failures = self._fetch_stocks_async(yahoo, async_yahoo, stocks, start_str, end_str, force_update,
+                                                    result)
+            else:
+                failures = self._fetch_stocks(yahoo, stocks, start_str, end_str, force_update, workers, result)
+        write_metrics('fetch_historical_stock_data', self.stdout, options)
+        self._report(stocks, failures, result)
+
+    def _fetch_stocks(self, yahoo: YahooApi, stocks: List[Stock], start_str: str, end_str: str,
+                      force_update: bool, workers: int, result: UpsertResult) -> Dict[str, str]:
+        """
+        Download and parse the stock data with a pool of workers, and store it from the calling thread
+
+        Downloads happen in parallel, but all database writes are done from the calling thread, such that there is
+        only a single writer to the database at any time. Workers parse a response while it is being downloaded, and
+        hand it to the writer in batches. Both the number of stocks and the number of batches per stock that are
+        waiting to be stored are bounded, such that memory usage depends neither on the number of stocks nor on the
+        length of their histories.
+
+        :return: Dictionary of symbol to error message for all stocks that could not be fetched
+        """
+
+        failures = {}
+        downloads: Deque[Tuple[Stock, BackgroundIterator]] = deque()
+        max_pending = 2 * workers
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for stock in stocks:
+                start, end = self._get_start_and_end(start_str, end_str, force_update, stock)
+                if start and start > (end or int(timezone.now().timestamp())):
+                    logger.debug(f'Stock prices of {stock.symbol} are already up to date')
+                    continue
+                batches = chunked(yahoo.iter_historical_stock_data(stock, start, end), yahoo.batch_size)
+                downloads.append((stock, BackgroundIterator(executor, batches, max_size=2)))
+                if len(downloads) >= max_pending:
+                    self._store_download(yahoo, *downloads.popleft(), failures, result)
+            while downloads:
+                self._store_download(yahoo, *downloads.popleft(), failures, result)
+        return failures
+
+    def _backfill(self, stocks: List[Stock], start_str: str, end_str: str, workers: int, options: Dict,
+                  result: UpsertResult) -> Dict[str, str]:
+        """
+        Fetch the full history of the stocks in date chunks, resuming the backfill with the given name if it exists
+
+        :return: Dictionary of symbol to error message for all stocks that failed in this or an earlier run
+        """
+
+        start = parse_date(start_str) if start_str else BACKFILL_START
+        end = parse_date(end_str) if end_str else timezone.now().date()
+        backfill = Backfill(options['backfill'], start, end, chunk_days=options['chunk_days'], workers=workers)
+        backfill_result, dead_letters = backfill.run(stocks, retry_failed=options['retry_failed'],
+                                                     batcher=self.batcher)
+        result += backfill_result
+        return dead_letters
 
+    def _fetch_stocks_async(self, yahoo: YahooApi, async_yahoo: AsyncYahooApi, stocks: List[Stock], start_str: str,
+                            end_str: str, force_update: bool, result: UpsertResult) -> Dict[str, str]:
+        """
+        Download the stock data in an event loop, and store it from the calling thread
+
+        Many downloads can be in flight at the same time without a thread per download. Like with _fetch_stocks, all
+        database writes are done from the calling thread while the other downloads continue.
+
+        :return: Dictionary of symbol to error message for all stocks that could not be fetched
+        """
+
+        requests = []
+        for stock in stocks:
             start, end = self._get_start_and_end(start_str, end_str, force_update, stock)
+            if start and start > (end or int(timezone.now().timestamp())):
+                logger.debug(f'Stock prices of {stock.symbol} are already up to date')
+                continue
+            requests.append((stock, start, end))
+
+        async def download(request: Tuple[Stock, Optional[int], Optional[int]]) -> Optional[str]:
+            return await async_yahoo.download_historical_stock_data(*request)
+
+        def store(stock: Stock, response: Optional[str], error: Optional[BaseException]) -> Optional[UpsertResult]:
+            if error:
+                raise error
+            return yahoo.store_historical_stock_data(stock, response) if response is not None else None
+
+        failures = {}
+        # Do not keep other writers waiting for the downloads
+        results = async_yahoo.run_in_background(download, requests, on_wait=self.batcher.commit)
+        for (stock, _, _), response, error in results:
+            self._store(stock, partial(store, stock, response, error), failures, result)
+        return failures
+
+    def _store_download(self, yahoo: YahooApi, stock: Stock, batches: BackgroundIterator,
+                        failures: Dict[str, str], result: UpsertResult):
+        """
+        Store the prices of the stock while they are being downloaded, or record the error of the download or of
+        storing them
+        """
+
+        if not batches.ready:
+            # Do not keep other writers waiting for the download
+            self.batcher.commit()
+        try:
+            self._store(stock, partial(yahoo.store_stock_prices, stock, chain.from_iterable(batches)), failures, result)
+        finally:
+            # Stop the download if storing failed
+            batches.close()
+
+    def _store(self, stock: Stock, store: Callable[[], Optional[UpsertResult]], failures: Dict[str, str],
+               result: UpsertResult):
+        """
+        Store the prices of the stock, or record the error of the download or of storing them
+
+        The prices of a stock are stored in an atomic block of their own, so a failing stock does not affect the other
+        stocks in the same batch of commit_size stocks.
+
+        :param store: Function that stores the prices of the stock, and raises the error of the download if any
+        """
 
-            yahoo.fetch_historical_stock_data(stock, start, end)
+        try:
+            stored = store()
+            if stored is not None:
+                result += stored
+        except Exception as e:
+            # Continue with the other stocks, all failures are reported at the end of the run
+            logger.exception(f'Failed to fetch historical data for stock {stock.symbol}')
+            failures[stock.symbol] = str(e)
+        self.batcher.done()
+
+    def _report(self, stocks: List[Stock], failures: Dict[str, str], result: UpsertResult):
+        nr_succeeded = len(stocks) - len(failures)
+        self.stdout.write(self.style.SUCCESS(f'Fetched historical data for {nr_succeeded} of {len(stocks)} stocks'))
+        self.stdout.write(f'Stock prices: {result}')
+        for symbol, error in sorted(failures.items()):
+            self.stderr.write(f'{symbol}: {error}')
+        if failures:
+            raise CommandError(f'Failed to fetch historical data for {len(failures)} stocks: '
+                               f'{", ".join(sorted(failures))}')
+
+    @staticmethod
+    def _get_stocks(symbols: List[str]) -> List[Stock]:
+        """
+        Return the stocks for the given symbols, annotated with the date of their latest known stock price
+
+        Provisional prices of intraday quotes are ignored, so the next download replaces them by the prices of the day.
+
+        :raise Stock.DoesNotExist: if any of the symbols does not exist
+        """
+
+        stocks_by_symbol = {}
+        # Provisional rows are the latest ones, so this only reads a few rows of each stock from the unique index
+        latest_dates = StockPrice.objects.filter(stock=OuterRef('pk'), provisional=False).order_by('-date')
+        for chunk in chunked(symbols, 500):
+            stocks = Stock.objects.filter(symbol__in=chunk).annotate(
+                latest_date=Subquery(latest_dates.values('date')[:1]))
+            stocks_by_symbol.update({stock.symbol: stock for stock in stocks})
+
+        for symbol in symbols:
+            if symbol not in stocks_by_symbol:
+                msg = f'No stock with symbol {symbol} exists'
+                raise Stock.DoesNotExist(msg)
+        return [stocks_by_symbol[symbol] for symbol in symbols]
 
     @staticmethod
     def _get_start_and_end(start_str: str, end_str: str, force_update: bool,
@@ -38,31 +223,22 @@ class Command(BaseCommand):
             start = None
 
         if end_str:
-            end = date_str_to_timestamp(end_str)
+            # The end of a download is exclusive, so the end date is included by ending at the start of the next day
+            end = date_to_timestamp(parse_date(end_str) + timedelta(days=1))
         else:
             end = None
 
-        if not start and not force_update:
-            last_known_date = Command._get_date_of_latest_stock_price(stock)
-            if last_known_date:
-                start_date = last_known_date + timedelta(days=1)
-                start = date_to_timestamp(start_date)
+        if not start and not force_update and stock.latest_date:
+            start_date = stock.latest_date + timedelta(days=1)
+            start = date_to_timestamp(start_date)
 
         return start, end
 
-    @staticmethod
-    def _get_date_of_latest_stock_price(stock: Stock) -> Optional[date]:
-        last_price = stock.prices.order_by('date').last()
-        if last_price:
-            return last_price.date
-        else:
-            return None
-
     def add_arguments(self, parser):
         help_symbols = 'Space separated list of symbols to fetch data for.'
         parser.add_argument('symbols', type=str, nargs='+', help=help_symbols)
 
-        help_force_update = 'Remove all existing stock prices before importing new ones.'
+        help_force_update = 'Fetch and update all stock prices, not only the ones since the last known stock price.'
         parser.add_argument('--force-update', dest='force_update', action='store_true',
                             default=False, help=help_force_update)
 
@@ -74,3 +250,34 @@ class Command(BaseCommand):
         help_end = 'End date in the format YYYY-MM-DD. Optional, if not given, all stock prices up to ' \
                    'today are fetched.'
         parser.add_argument('--end', type=str, default=None, help=help_end)
+
+        help_workers = 'Number of stocks to download in parallel. Optional, default = 1. Prices are always ' \
+                       'written to the database by a single writer.'
+        parser.add_argument('--workers', type=int, default=1, help=help_workers)
+
+        help_async = 'Download the stocks with asynchronous calls in a single thread instead of with workers.'
+        parser.add_argument('--async', dest='use_async', action='store_true', default=False, help=help_async)
+
+        help_concurrency = 'Number of stocks to download at the same time with --async. Optional, default = 100'
+        parser.add_argument('--concurrency', type=int, default=100, help=help_concurrency)
+
+        help_rate_limit = 'Maximum number of requests per second to Yahoo with --async. Optional, default = no limit'
+        parser.add_argument('--rate-limit', dest='rate_limit', type=float, default=None, help=help_rate_limit)
+
+        help_backfill = 'Fetch the full history between --start and --end in date chunks, recording the progress ' \
+                        'of every stock under this name. Running the command again with the same name resumes ' \
+                        'after the last stored chunk. Stocks that fail are skipped and reported at the end.'
+        parser.add_argument('--backfill', type=str, default=None, help=help_backfill)
+
+        help_chunk_days = 'Number of days of history to fetch per call in a backfill. Optional, default = 1826'
+        parser.add_argument('--chunk-days', dest='chunk_days', type=int, default=1826, help=help_chunk_days)
+
+        help_retry_failed = 'Retry the stocks that failed in an earlier run of the backfill.'
+        parser.add_argument('--retry-failed', dest='retry_failed', action='store_true', default=False,
+                            help=help_retry_failed)
+
+        help_commit_size = 'Number of stocks to write per database transaction. Optional, default = 1. Larger ' \
+                           'transactions make the import faster, but keep other writers waiting longer.'
+        parser.add_argument('--commit-size', dest='commit_size', type=int, default=1, help=help_commit_size)
+
+        add_metrics_arguments(parser)
@@ -0,0 +1,84 @@
+from typing import List
+
+from django.core.management import BaseCommand, CommandError
+
+from common.instrumentation import add_metrics_arguments, instrumentation, write_metrics
+from common.utils import chunked
+from currency.models import Currency
+from stock.models import Stock
+from yahoo.yahoo import YahooApi
+
+
+class Command(BaseCommand):
+    help = 'Fetch the latest prices of stocks and exchange rates of currencies from Yahoo Finance, many per call'
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('The batch size should be at least 1')
+        yahoo = YahooApi()
+        yahoo.quote_batch_size = batch_size
+
+        instrumentation.reset()
+        with instrumentation.count_queries():
+            stocks = self._get_stocks(options['stocks'])
+            if options['stocks'] and not options['currencies']:
+                currencies = []
+            else:
+                currencies = self._get_currencies(options['currencies'])
+            prices_result, rates_result = yahoo.fetch_latest_quotes(stocks, currencies)
+
+        write_metrics('fetch_latest_quotes', self.stdout, options)
+        self.stdout.write(f'Stock prices: {prices_result}')
+        self.stdout.write(f'Currency exchange rates: {rates_result}')
+
+    @staticmethod
+    def _get_stocks(symbols: List[str]) -> List[Stock]:
+        """
+        Return the stocks for the given symbols, or all stocks if no symbols are given
+
+        :raise Stock.DoesNotExist: if any of the symbols does not exist
+        """
+
+        if not symbols:
+            return list(Stock.objects.order_by('symbol'))
+        stocks = []
+        for chunk in chunked(symbols, 500):
+            stocks.extend(Stock.objects.filter(symbol__in=chunk))
+        missing = set(symbols) - {stock.symbol for stock in stocks}
+        if missing:
+            msg = f'No stock with symbol {", ".join(sorted(missing))} exists'
+            raise Stock.DoesNotExist(msg)
+        return stocks
+
+    @staticmethod
+    def _get_currencies(symbols: List[str]) -> List[Currency]:
+        """
+        Return the currencies for the given symbols, or all currencies but the euro if no symbols are given
+
+        :raise Currency.DoesNotExist: if any of the symbols does not exist
+        """
+
+        if not symbols:
+            return list(Currency.objects.exclude(symbol='EUR').order_by('symbol'))
+        currencies = list(Currency.objects.filter(symbol__in=symbols))
+        missing = set(symbols) - {currency.symbol for currency in currencies}
+        if missing:
+            msg = f'No currency with symbol {", ".join(sorted(missing))} exists'
+            raise Currency.DoesNotExist(msg)
+        return currencies
+
+    def add_arguments(self, parser):
+        help_stocks = 'Space separated list of symbols of stocks to fetch the latest price of. Optional, default = ' \
+                      'all stocks, and all currencies unless --currencies is given.'
+        parser.add_argument('stocks', type=str, nargs='*', help=help_stocks)
+
+        help_currencies = 'Space separated list of symbols of currencies to fetch the latest exchange rate of. ' \
+                          'Optional, default = all currencies if no stocks are given, otherwise none.'
+        parser.add_argument('--currencies', type=str, nargs='+', default=[], help=help_currencies)
+
+        help_batch_size = 'Number of symbols to fetch per call. Optional, default = 200'
+        parser.add_argument('--batch-size', dest='batch_size', type=int, default=YahooApi.quote_batch_size,
+                            help=help_batch_size)
+
+        add_metrics_arguments(parser)
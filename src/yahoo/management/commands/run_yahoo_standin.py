@@ -0,0 +1,34 @@
+from django.core.management import BaseCommand
+
+from yahoo.standin import YahooStandin
+
+
+class Command(BaseCommand):
+    help = 'Run a local stand-in for the Yahoo Finance API, see yahoo.standin'
+
+    def handle(self, *args, **options):
+        standin = YahooStandin(host=options['host'], port=options['port'], latency=options['latency'],
+                               error_rate=options['error_rate'], throttle_rate=options['throttle_rate'],
+                               history_days=options['history_days'], seed=options['seed'])
+        self.stdout.write(f'Serving Yahoo Finance stand-in at {standin.url}, '
+                          f'use it with: export YAHOO_BASE_URL={standin.url}')
+        try:
+            standin.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stdout.write(f'Responses by status code: {dict(standin.status_counts)}')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', type=str, default='localhost', help='Host to listen on, default = localhost')
+        parser.add_argument('--port', type=int, default=8765, help='Port to listen on, default = 8765')
+        parser.add_argument('--latency', type=float, default=0.0,
+                            help='Number of seconds to wait before every response, default = 0')
+        parser.add_argument('--error-rate', type=float, default=0.0,
+                            help='Fraction of requests that fail with 500 Internal Server Error, default = 0')
+        parser.add_argument('--throttle-rate', type=float, default=0.0,
+                            help='Fraction of requests that fail with 429 Too Many Requests, default = 0')
+        parser.add_argument('--history-days', type=int, default=3650,
+                            help='Number of days of generated price history, default = 3650')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Seed of the simulated errors and rate limiting, default = 0')
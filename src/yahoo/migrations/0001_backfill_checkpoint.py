@@ -0,0 +1,35 @@
+# Generated by Django 3.1.2 on 2026-10-18 17:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('stock', '0004_fixed_point_prices'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BackfillCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Name of the backfill, to resume it by', max_length=32)),
+                ('start', models.DateField()),
+                ('end', models.DateField()),
+                ('completed_until', models.DateField(blank=True, help_text='Last date of the history that is stored, empty if no chunk is stored yet', null=True)),
+                ('status', models.CharField(choices=[('in_progress', 'In progress'), ('completed', 'Completed'), ('failed', 'Failed')], default='in_progress', max_length=16)),
+                ('attempts', models.PositiveIntegerField(default=0, help_text='Number of runs in which fetching the history failed')),
+                ('error', models.TextField(blank=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('stock', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='backfill_checkpoints', to='stock.stock')),
+            ],
+            options={
+                'ordering': ('name', 'stock'),
+                'unique_together': {('name', 'stock')},
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+from datetime import date, timedelta
+from typing import Optional, Tuple
+
+from django.db import models
+
+from stock.models import Stock
+
+
+class BackfillCheckpoint(models.Model):
+    """
+    Progress of the backfill of the price history of a stock, such that an interrupted backfill resumes where it stopped
+
+    The history from start to end is fetched in consecutive date chunks. The checkpoint is updated in the same
+    transaction as the prices of a chunk, so a chunk is either stored and recorded, or fetched again when resuming.
+    """
+
+    IN_PROGRESS = 'in_progress'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (IN_PROGRESS, 'In progress'),
+        (COMPLETED, 'Completed'),
+        (FAILED, 'Failed'),
+    )
+
+    help_name = 'Name of the backfill, to resume it by'
+    help_completed_until = 'Last date of the history that is stored, empty if no chunk is stored yet'
+    help_attempts = 'Number of runs in which fetching the history failed'
+
+    name = models.CharField(max_length=32, help_text=help_name)
+    stock = models.ForeignKey(Stock, related_name='backfill_checkpoints', on_delete=models.CASCADE)
+    start = models.DateField()
+    end = models.DateField()
+    completed_until = models.DateField(blank=True, null=True, help_text=help_completed_until)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=IN_PROGRESS)
+    attempts = models.PositiveIntegerField(default=0, help_text=help_attempts)
+    error = models.TextField(blank=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ('name', 'stock')
+        unique_together = ('name', 'stock')
+
+    def __str__(self):
+        return f'{self.name}: {self.stock} ({self.get_status_display()})'
+
+    def next_chunk(self, chunk_days: int) -> Optional[Tuple[date, date]]:
+        """
+        Return the first and last date of the next chunk of the history to fetch, or None if all chunks are stored
+
+        :param chunk_days: Number of days per chunk
+        """
+
+        first = self.completed_until + timedelta(days=1) if self.completed_until else self.start
+        if first > self.end:
+            return None
+        return first, min(first + timedelta(days=chunk_days - 1), self.end)
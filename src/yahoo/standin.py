@@ -0,0 +1,242 @@
+import json
+import math
+import os
+import random
+import threading
+import time
+import zlib
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlparse
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+CSV_HEADER = 'Date,Open,High,Low,Close,Adj Close,Volume'
+
+
+class YahooStandin:
+    """
+    Local HTTP server that serves the CSV history download and the quote endpoint of the Yahoo Finance API, for
+    offline tests and benchmarks
+
+    Symbols with a CSV file in the fixtures directory get the contents of that file. All other symbols get a random
+    walk that only depends on the symbol, end date and history length, so repeated runs serve exactly the same data.
+    Latency, server errors and rate limiting can be simulated, with a seeded random generator to make them
+    reproducible.
+
+    Usage:
+        with YahooStandin(latency=0.05, throttle_rate=0.1) as standin:
+            # Point YahooApi at standin.url, e.g. with the YAHOO_BASE_URL setting
+    """
+
+    def __init__(self, host: str = 'localhost', port: int = 0, latency: float = 0.0, error_rate: float = 0.0,
+                 throttle_rate: float = 0.0, history_days: int = 3650, end_date: Optional[date] = None,
+                 fixtures_dir: Optional[str] = FIXTURES_DIR, seed: int = 0):
+        """
+        :param host: Host to listen on. Optional, default = localhost
+        :param port: Port to listen on. Optional, default = 0 (any free port, see url)
+        :param latency: Number of seconds to wait before every response. Optional, default = 0
+        :param error_rate: Fraction of requests to answer with 500 Internal Server Error. Optional, default = 0
+        :param throttle_rate: Fraction of requests to answer with 429 Too Many Requests. Optional, default = 0
+        :param history_days: Number of calendar days of generated history before the end date. Optional, default = 3650
+        :param end_date: Date of the last generated price. Optional, default = today
+        :param fixtures_dir: Directory with <symbol>.csv files to serve, None to only serve generated data.
+                             Optional, default = the fixtures of this app
+        :param seed: Seed of the simulated errors and rate limiting. Optional, default = 0
+        """
+
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.history_days = history_days
+        self.end_date = end_date or date.today()
+        self.fixtures_dir = fixtures_dir
+        self.status_counts: Counter = Counter()
+        self.bytes_sent = 0
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._histories: Dict[str, List[Tuple[date, str]]] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._server = ThreadingHTTPServer((host, port), StandinRequestHandler)
+        self._server.daemon_threads = True
+        self._server.standin = self
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'YahooStandin':
+        """
+        Serve requests in a background thread
+        """
+
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        if self._thread:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+    def __enter__(self) -> 'YahooStandin':
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def choose_status(self) -> int:
+        """
+        Return the status code of the next response, taking the simulated error and throttle rates into account
+        """
+
+        with self._lock:
+            value = self._random.random()
+        if value < self.error_rate:
+            return 500
+        if value < self.error_rate + self.throttle_rate:
+            return 429
+        return 200
+
+    def get_csv(self, symbol: str, start: int, end: int) -> str:
+        """
+        Return the CSV history of the symbol between the given Unix timestamps, like the Yahoo download endpoint
+
+        Like Yahoo, the end is exclusive: a day is only returned if it starts before the end.
+        """
+
+        rows = [
+            row for row_date, row in self._get_history(symbol)
+            if start <= _to_timestamp(row_date) < end
+        ]
+        return '\n'.join([CSV_HEADER] + rows)
+
+    def get_quote(self, symbol: str) -> Optional[Dict[str, Any]]:
+        """
+        Return the quote of the symbol like the Yahoo quote endpoint, based on the last row of its history
+
+        :return: Quote with the prices of the last day, or None if the symbol has no history
+        """
+
+        history = self._get_history(symbol)
+        if not history:
+            return None
+        row_date, row = history[-1]
+        _, open_, high, low, close, *_ = row.split(',')
+        # Exchanges close in the afternoon in the time zone of the exchange, which is UTC for the stand-in
+        timestamp = _to_timestamp(row_date) + 16 * 3600
+        return {
+            'symbol': symbol,
+            'regularMarketTime': timestamp,
+            'gmtOffSetMilliseconds': 0,
+            'regularMarketOpen': float(open_),
+            'regularMarketPrice': float(close),
+            'regularMarketDayHigh': float(high),
+            'regularMarketDayLow': float(low),
+        }
+
+    def _get_history(self, symbol: str) -> List[Tuple[date, str]]:
+        with self._lock:
+            if symbol not in self._histories:
+                self._histories[symbol] = self._read_fixture(symbol) or self._generate_history(symbol)
+            return self._histories[symbol]
+
+    def _read_fixture(self, symbol: str) -> Optional[List[Tuple[date, str]]]:
+        if not self.fixtures_dir:
+            return None
+        file_name = os.path.join(self.fixtures_dir, f'{symbol}.csv')
+        if not os.path.isfile(file_name):
+            return None
+        with open(file_name) as f:
+            lines = f.read().strip().splitlines()[1:]
+        return [(date.fromisoformat(line.split(',', 1)[0]), line) for line in lines]
+
+    def _generate_history(self, symbol: str) -> List[Tuple[date, str]]:
+        """
+        Generate a random walk of daily prices on weekdays, seeded by the symbol
+        """
+
+        generator = random.Random(zlib.crc32(symbol.encode()))
+        # Exchange rates (e.g. USDEUR=X) move around 1, stocks start somewhere between 1 and 500
+        price = 1.0 if symbol.endswith('=X') else math.exp(generator.uniform(0, math.log(500)))
+        history = []
+        for day in range(self.history_days, -1, -1):
+            row_date = self.end_date - timedelta(days=day)
+            change = generator.gauss(0, 0.02)
+            if row_date.weekday() >= 5:
+                continue
+            open_ = price
+            price *= math.exp(change)
+            high = max(open_, price) * (1 + abs(generator.gauss(0, 0.005)))
+            low = min(open_, price) * (1 - abs(generator.gauss(0, 0.005)))
+            volume = int(generator.uniform(1000, 1000000))
+            history.append((row_date, f'{row_date.isoformat()},{open_:.6f},{high:.6f},{low:.6f},{price:.6f},'
+                                      f'{price:.6f},{volume}'))
+        return history
+
+
+class StandinRequestHandler(BaseHTTPRequestHandler):
+    # Keep connections alive like Yahoo does, all responses have a Content-Length
+    protocol_version = 'HTTP/1.1'
+    download_path = '/v7/finance/download/'
+    quote_path = '/v7/finance/quote'
+
+    def do_GET(self):
+        standin: YahooStandin = self.server.standin
+        if standin.latency:
+            time.sleep(standin.latency)
+
+        url = urlparse(self.path)
+        if not url.path.startswith(self.download_path) and url.path != self.quote_path:
+            return self._respond(standin, 404, 'Not Found')
+        status = standin.choose_status()
+        if status == 500:
+            return self._respond(standin, status, 'Internal Server Error')
+        if status == 429:
+            return self._respond(standin, status, 'Too Many Requests')
+
+        params = parse_qs(url.query)
+        if url.path == self.quote_path:
+            return self._respond_quotes(standin, params)
+        try:
+            start = int(params.get('period1', ['0'])[0])
+            end = int(params.get('period2', [str(_to_timestamp(standin.end_date))])[0])
+        except ValueError:
+            return self._respond(standin, 400, 'Invalid period')
+        symbol = unquote(url.path[len(self.download_path):])
+        self._respond(standin, 200, standin.get_csv(symbol, start, end), content_type='text/csv')
+
+    def _respond_quotes(self, standin: YahooStandin, params: Dict[str, List[str]]):
+        symbols = [symbol for symbol in params.get('symbols', [''])[0].split(',') if symbol]
+        if not symbols:
+            return self._respond(standin, 400, 'Missing symbols')
+        # Like Yahoo, symbols without a quote are left out of the result
+        quotes = [quote for quote in map(standin.get_quote, symbols) if quote]
+        body = json.dumps({'quoteResponse': {'result': quotes, 'error': None}})
+        self._respond(standin, 200, body, content_type='application/json')
+
+    def _respond(self, standin: YahooStandin, status: int, text: str, content_type: str = 'text/plain'):
+        body = text.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', f'{content_type}; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with standin._lock:
+            standin.status_counts[status] += 1
+            standin.bytes_sent += len(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _to_timestamp(day: date) -> int:
+    return int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp())
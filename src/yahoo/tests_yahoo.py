@@ -1,7 +1,22 @@
-from django.test import TestCase
+import json
+import tempfile
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
 
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from requests import RequestException
+
+from common.db import UpsertResult
+from common.external_api import mock_get_call, mock_streaming_get_call
 from currency.models import Currency
-from stock.models import Stock
+from stock.models import Stock, StockPrice
+from stock.price_store import PriceStore
+from yahoo.models import BackfillCheckpoint
+from yahoo.standin import CSV_HEADER, YahooStandin
 from yahoo.yahoo import YahooApi
 
 
@@ -9,9 +24,18 @@ class YahooApiTestCase(TestCase):
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
+        cls.standin = YahooStandin().start()
+        cls.standin_settings = override_settings(YAHOO_BASE_URL=cls.standin.url)
+        cls.standin_settings.enable()
         cls.currency = Currency.objects.create(symbol='USD', name='US dollar')
         cls.stock = Stock.objects.create(symbol='MIK', name='The Michaels Company', currency=cls.currency)
 
+    @classmethod
+    def tearDownClass(cls):
+        cls.standin_settings.disable()
+        cls.standin.stop()
+        super().tearDownClass()
+
     def test_fetch_historical_currency_data(self):
         self.assertEqual(self.currency.rates.all().count(), 0)
 
@@ -20,7 +44,6 @@ class YahooApiTestCase(TestCase):
 
         self.assertGreaterEqual(self.currency.rates.all().count(), 1)
 
-
     def test_fetch_historical_stock_data(self):
         self.assertEqual(self.stock.prices.all().count(), 0)
 
@@ -28,3 +51,311 @@ class YahooApiTestCase(TestCase):
         yahoo.fetch_historical_stock_data(stock=self.stock, start=1571499338)
 
         self.assertGreaterEqual(self.stock.prices.all().count(), 1)
+
+    def test_fetch_command_writes_metrics(self):
+        with tempfile.NamedTemporaryFile('r', suffix='.jsonl') as metrics:
+            stdout = StringIO()
+            call_command('fetch_historical_stock_data', 'MIK', '--start', '2020-10-14', '--end', '2020-10-21',
+                         '--metrics', metrics.name, stdout=stdout)
+            records = [json.loads(line) for line in metrics]
+
+        self.assertIn('download', stdout.getvalue())
+        record, = [record for record in records if record['symbol'] == 'MIK']
+        self.assertEqual(record['counters']['rows_parsed'], 5)
+        self.assertEqual(record['counters']['rows_written'], 5)
+        self.assertEqual(record['counters']['requests'], 1)
+        self.assertGreater(record['counters']['bytes_downloaded'], 0)
+        self.assertGreater(record['phases']['write']['queries'], 0)
+        self.assertEqual(set(record['phases']), {'download', 'parse', 'write', 'refresh', 'store', 'commit'})
+
+    def test_fetch_command_with_async_downloads(self):
+        Currency.objects.create(symbol='GBX', name='GB penny')
+        call_command('fetch_historical_stock_data', 'MIK', '--start', '2020-10-14', '--end', '2020-10-21', '--async',
+                     '--concurrency', '2', '--rate-limit', '100', stdout=StringIO())
+        call_command('fetch_historical_currency_data', 'USD', 'GBX', '--start', '2020-10-14', '--end', '2020-10-21',
+                     '--async', stdout=StringIO())
+
+        self.assertEqual(self.stock.prices.get(date='2020-10-16').close, Decimal('12.0'))
+        self.assertEqual(self.stock.prices.count(), 5)
+        self.assertGreater(self.currency.rates.count(), 0)
+        self.assertGreater(Currency.objects.get(symbol='GBX').rates.count(), 0)
+
+    def test_fetch_latest_quotes(self):
+        other = Stock.objects.create(symbol='OTHER', name='Other', currency=self.currency)
+        requests_before = sum(self.standin.status_counts.values())
+
+        stdout = StringIO()
+        call_command('fetch_latest_quotes', '--batch-size', '2', stdout=stdout)
+
+        # MIK, OTHER and USDEUR=X in two calls
+        self.assertEqual(sum(self.standin.status_counts.values()) - requests_before, 2)
+        price = self.stock.prices.get()
+        self.assertEqual((price.date, price.open, price.close, price.high, price.low),
+                         (date(2020, 10, 23), Decimal('12.65'), Decimal('12.57'), Decimal('12.82'), Decimal('12.46')))
+        self.assertEqual(self.stock.latest_price.price, Decimal('12.57'))
+        self.assertEqual(other.prices.count(), 1)
+        self.assertEqual(self.currency.rates.get().date, date(2020, 10, 23))
+        self.assertIn('Stock prices: 2 inserted, 0 updated, 0 unchanged', stdout.getvalue())
+
+        with patch('yahoo.yahoo.update_indicators') as update:
+            call_command('fetch_latest_quotes', 'MIK', stdout=stdout)
+        self.assertIn('Stock prices: 0 inserted, 0 updated, 1 unchanged', stdout.getvalue())
+        update.assert_not_called()
+
+    def test_quotes_are_replaced_by_the_history(self):
+        call_command('fetch_latest_quotes', stdout=StringIO())
+        self.assertTrue(self.stock.prices.get(date='2020-10-23').provisional)
+        self.assertTrue(self.currency.rates.get(date='2020-10-23').provisional)
+
+        call_command('fetch_historical_stock_data', 'MIK', '--end', '2020-10-23', stdout=StringIO())
+        call_command('fetch_historical_currency_data', 'USD', '--end', '2020-10-23', stdout=StringIO())
+
+        # The whole history is downloaded, including the day of the quote
+        self.assertEqual(self.stock.prices.get(date='2020-10-16').close, Decimal('12.0'))
+        self.assertGreater(self.stock.prices.count(), 1)
+        self.assertFalse(self.stock.prices.filter(provisional=True).exists())
+        self.assertGreater(self.currency.rates.count(), 1)
+        self.assertFalse(self.currency.rates.filter(provisional=True).exists())
+
+    def test_fixture_is_served(self):
+        # 2020-10-14 up to and including 2020-10-21, of which 2020-10-19 has no prices
+        result = YahooApi().fetch_historical_stock_data(stock=self.stock, start=1602633600, end=1603324800)
+        self.assertEqual(result, UpsertResult(inserted=5))
+        self.assertEqual(self.stock.prices.get(date='2020-10-16').close, Decimal('12.0'))
+
+
+class YahooStandinTestCase(SimpleTestCase):
+    def test_generated_history_is_reproducible(self):
+        end = date(2020, 10, 23)
+        first = YahooStandin(history_days=30, end_date=end, fixtures_dir=None)
+        second = YahooStandin(history_days=30, end_date=end, fixtures_dir=None)
+        try:
+            csv = first.get_csv('ASML.AS', 0, 1603497600)
+            self.assertEqual(csv, second.get_csv('ASML.AS', 0, 1603497600))
+        finally:
+            first.stop()
+            second.stop()
+
+        lines = csv.splitlines()
+        self.assertEqual(lines[0], CSV_HEADER)
+        # Header and the 23 weekdays from 2020-09-23 up to and including 2020-10-23
+        self.assertEqual(len(lines), 24)
+        self.assertTrue(lines[-1].startswith('2020-10-23,'))
+
+    def test_throttled_requests_are_retried(self):
+        # With this seed the first request is throttled and the second one succeeds
+        with YahooStandin(throttle_rate=0.5, seed=1) as standin:
+            with override_settings(YAHOO_BASE_URL=standin.url):
+                text = YahooApi().download_historical_stock_data(Stock(symbol='MIK'), start=1603411200)
+        self.assertEqual(text.splitlines()[1:],
+                         ['2020-10-23,12.650000,12.820000,12.460000,12.570000,12.570000,1650200'])
+        self.assertEqual(standin.status_counts, {429: 1, 200: 1})
+
+
+class FetchHistoricalStockDataCommandTestCase(TestCase):
+    csv_response = 'Date,Open,High,Low,Close,Adj Close,Volume\n' \
+                   '2020-10-15,10.0,11.0,9.5,10.5,10.5,1000\n' \
+                   '2020-10-16,10.5,12.0,10.0,11.5,11.5,1200'
+
+    @classmethod
+    def setUpTestData(cls):
+        currency = Currency.objects.create(symbol='USD', name='US dollar')
+        cls.stocks = [
+            Stock.objects.create(symbol=f'STOCK{i}', name=f'Stock {i}', currency=currency)
+            for i in range(5)
+        ]
+
+    def test_fetch_with_workers(self):
+        symbols = [stock.symbol for stock in self.stocks]
+        with mock_streaming_get_call(return_value=self.csv_response.splitlines()):
+            call_command('fetch_historical_stock_data', *symbols, '--workers', '3', stdout=StringIO())
+
+        for stock in self.stocks:
+            self.assertEqual(stock.prices.count(), 2)
+
+    @patch.object(YahooApi, 'batch_size', 1)
+    def test_failures_are_reported_after_all_stocks(self):
+        def streaming_get_call(url, params):
+            lines = self.csv_response.splitlines()
+            yield from lines[:2]
+            # The first price is already written when the download fails
+            if url.endswith('STOCK2'):
+                raise RequestException('Error from Yahoo')
+            yield from lines[2:]
+
+        symbols = [stock.symbol for stock in self.stocks]
+        with mock_streaming_get_call(side_effect=streaming_get_call):
+            with self.assertRaisesMessage(CommandError, 'STOCK2'):
+                call_command('fetch_historical_stock_data', *symbols, '--workers', '2', '--commit-size', '3',
+                             stdout=StringIO(), stderr=StringIO())
+
+        self.assertEqual(self.stocks[2].prices.count(), 0)
+        for stock in self.stocks[:2] + self.stocks[3:]:
+            self.assertEqual(stock.prices.count(), 2)
+
+    def test_up_to_date_stocks_are_skipped(self):
+        today = timezone.now().date()
+        StockPrice.objects.bulk_create([
+            StockPrice(stock=stock, date=today, open=Decimal(1))
+            for stock in self.stocks
+        ])
+
+        symbols = [stock.symbol for stock in self.stocks]
+        with mock_streaming_get_call(return_value=self.csv_response.splitlines()) as get_call:
+            with self.assertNumQueries(1):
+                call_command('fetch_historical_stock_data', *symbols, stdout=StringIO())
+        get_call.assert_not_called()
+
+
+class BackfillTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        currency = Currency.objects.create(symbol='USD', name='US dollar')
+        cls.stocks = [
+            Stock.objects.create(symbol=f'STOCK{i}', name=f'Stock {i}', currency=currency)
+            for i in range(3)
+        ]
+        cls.symbols = [stock.symbol for stock in cls.stocks]
+
+    @staticmethod
+    def get_call(url, params):
+        # One row for the last day of every chunk, the end is exclusive
+        day = date.fromtimestamp(params['period2'] - 1)
+        return f'{CSV_HEADER}\n{day},10.0,11.0,9.5,10.5,10.5,1000'
+
+    def backfill(self, *args):
+        call_command('fetch_historical_stock_data', *self.symbols, '--backfill', 'test', '--start', '2020-01-01',
+                     '--end', '2020-01-10', '--chunk-days', '4', '--workers', '2', *args, stdout=StringIO(),
+                     stderr=StringIO())
+
+    def test_history_is_fetched_in_chunks(self):
+        with mock_get_call(side_effect=self.get_call) as get_call:
+            self.backfill()
+
+        self.assertEqual(get_call.call_count, 9)
+        for stock in self.stocks:
+            self.assertEqual([str(day) for day in stock.prices.order_by('date').values_list('date', flat=True)],
+                             ['2020-01-04', '2020-01-08', '2020-01-10'])
+        self.assertEqual(BackfillCheckpoint.objects.filter(status=BackfillCheckpoint.COMPLETED).count(), 3)
+
+    def test_days_at_chunk_boundaries_are_stored(self):
+        stock = Stock.objects.create(symbol='MIK', name='The Michaels Company', currency=self.stocks[0].currency)
+        with YahooStandin() as standin, override_settings(YAHOO_BASE_URL=standin.url):
+            call_command('fetch_historical_stock_data', 'MIK', '--backfill', 'test', '--start', '2020-10-12',
+                         '--end', '2020-10-23', '--chunk-days', '3', stdout=StringIO())
+
+        # Chunks end on 2020-10-14, 2020-10-17, 2020-10-20 and 2020-10-23, and 2020-10-19 has no prices
+        self.assertEqual([str(day) for day in stock.prices.order_by('date').values_list('date', flat=True)],
+                         ['2020-10-12', '2020-10-13', '2020-10-14', '2020-10-15', '2020-10-16', '2020-10-20',
+                          '2020-10-21', '2020-10-22', '2020-10-23'])
+
+    def test_backfill_resumes_after_the_last_stored_chunk(self):
+        BackfillCheckpoint.objects.create(name='test', stock=self.stocks[0], start=date(2020, 1, 1),
+                                          end=date(2020, 1, 10), completed_until=date(2020, 1, 8))
+        BackfillCheckpoint.objects.create(name='test', stock=self.stocks[1], start=date(2020, 1, 1),
+                                          end=date(2020, 1, 10), completed_until=date(2020, 1, 10),
+                                          status=BackfillCheckpoint.COMPLETED)
+
+        with mock_get_call(side_effect=self.get_call) as get_call:
+            self.backfill()
+
+        self.assertEqual(get_call.call_count, 4)
+        self.assertEqual(self.stocks[0].prices.count(), 1)
+        self.assertEqual(self.stocks[1].prices.count(), 0)
+        self.assertEqual(self.stocks[2].prices.count(), 3)
+
+    def test_failed_stocks_are_dead_lettered_until_retried(self):
+        def failing_get_call(url, params):
+            if url.endswith('STOCK1') and date.fromtimestamp(params['period1']) > date(2020, 1, 1):
+                raise RequestException('Error from Yahoo')
+            return self.get_call(url, params)
+
+        with mock_get_call(side_effect=failing_get_call):
+            with self.assertRaisesMessage(CommandError, 'STOCK1'):
+                self.backfill()
+        checkpoint = BackfillCheckpoint.objects.get(stock=self.stocks[1])
+        self.assertEqual((checkpoint.status, checkpoint.attempts, checkpoint.completed_until),
+                         (BackfillCheckpoint.FAILED, 1, date(2020, 1, 4)))
+        self.assertEqual(checkpoint.error, 'Error from Yahoo')
+        self.assertEqual(self.stocks[2].prices.count(), 3)
+
+        # Resuming without retrying keeps reporting the dead letter
+        with mock_get_call(side_effect=self.get_call) as get_call:
+            with self.assertRaisesMessage(CommandError, 'STOCK1'):
+                self.backfill()
+        self.assertEqual(get_call.call_count, 0)
+
+        with mock_get_call(side_effect=self.get_call) as get_call:
+            self.backfill('--retry-failed')
+        self.assertEqual(get_call.call_count, 2)
+        self.assertEqual(BackfillCheckpoint.objects.get(stock=self.stocks[1]).status, BackfillCheckpoint.COMPLETED)
+        self.assertEqual(self.stocks[1].prices.count(), 3)
+
+
+class UpsertHistoricalDataTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.currency = Currency.objects.create(symbol='GBX', name='GB penny')
+        cls.stock = Stock.objects.create(symbol='CARD.L', name='Card Factory', currency=cls.currency)
+
+    def test_stock_prices_are_upserted(self):
+        yahoo = YahooApi()
+        first = 'Date,Open,High,Low,Close,Adj Close,Volume\n' \
+                '2020-10-15,10.0,11.0,9.5,10.5,10.5,1000\n' \
+                '2020-10-16,10.5,12.0,10.0,11.5,11.5,1200'
+        result = yahoo.store_historical_stock_data(self.stock, first)
+        self.assertEqual(result, UpsertResult(inserted=2))
+
+        second = 'Date,Open,High,Low,Close,Adj Close,Volume\n' \
+                 '2020-10-15,10.0,11.0,9.5,10.5,10.5,1000\n' \
+                 '2020-10-16,10.5,12.0,10.0,11.25,11.25,1300\n' \
+                 '2020-10-19,null,null,null,null,null,null\n' \
+                 '2020-10-20,11.0,11.5,10.5,11.0,11.0,900'
+        with patch('yahoo.yahoo.update_indicators') as update:
+            result = yahoo.store_historical_stock_data(self.stock, second)
+        self.assertEqual(result, UpsertResult(inserted=1, updated=1, unchanged=1))
+        # From the oldest price that changed, not from the oldest one in the download
+        update.assert_called_once_with(self.stock, since=date(2020, 10, 16))
+        self.assertEqual(self.stock.prices.count(), 3)
+        self.assertEqual(self.stock.prices.get(date='2020-10-16').close, Decimal('11.25'))
+
+    def test_gbx_exchange_rates_are_upserted(self):
+        lines = ['Date,Open,High,Low,Close,Adj Close,Volume',
+                 '2020-10-15,1.1,1.1,1.1,1.1,1.1,0',
+                 '2020-10-16,1.2,1.2,1.2,1.2,1.2,0']
+        with mock_streaming_get_call(return_value=iter(lines)):
+            result = YahooApi().fetch_historical_currency_data(self.currency)
+        self.assertEqual(result, UpsertResult(inserted=2))
+
+        with mock_streaming_get_call(return_value=iter(lines)):
+            result = YahooApi().fetch_historical_currency_data(self.currency)
+        self.assertEqual(result, UpsertResult(unchanged=2))
+        self.assertEqual(self.currency.rate, Decimal('0.012'))
+
+
+class PriceStoreIngestionTestCase(TransactionTestCase):
+    def test_stock_prices_are_written_to_price_store(self):
+        currency = Currency.objects.create(symbol='GBX', name='GB penny')
+        stock = Stock.objects.create(symbol='CARD.L', name='Card Factory', currency=currency)
+        text = 'Date,Open,High,Low,Close,Adj Close,Volume\n' \
+               '2020-10-15,10.0,11.0,9.5,10.5,10.5,1000\n' \
+               '2020-10-16,10.5,12.0,10.0,11.5,11.5,1200'
+
+        with tempfile.TemporaryDirectory() as directory, self.settings(PRICE_STORE_DIR=directory):
+            YahooApi().store_historical_stock_data(stock, text)
+            stored = PriceStore(directory).read('CARD.L')
+            self.assertEqual(stored.current.tolist(), [10.5, 11.5])
+            self.assertEqual(stored.high.tolist(), [11.0, 12.0])
+
+    def test_failed_merge_does_not_fail_the_ingestion(self):
+        currency = Currency.objects.create(symbol='GBX', name='GB penny')
+        stock = Stock.objects.create(symbol='CARD.L', name='Card Factory', currency=currency)
+        text = 'Date,Open,High,Low,Close,Adj Close,Volume\n' \
+               '2020-10-16,10.5,12.0,10.0,11.5,11.5,1200'
+
+        with tempfile.TemporaryDirectory() as directory, self.settings(PRICE_STORE_DIR=directory), \
+                patch.object(PriceStore, 'merge', side_effect=OSError('Disk full')), \
+                self.assertLogs('stock.price_store'):
+            result = YahooApi().store_historical_stock_data(stock, text)
+            self.assertTrue(PriceStore(directory).is_stale(stock.pk))
+        self.assertEqual(result, UpsertResult(inserted=1))
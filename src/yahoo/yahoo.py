@@ -1,131 +1,530 @@
 import csv
+import json
 import logging
+import time
+from datetime import date, datetime, timedelta
 from decimal import Decimal
-from pprint import pprint
-from typing import Optional
+from io import StringIO
+from itertools import chain
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, TypeVar
 
+import numpy as np
+from django.conf import settings
 from django.db import transaction
 from django.utils import timezone
-from django.utils.dateparse import parse_date
 
-from common.external_api import BaseService
-from currency.models import Currency, CurrencyExchangeRate
-from stock.models import Stock, StockPrice
+from common.async_api import AsyncBaseService
+from common.db import UpsertResult, bulk_upsert
+from common.external_api import BaseService, Params
+from common.instrumentation import instrumentation
+from common.models import Ingestion
+from common.utils import chunked
+from currency.models import Currency, CurrencyExchangeRate, LatestExchangeRate
+from screener.indicators import update_indicators
+from stock.models import LatestStockPrice, Stock, StockPrice
+from stock.price_store import PriceStore, StoredPrices, to_stored_prices
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar('T')
+
 
 class YahooApi(BaseService):
     response_in_json = False
-    base_url = 'https://query1.finance.yahoo.com'
+
+    # Number of parsed rows that are written to the database at once
+    batch_size = 1000
+
+    # Number of symbols per call to the quote endpoint, which Yahoo limits by the length of the URL
+    quote_batch_size = 200
+
+    # Quotes change during trading hours, histories up to today at most once a day after the close
+    cache_max_age = (
+        (r'/v7/finance/quote', 60),
+        (r'/v7/finance/download/', 15 * 60),
+    )
+    # Histories that ended this many seconds ago do not change anymore, and stay fresh in the cache much longer
+    settled_history_age = 7 * 24 * 3600
+    settled_history_max_age = 365 * 24 * 3600
+
+    @property
+    def base_url(self) -> str:
+        """
+        URL of the Yahoo Finance API, or of a stand-in server (see yahoo.standin) if so configured in the settings
+        """
+
+        return settings.YAHOO_BASE_URL
 
     def fetch_historical_currency_data(self, currency: Currency,
-                                       start: Optional[int] = None, end: Optional[int] = None):
+                                       start: Optional[int] = None,
+                                       end: Optional[int] = None) -> Optional[UpsertResult]:
         """
         Fetch and store the historical price data for the given currency
 
+        The response is parsed while it is being downloaded, so memory usage does not depend on the length of the
+        history.
+
         :param currency: Currency to fetch data for on Yahoo
         :param start: Unix timestamp of first data point. Optional, default = 0 (fetch all data)
         :param end: Unix timestamp of last data point. Optional, default = today
+        :return: Number of inserted, updated and unchanged exchange rates, or None if there was nothing to fetch
         """
 
-        if not start:
-            start = 0
-        if not end:
-            end = int(timezone.now().timestamp())
-        if start > end:
-            logger.debug(f'No currency prices to fetch for {currency.symbol}: '
-                         f'start timestamp {start} is after end timestamp {end}')
-            return
+        with instrumentation.symbol(currency.symbol):
+            request = self._get_history_request(self._get_currency_symbol(currency), start, end)
+            if request is None:
+                return None
+            lines = self._make_streaming_get_call(*request)
+            return self._store_currency_exchange_rates(currency, self._iter_currency_exchange_rates(currency, lines))
+
+    def fetch_historical_stock_data(self, stock: Stock,
+                                    start: Optional[int] = None, end: Optional[int] = None) -> Optional[UpsertResult]:
+        """
+        Fetch and store the historical price data for the given stock
+
+        The response is parsed while it is being downloaded, so memory usage does not depend on the length of the
+        history.
+
+        :param stock: Stock to fetch data for on Yahoo
+        :param start: Unix timestamp of first data point. Optional, default = 0 (fetch all data)
+        :param end: Unix timestamp of last data point. Optional, default = today
+        :return: Number of inserted, updated and unchanged stock prices, or None if there was nothing to fetch
+        """
+
+        with instrumentation.symbol(stock.symbol):
+            if self._get_history_request(stock.symbol, start, end) is None:
+                return None
+            return self.store_stock_prices(stock, self.iter_historical_stock_data(stock, start, end))
+
+    def iter_historical_stock_data(self, stock: Stock, start: Optional[int] = None,
+                                   end: Optional[int] = None) -> Iterator[StockPrice]:
+        """
+        Download the historical price data for the given stock, and parse it into unsaved StockPrices while it is
+        being downloaded
+
+        This method does not touch the database, so it can safely be called from multiple threads. Store the prices
+        with store_stock_prices.
+
+        :param stock: Stock to fetch data for on Yahoo
+        :param start: Unix timestamp of first data point. Optional, default = 0 (fetch all data)
+        :param end: Unix timestamp of last data point. Optional, default = today
+        :return: Iterator over the prices, which is empty if there is nothing to fetch
+        """
+
+        with instrumentation.symbol(stock.symbol):
+            request = self._get_history_request(stock.symbol, start, end)
+            if request is None:
+                return
+            yield from self._iter_stock_prices(stock, self._make_streaming_get_call(*request))
+
+    def store_stock_prices(self, stock: Stock, prices: Iterable[StockPrice]) -> UpsertResult:
+        """
+        Store the prices of the given stock as parsed by iter_historical_stock_data, in a single transaction
+
+        :param stock: Stock to store the prices for
+        :param prices: Unsaved prices of the stock, which may still be downloading
+        :return: Number of inserted, updated and unchanged stock prices
+        """
+
+        return self._store_stock_prices(stock, prices)
+
+    def download_historical_stock_data(self, stock: Stock,
+                                       start: Optional[int] = None, end: Optional[int] = None) -> Optional[str]:
+        """
+        Download the historical price data for the given stock without storing it
+
+        This method does not touch the database, so it can safely be called from multiple threads.
+
+        :param stock: Stock to fetch data for on Yahoo
+        :param start: Unix timestamp of first data point. Optional, default = 0 (fetch all data)
+        :param end: Unix timestamp of last data point. Optional, default = today
+        :return: CSV response from Yahoo, or None if there is nothing to fetch
+        """
+
+        with instrumentation.symbol(stock.symbol):
+            request = self._get_history_request(stock.symbol, start, end)
+            if request is None:
+                return None
+            return self._make_get_call(*request)
+
+    def store_historical_stock_data(self, stock: Stock, text: str) -> UpsertResult:
+        """
+        Store the historical price data for the given stock as downloaded by download_historical_stock_data
+
+        :param stock: Stock to store the prices for
+        :param text: Response from the Yahoo API to fetch historical data
+        :return: Number of inserted, updated and unchanged stock prices
+        """
+
+        return self._parse_historical_stock_data_response(stock, text)
+
+    def store_historical_currency_data(self, currency: Currency, text: str) -> UpsertResult:
+        """
+        Store the historical exchange rates for the given currency as downloaded by an AsyncYahooApi
+
+        :param currency: Currency to store the exchange rates for
+        :param text: Response from the Yahoo API to fetch historical data
+        :return: Number of inserted, updated and unchanged exchange rates
+        """
+
+        return self._parse_historical_currency_data_response(currency, text)
+
+    @staticmethod
+    def _get_currency_symbol(currency: Currency) -> str:
+        """
+        Return the Yahoo symbol of the exchange rate of the currency to EUR, pence are fetched as pounds
+        """
 
         if currency.symbol == 'GBX':
             symbol = 'GBP'
         else:
             symbol = currency.symbol
+        return f'{symbol}EUR=X'
 
-        url = f'{self.base_url}/v7/finance/download/{symbol}EUR=X'
-        params = {
-            'period1': start,
-            'period2': end,
-            'interval': '1d',
-            'events': 'history'
-        }
-        response = self._make_get_call(url, params)
-        self._parse_historical_currency_data_response(currency, response)
+    def fetch_latest_quotes(self, stocks: Sequence[Stock],
+                            currencies: Sequence[Currency] = ()) -> Tuple[UpsertResult, UpsertResult]:
+        """
+        Fetch the latest quotes of the given stocks and currencies, and store them in a single transaction
 
-    def fetch_historical_stock_data(self, stock: Stock,
-                                    start: Optional[int] = None, end: Optional[int] = None):
+        Quotes are fetched for many symbols per call, so refreshing today's prices of all stocks takes a call per
+        quote_batch_size symbols instead of a call per symbol. Symbols without a quote are skipped.
+
+        :param stocks: Stocks to fetch the latest price of
+        :param currencies: Currencies to fetch the latest exchange rate to EUR of. Optional, default = none
+        :return: Number of inserted, updated and unchanged stock prices and exchange rates
         """
-        Fetch and store the historical price data for the given stock
 
-        :param stock: Stock to fetch data for on Yahoo
-        :param start: Unix timestamp of first data point. Optional, default = 0 (fetch all data)
-        :param end: Unix timestamp of last data point. Optional, default = today
+        symbols = sorted({stock.symbol for stock in stocks} |
+                         {self._get_currency_symbol(currency) for currency in currencies})
+        quotes = {}
+        for batch in chunked(symbols, self.quote_batch_size):
+            quotes.update(self.download_latest_quotes(batch))
+        return self.store_latest_quotes(stocks, currencies, quotes)
+
+    def download_latest_quotes(self, symbols: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Download the latest quotes of the given Yahoo symbols in a single call, without storing them
+
+        :param symbols: Yahoo symbols of stocks, or of exchange rates like USDEUR=X
+        :return: Quote by symbol, as returned by Yahoo
+        """
+
+        url = f'{self.base_url}/v7/finance/quote'
+        text = self._make_get_call(url, params={'symbols': ','.join(symbols)},
+                                   error_msg=f'Failed to fetch the quotes of {len(symbols)} symbols')
+        instrumentation.count('quotes_downloaded', len(symbols))
+        response = json.loads(text)['quoteResponse']
+        if response.get('error'):
+            msg = f'Failed to fetch the quotes of {len(symbols)} symbols: {response["error"]}'
+            raise ValueError(msg)
+        return {quote['symbol']: quote for quote in response['result']}
+
+    @classmethod
+    def store_latest_quotes(cls, stocks: Sequence[Stock], currencies: Sequence[Currency],
+                            quotes: Dict[str, Dict[str, Any]]) -> Tuple[UpsertResult, UpsertResult]:
+        """
+        Store the quotes downloaded by download_latest_quotes as prices of the stocks and rates of the currencies
+
+        The prices and rates are provisional, the next download of the history replaces them by those of the day.
+
+        :return: Number of inserted, updated and unchanged stock prices and exchange rates
+        """
+
+        price_store = PriceStore.from_settings()
+        prices_result, rates_result = UpsertResult(), UpsertResult()
+        with instrumentation.phase('commit'), transaction.atomic(), instrumentation.phase('store'):
+            rates = []
+            for currency in currencies:
+                quote = cls._parse_quote(quotes.get(cls._get_currency_symbol(currency)))
+                if quote:
+                    rate = quote[2] / 100 if currency.symbol == 'GBX' else quote[2]
+                    rates.append(CurrencyExchangeRate(currency=currency, date=quote[0], rate=rate, provisional=True))
+            with instrumentation.phase('write'):
+                rates_result += bulk_upsert(CurrencyExchangeRate, rates, unique_fields=('currency', 'date'),
+                                            update_fields=('rate', 'provisional'))
+
+            prices = []
+            for stock in stocks:
+                quote = cls._parse_quote(quotes.get(stock.symbol))
+                if quote:
+                    prices.append(StockPrice(stock=stock, date=quote[0], open=quote[1], close=quote[2],
+                                             high=quote[3], low=quote[4], provisional=True))
+            written_prices = []
+            with instrumentation.phase('write'):
+                prices_result += bulk_upsert(StockPrice, prices, unique_fields=('stock', 'date'),
+                                             update_fields=('open', 'close', 'high', 'low', 'provisional'),
+                                             written=written_prices)
+
+            with instrumentation.phase('refresh'):
+                currency_ids = [rate.currency_id for rate in rates]
+                if rates_result.written:
+                    LatestExchangeRate.refresh(Currency.objects.filter(pk__in=currency_ids))
+                    for chunk in chunked(currency_ids, 500):
+                        LatestStockPrice.refresh(Stock.objects.filter(currency__in=chunk))
+                for chunk in chunked(written_prices, 500):
+                    LatestStockPrice.refresh(Stock.objects.filter(pk__in=[price.stock_id for price in chunk]))
+                # Once per stock, from the oldest written price of the stock, and not at all for unchanged stocks
+                first_dates: Dict[int, Tuple[Stock, date]] = {}
+                for price in written_prices:
+                    if price.stock_id not in first_dates or price.date < first_dates[price.stock_id][1]:
+                        first_dates[price.stock_id] = (price.stock, price.date)
+                for stock, first_date in first_dates.values():
+                    update_indicators(stock, since=first_date)
+                if rates_result.written or prices_result.written:
+                    Ingestion.record()
+            if price_store and written_prices:
+                new = [(price.stock, to_stored_prices([(price.date, price.open, price.close, price.high, price.low)]))
+                       for price in written_prices]
+
+                def merge():
+                    for stock, stored_prices in new:
+                        price_store.merge_or_mark_stale(stock, stored_prices)
+
+                # Only update the price store once the prices are actually in the database
+                transaction.on_commit(merge)
+        instrumentation.count('rows_written', prices_result.written + rates_result.written)
+        instrumentation.count('rows_unchanged', prices_result.unchanged + rates_result.unchanged)
+        logger.debug(f'Stored latest quotes: stock prices {prices_result}, exchange rates {rates_result}')
+        return prices_result, rates_result
+
+    @staticmethod
+    def _parse_quote(quote: Optional[Dict[str, Any]]) -> Optional[Tuple[date, Decimal, Decimal, Decimal, Decimal]]:
+        """
+        Return the date in the time zone of the exchange and the open, close, high and low price of a quote
+
+        The close is the latest price, which is the close of the day once the exchange has closed.
+
+        :return: Tuple of date, open, close, high and low, or None if there is no quote or it has no price
+        """
+
+        if not quote or quote.get('regularMarketPrice') is None or not quote.get('regularMarketTime'):
+            return None
+        offset = timedelta(milliseconds=quote.get('gmtOffSetMilliseconds', 0))
+        quote_date = (datetime.fromtimestamp(quote['regularMarketTime'], timezone.utc) + offset).date()
+        close = Decimal(str(quote['regularMarketPrice']))
+        prices = [quote.get(name) for name in ('regularMarketOpen', 'regularMarketDayHigh', 'regularMarketDayLow')]
+        open_, high, low = (Decimal(str(price)) if price is not None else None for price in prices)
+        return quote_date, open_ if open_ is not None else close, close, high, low
+
+    @classmethod
+    def _get_cache_max_age(cls, url: str, params: Params = None) -> Optional[float]:
+        max_age = super()._get_cache_max_age(url, params)
+        if max_age is not None and params and 'period2' in params:
+            if time.time() - int(params['period2']) > cls.settled_history_age:
+                return cls.settled_history_max_age
+        return max_age
+
+    def _get_history_request(self, symbol: str, start: Optional[int],
+                             end: Optional[int]) -> Optional[Tuple[str, Params]]:
+        """
+        Return the URL and query parameters to download the history of the given Yahoo symbol
+
+        :return: Tuple of URL and query parameters, or None if there is nothing to fetch
         """
 
         if not start:
             start = 0
         if not end:
-            end = int(timezone.now().timestamp())
+            # The end of today instead of the current time, such that the URL and its cached response do not change
+            # during the day. Yahoo returns the prices up to now in both cases.
+            today = timezone.now().date()
+            end = int(datetime(today.year, today.month, today.day, tzinfo=timezone.utc).timestamp()) + 24 * 3600 - 1
         if start > end:
-            logger.debug(f'No stock prices to fetch for {stock.symbol}: '
+            logger.debug(f'No prices to fetch for {symbol}: '
                          f'start timestamp {start} is after end timestamp {end}')
-            return
+            return None
 
-        url = f'{self.base_url}/v7/finance/download/{stock.symbol}'
+        url = f'{self.base_url}/v7/finance/download/{symbol}'
         params = {
             'period1': start,
             'period2': end,
             'interval': '1d',
             'events': 'history'
         }
-        response = self._make_get_call(url, params)
-        self._parse_historical_stock_data_response(stock, response)
+        return url, params
 
-    @staticmethod
-    def _parse_historical_currency_data_response(currency: Currency, text: str):
+    @classmethod
+    def _parse_historical_currency_data_response(cls, currency: Currency, text: str) -> UpsertResult:
         """
-        Create or update Currency for the given symbol from the input data
+        Create or update CurrencyExchangeRates for the given currency from the input data
 
         :param currency: Currency to update the prices for
         :param text: Response from the Yahoo API to fetch historical data
+        :return: Number of inserted, updated and unchanged exchange rates
         """
 
-        text = text.strip()
-        reader = csv.DictReader(text.split('\n'), delimiter=',')
-        rows = [row for row in reader]
-        logger.debug(f'Updating {len(rows)} for currency {currency}')
-        with transaction.atomic():
-            dates = {parse_date(row['Date']) for row in rows}
-            CurrencyExchangeRate.objects.filter(currency=currency, date__in=dates).delete()
-            currency_exchange_rates = [
-                CurrencyExchangeRate(currency=currency, date=parse_date(row['Date']),
-                                     rate=Decimal(row['Close']) / 100 if currency.symbol == 'GBX' else row['Close'])
-                for row in rows
-                if 'null' not in row.values()
-            ]
-            CurrencyExchangeRate.objects.bulk_create(currency_exchange_rates)
+        lines = StringIO(text.strip())
+        return cls._store_currency_exchange_rates(currency, cls._iter_currency_exchange_rates(currency, lines))
 
-    @staticmethod
-    def _parse_historical_stock_data_response(stock: Stock, text: str):
+    @classmethod
+    def _parse_historical_stock_data_response(cls, stock: Stock, text: str) -> UpsertResult:
         """
-        Create or update StockPrices for the given symbol from the input data
+        Create or update StockPrices for the given stock from the input data
 
         :param stock: Stock to update the prices for
         :param text: Response from the Yahoo API to fetch historical data
+        :return: Number of inserted, updated and unchanged stock prices
+        """
+
+        lines = StringIO(text.strip())
+        return cls._store_stock_prices(stock, cls._iter_stock_prices(stock, lines))
+
+    @staticmethod
+    def _iter_currency_exchange_rates(currency: Currency, lines: Iterable[str]) -> Iterator[CurrencyExchangeRate]:
+        """
+        Parse the lines of a CSV response from the Yahoo API into unsaved CurrencyExchangeRates, one at a time
+        """
+
+        for row in csv.DictReader(lines, delimiter=','):
+            if 'null' in row.values():
+                continue
+            rate = Decimal(row['Close'])
+            if currency.symbol == 'GBX':
+                rate /= 100
+            yield CurrencyExchangeRate(currency=currency, date=date.fromisoformat(row['Date']), rate=rate)
+
+    @staticmethod
+    def _iter_stock_prices(stock: Stock, lines: Iterable[str]) -> Iterator[StockPrice]:
+        """
+        Parse the lines of a CSV response from the Yahoo API into unsaved StockPrices, one at a time
+        """
+
+        for row in csv.DictReader(lines, delimiter=','):
+            if 'null' in row.values():
+                continue
+            yield StockPrice(stock=stock, date=date.fromisoformat(row['Date']),
+                             open=Decimal(row['Open']), close=Decimal(row['Close']),
+                             high=Decimal(row['High']), low=Decimal(row['Low']))
+
+    @classmethod
+    def _store_currency_exchange_rates(cls, currency: Currency,
+                                       rates: Iterable[CurrencyExchangeRate]) -> UpsertResult:
+        result = UpsertResult()
+        with instrumentation.symbol(currency.symbol):
+            batches = cls._prefetch_batch(chunked(instrumentation.timed_iter('parse', rates, counter='rows_parsed'),
+                                                  cls.batch_size))
+        with instrumentation.symbol(currency.symbol), instrumentation.phase('commit'), transaction.atomic(), \
+                instrumentation.phase('store'):
+            for batch in batches:
+                with instrumentation.phase('write'):
+                    result += bulk_upsert(CurrencyExchangeRate, batch, unique_fields=('currency', 'date'),
+                                          update_fields=('rate', 'provisional'))
+            if result.written:
+                with instrumentation.phase('refresh'):
+                    LatestExchangeRate.refresh(Currency.objects.filter(pk=currency.pk))
+                    LatestStockPrice.refresh(Stock.objects.filter(currency=currency))
+                    Ingestion.record()
+        cls._count_rows(currency.symbol, result)
+        logger.debug(f'Updated exchange rates for currency {currency}: {result}')
+        return result
+
+    @classmethod
+    def _store_stock_prices(cls, stock: Stock, prices: Iterable[StockPrice]) -> UpsertResult:
+        result = UpsertResult()
+        price_store = PriceStore.from_settings()
+        columns = []
+        first_date = None
+        with instrumentation.symbol(stock.symbol):
+            batches = cls._prefetch_batch(chunked(instrumentation.timed_iter('parse', prices, counter='rows_parsed'),
+                                                  cls.batch_size))
+        # The time of the commit itself is what remains of the commit phase after the nested phases
+        with instrumentation.symbol(stock.symbol), instrumentation.phase('commit'), transaction.atomic(), \
+                instrumentation.phase('store'):
+            for batch in batches:
+                written = []
+                with instrumentation.phase('write'):
+                    result += bulk_upsert(StockPrice, batch, unique_fields=('stock', 'date'),
+                                          update_fields=('open', 'close', 'high', 'low', 'provisional'),
+                                          written=written)
+                # Only the prices that changed need new indicators, e.g. not the full history with force_update
+                first_date = min([price.date for price in written] + ([first_date] if first_date else []),
+                                 default=None)
+                if price_store:
+                    columns.append(to_stored_prices((price.date, price.open, price.close, price.high, price.low)
+                                                    for price in batch))
+            if result.written:
+                with instrumentation.phase('refresh'):
+                    LatestStockPrice.refresh(Stock.objects.filter(pk=stock.pk))
+                    update_indicators(stock, since=first_date)
+                    Ingestion.record()
+                if price_store:
+                    # Only update the price store once the prices are actually in the database
+                    new = StoredPrices(np.concatenate([column.days for column in columns]),
+                                       np.concatenate([column.prices for column in columns], axis=1))
+                    transaction.on_commit(lambda: price_store.merge_or_mark_stale(stock, new))
+        cls._count_rows(stock.symbol, result)
+        logger.debug(f'Updated prices for stock {stock}: {result}')
+        return result
+
+    @staticmethod
+    def _prefetch_batch(batches: Iterator[List[T]]) -> Iterator[List[T]]:
+        """
+        Return the batches, after waiting for the first one
+
+        The write lock of the database is taken by the first write of a transaction, and held until the commit. By
+        waiting for the first batch before the transaction starts, a history that fits in a batch is downloaded
+        without holding the lock, and a longer one at least does not hold the lock while the download starts.
+        """
+
+        first = next(batches, None)
+        return chain([first], batches) if first is not None else iter(())
+
+    @staticmethod
+    def _count_rows(symbol: str, result: UpsertResult):
+        with instrumentation.symbol(symbol):
+            instrumentation.count('rows_written', result.written)
+            instrumentation.count('rows_unchanged', result.unchanged)
+
+
+class AsyncYahooApi(AsyncBaseService):
+    """
+    Asynchronous downloads of the Yahoo Finance API, for fetching the history of many symbols at once
+
+    Only the downloads are asynchronous, the responses are stored by the store methods of YahooApi, such that all
+    database writes are done from a single thread.
+
+    Usage:
+        api = AsyncYahooApi(max_concurrency=100)
+        for stock, text, error in api.run_in_background(api.download_historical_stock_data, stocks):
+            YahooApi().store_historical_stock_data(stock, text)
+    """
+
+    service = YahooApi
+
+    def __init__(self, max_concurrency: int = 100, requests_per_second: Optional[float] = None):
+        super().__init__(max_concurrency=max_concurrency, requests_per_second=requests_per_second)
+        self.api = YahooApi()
+
+    async def download_historical_stock_data(self, stock: Stock, start: Optional[int] = None,
+                                             end: Optional[int] = None) -> Optional[str]:
+        """
+        Download the historical price data for the given stock without storing it
+
+        :param stock: Stock to fetch data for on Yahoo
+        :param start: Unix timestamp of first data point. Optional, default = 0 (fetch all data)
+        :param end: Unix timestamp of last data point. Optional, default = today
+        :return: CSV response from Yahoo, or None if there is nothing to fetch
+        """
+
+        with instrumentation.symbol(stock.symbol):
+            request = self.api._get_history_request(stock.symbol, start, end)
+            if request is None:
+                return None
+            return await self._make_get_call(*request)
+
+    async def download_historical_currency_data(self, currency: Currency, start: Optional[int] = None,
+                                                end: Optional[int] = None) -> Optional[str]:
+        """
+        Download the historical exchange rates for the given currency without storing them
+
+        :param currency: Currency to fetch data for on Yahoo
+        :param start: Unix timestamp of first data point. Optional, default = 0 (fetch all data)
+        :param end: Unix timestamp of last data point. Optional, default = today
+        :return: CSV response from Yahoo, or None if there is nothing to fetch
         """
 
-        text = text.strip()
-        reader = csv.DictReader(text.split('\n'), delimiter=',')
-        rows = [row for row in reader]
-        logger.debug(f'Updating {len(rows)} for stock {stock}')
-        with transaction.atomic():
-            dates = {parse_date(row['Date']) for row in rows}
-            StockPrice.objects.filter(stock=stock, date__in=dates).delete()
-            stock_prices = [
-                StockPrice(stock=stock, date=parse_date(row['Date']),
-                           open=row['Open'], close=row['Close'], high=row['High'], low=row['Low'])
-                for row in rows
-                if 'null' not in row.values()
-            ]
-            StockPrice.objects.bulk_create(stock_prices)
+        with instrumentation.symbol(currency.symbol):
+            request = self.api._get_history_request(self.api._get_currency_symbol(currency), start, end)
+            if request is None:
+                return None
+            return await self._make_get_call(*request)